@@ -1,5 +1,7 @@
 import os
-from quart import Quart, render_template
+import time
+import asyncio
+from quart import Quart, g, request, render_template
 from .config import Config
 
 class ForceHttpsMiddleware:
@@ -52,6 +54,59 @@ def create_app(config_class=Config):
     app.register_blueprint(auth_bp)
     app.register_blueprint(chat_bp)
 
+    # Clientes de larga vida (se crean una vez por proceso)
+    from backend.chat.moderation import init_safety_client, close_safety_client
+    from backend.chat.speech import speech_tokens
+    from backend.chat.office_agent import office_agent
+    from backend.chat.context import summary_refresher, preload_tokenizer
+    from backend.database.write_behind import write_behind
+    from backend.database.bulk_delete import delete_jobs
+
+    @app.before_serving
+    async def startup():
+        await init_safety_client()
+        speech_tokens.start()
+        await asyncio.to_thread(preload_tokenizer, os.getenv("AZURE_DEPLOYMENT_NAME") or "gpt-4o")
+        if app.config.get("OFFICE_AGENT_ENABLED"):
+            try:
+                await office_agent.initialize()
+            except Exception as e:
+                # Sin Postgres el chat sigue funcionando, solo sin documentos
+                print(f"❌ [Office Agent] No se pudo iniciar: {e}")
+        if app.config.get("WRITE_BEHIND_ENABLED"):
+            write_behind.start()
+
+    @app.after_serving
+    async def shutdown():
+        # Primero vaciamos la cola de escrituras pendientes
+        await write_behind.stop()
+        await delete_jobs.wait()
+        await summary_refresher.wait()
+        await close_safety_client()
+        await speech_tokens.close()
+        await office_agent.close()
+
+    # Latencia por ruta y header Server-Timing con las etapas del request
+    from backend.telemetry import METRICS_ENABLED, start_request, server_timing_header, http_request_seconds
+
+    if METRICS_ENABLED:
+        @app.before_request
+        async def iniciar_medicion():
+            g.inicio_request = time.perf_counter()
+            start_request()
+
+        @app.after_request
+        async def registrar_medicion(response):
+            inicio = getattr(g, "inicio_request", None)
+            if inicio is None:
+                return response
+            total = time.perf_counter() - inicio
+            route = request.url_rule.rule if request.url_rule else "other"
+            http_request_seconds.observe(total, route=route, method=request.method, status=str(response.status_code))
+            etapas = server_timing_header()
+            response.headers["Server-Timing"] = f"{etapas}, total;dur={total * 1000:.1f}" if etapas else f"total;dur={total * 1000:.1f}"
+            return response
+
     @app.errorhandler(404)
     async def page_not_found(e):
         return await render_template('/components/errors/404.html', user=None), 404
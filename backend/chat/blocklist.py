@@ -0,0 +1,140 @@
+import os
+import re
+import glob
+import time
+import threading
+from typing import Optional
+from .verdict_cache import normalize_text
+
+BLOCKLIST_DIR = os.getenv(
+    "BLOCKLIST_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "blocklists")
+)
+
+# Sustituciones de leetspeak más comunes (se aplican después de normalizar)
+LEET_TABLE = str.maketrans({
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s", "!": "i"
+})
+
+
+def normalize_for_blocklist(text: str) -> str:
+    """ Normalización única del texto de entrada: sin acentos, minúsculas y leetspeak resuelto. """
+    return normalize_text(text).translate(LEET_TABLE)
+
+
+def _trie_regex(terms) -> str:
+    """
+    Construye una alternancia en forma de trie (prefijos compartidos), así el
+    motor de regex no prueba cada término por separado en cada posición.
+    """
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        final = "" in node
+        ramas = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not ramas:
+            return ""
+        patron = ramas[0] if len(ramas) == 1 else "(?:" + "|".join(ramas) + ")"
+        return f"(?:{patron})?" if final else patron
+
+    return build(trie)
+
+
+class BlocklistEngine:
+    """
+    Motor de términos bloqueados: carga un archivo versionado por idioma,
+    compila todos los términos en una sola regex y recarga si cambian los archivos.
+    """
+
+    def __init__(self, directory: str = BLOCKLIST_DIR, reload_interval: float = 5.0):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.versions = {}
+        self.term_count = 0
+        self._pattern = None
+        self._mtimes = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def _files(self):
+        return sorted(glob.glob(os.path.join(self.directory, "*.txt")))
+
+    def _load_terms(self):
+        words, prefixes, versions, mtimes = set(), set(), {}, {}
+        for path in self._files():
+            lang = os.path.splitext(os.path.basename(path))[0]
+            mtimes[path] = os.path.getmtime(path)
+            versions[lang] = None
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line.startswith("#"):
+                        if line[1:].strip().lower().startswith("version:"):
+                            versions[lang] = line.split(":", 1)[1].strip()
+                        continue
+                    if not line:
+                        continue
+                    if line.endswith("*"):
+                        term = normalize_for_blocklist(line[:-1])
+                        if term:
+                            prefixes.add(term)
+                    else:
+                        term = normalize_for_blocklist(line)
+                        if term:
+                            words.add(term)
+        return words, prefixes, versions, mtimes
+
+    def reload(self):
+        """ Relee los archivos y recompila la regex (el swap es atómico). """
+        try:
+            words, prefixes, versions, mtimes = self._load_terms()
+        except OSError as e:
+            print(f"Blocklist: error leyendo {self.directory}: {e}")
+            return
+
+        partes = []
+        if words:
+            partes.append(rf"\b(?P<word>{_trie_regex(words)})\b")
+        if prefixes:
+            partes.append(rf"\b(?P<prefix>{_trie_regex(prefixes)})\w*")
+        pattern = re.compile("|".join(partes)) if partes else None
+
+        with self._lock:
+            self._pattern = pattern
+            self.versions = versions
+            self.term_count = len(words) + len(prefixes)
+            self._mtimes = mtimes
+            self._checked_at = time.monotonic()
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            mtimes = {path: os.path.getmtime(path) for path in self._files()}
+        except OSError:
+            return
+        if mtimes != self._mtimes:
+            print(f"Blocklist: cambios detectados, recargando {self.directory}")
+            self.reload()
+
+    def match(self, text: str) -> Optional[str]:
+        """ Primer término bloqueado encontrado en el texto, o None. """
+        self._reload_if_changed()
+        pattern = self._pattern
+        if pattern is None:
+            return None
+        found = pattern.search(normalize_for_blocklist(text))
+        if not found:
+            return None
+        return found.group("word") if found.groupdict().get("word") else found.group("prefix")
+
+
+blocklist = BlocklistEngine()
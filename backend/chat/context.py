@@ -0,0 +1,206 @@
+"""
+Armado del contexto de la conversación con presupuesto de tokens.
+
+Primero entran el prefijo estático, la parte nueva del request (sesión,
+documentos, pregunta) y, con lo que quede del presupuesto del deployment, los
+turnos anteriores del más nuevo al más viejo; en el prompt final lo estable va
+antes que lo nuevo (ver prompts.py). Lo que ya no cabe se resume: el resumen
+se guarda con el chat y se actualiza de forma incremental (resumen anterior +
+mensajes que acaban de salir de la ventana), en segundo plano para no sumar
+latencia a la respuesta.
+"""
+
+import os
+import asyncio
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:  # el presupuesto del prompt se calcula con una estimación (ver count_tokens)
+    tiktoken = None
+
+# Presupuesto total del prompt (tokens) y excepciones por deployment: "gpt-4o=12000,gpt-4=6000"
+CHAT_CONTEXT_BUDGET = int(os.getenv("CHAT_CONTEXT_BUDGET", "6000"))
+CHAT_CONTEXT_BUDGETS = {
+    name.strip(): int(value)
+    for name, _, value in (item.partition("=") for item in os.getenv("CHAT_CONTEXT_BUDGETS", "").split(","))
+    if name.strip() and value.strip()
+}
+# Tokens que se dejan libres para la respuesta
+CHAT_CONTEXT_REPLY_TOKENS = int(os.getenv("CHAT_CONTEXT_REPLY_TOKENS", "800"))
+# Mensajes anteriores que pueden entrar completos (los que se leen de Cosmos son unos más,
+# para que un mensaje siempre pase por el resumen antes de dejar de leerse)
+CHAT_CONTEXT_MAX_MESSAGES = int(os.getenv("CHAT_CONTEXT_MAX_MESSAGES", "20"))
+HISTORY_FETCH_MARGIN = 10
+# Largo máximo del resumen acumulado
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "300"))
+
+# Tokens extra por mensaje del formato chat (rol y separadores) y al final del prompt
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_PROMPT = 3
+
+SUMMARY_PROMPT = """Eres un asistente que mantiene el resumen de una conversación entre un ciudadano y Civic Knit.
+Actualiza el resumen con los mensajes nuevos. Conserva datos concretos (trámites, alcaldías, fechas,
+números de artículo, nombres de programas) y lo que el usuario ya dijo de su situación.
+Escribe en el mismo idioma de la conversación, en prosa breve, sin exceder {max_tokens} tokens.
+Responde solo con el resumen."""
+
+
+# Deployments cuyo encoding no se pudo cargar (se estiman sus tokens)
+_sin_tokenizer = set()
+
+
+@lru_cache(maxsize=16)
+def _encoding(deployment: str):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(deployment)
+        except KeyError:
+            # Nombres de deployment de Azure que no son nombres de modelo
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # Encoding no disponible (p. ej. el worker no pudo descargarlo): el deployment queda
+        # marcado para /api/chat/stats y lru_cache evita reintentar la descarga en cada turno
+        print(f"❌ [Chat] Tokenizer de {deployment} no disponible, se estiman los tokens: {e}")
+        _sin_tokenizer.add(deployment)
+        return None
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str, deployment: str = "gpt-4o") -> int:
+    """ Tokens del texto (cacheado: los mensajes del historial se cuentan en cada turno). """
+    encoding = _encoding(deployment)
+    if encoding is None:
+        # ~4 caracteres por token, redondeando hacia arriba: el empaquetado queda aproximado
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def preload_tokenizer(deployment: str):
+    """ Carga el encoding al arrancar (tiktoken lo descarga la primera vez). """
+    try:
+        count_tokens("Civic Knit", deployment)
+    except Exception as e:
+        print(f"❌ [Chat] No se pudo cargar el tokenizer de {deployment}: {e}")
+
+
+def message_tokens(message: Dict, deployment: str) -> int:
+    return count_tokens(message["content"] or "", deployment) + TOKENS_PER_MESSAGE
+
+
+def budget_for(deployment: str) -> int:
+    return CHAT_CONTEXT_BUDGETS.get(deployment, CHAT_CONTEXT_BUDGET)
+
+
+def summary_message(summary: str) -> Dict:
+    return {"role": "system", "content": f"RESUMEN DE LA CONVERSACIÓN ANTERIOR:\n{summary}"}
+
+
+def pack(deployment: str, prefix: List[Dict], history: List[Dict], tail: Dict[str, Optional[Dict]],
+         summary: Optional[str] = None, summarized_up_to: Optional[str] = None,
+         budget: Optional[int] = None):
+    """
+    Arma los mensajes del prompt dentro del presupuesto, en el orden
+    prefijo estático, resumen, historial y `tail` (lo que cambia en cada request).
+
+    history: turnos anteriores del más viejo al más nuevo, {"role", "content", "key"};
+    `key` ordena los mensajes (sortKey en Cosmos) y se compara con `summarized_up_to`.
+    tail: sección -> mensaje, en orden; el último es la pregunta actual y los None se omiten.
+
+    Devuelve (messages, overflow, stats): overflow son los mensajes que no
+    entraron y todavía no están en el resumen (hay que agregarlos); stats
+    incluye los tokens de cada sección.
+    """
+    budget = budget if budget is not None else budget_for(deployment)
+    tail = {name: message for name, message in tail.items() if message}
+    secciones = {"prefix": sum(message_tokens(m, deployment) for m in prefix), "summary": 0, "history": 0}
+    secciones.update((name, message_tokens(m, deployment)) for name, m in tail.items())
+    usados = TOKENS_PER_PROMPT + CHAT_CONTEXT_REPLY_TOKENS + sum(secciones.values())
+
+    resumen = summary_message(summary) if summary else None
+    if resumen:
+        secciones["summary"] = message_tokens(resumen, deployment)
+        usados += secciones["summary"]
+
+    incluidos = []
+    for message in reversed(history):
+        if len(incluidos) >= CHAT_CONTEXT_MAX_MESSAGES:
+            break
+        tokens = message_tokens(message, deployment)
+        if usados + tokens > budget:
+            break
+        usados += tokens
+        secciones["history"] += tokens
+        incluidos.append(message)
+    incluidos.reverse()
+
+    fuera = history[:len(history) - len(incluidos)]
+    overflow = [m for m in fuera if summarized_up_to is None or (m.get("key") or "") > summarized_up_to]
+    # Un resumen que no cabe se omite (el prefijo y la parte nueva tienen prioridad)
+    if resumen and usados > budget:
+        usados -= secciones["summary"]
+        secciones["summary"] = 0
+        resumen = None
+
+    messages = [*prefix, *([resumen] if resumen else []),
+                *({"role": m["role"], "content": m["content"]} for m in incluidos), *tail.values()]
+    stats = {"prompt_tokens": usados - CHAT_CONTEXT_REPLY_TOKENS, "history_messages": len(incluidos),
+             "dropped_messages": len(fuera), "summary": resumen is not None, "sections": secciones}
+    return messages, overflow, stats
+
+
+async def summarize(client, deployment: str, summary: Optional[str], messages: List[Dict]) -> str:
+    """ Resumen anterior + mensajes nuevos -> resumen actualizado (una llamada corta). """
+    transcript = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
+    response = await client.chat.completions.create(
+        model=deployment,
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT.format(max_tokens=CHAT_SUMMARY_MAX_TOKENS)},
+            {"role": "user", "content": f"RESUMEN ACTUAL:\n{summary or '(vacío)'}\n\nMENSAJES NUEVOS:\n{transcript}"}
+        ],
+        temperature=0,
+        max_tokens=CHAT_SUMMARY_MAX_TOKENS
+    )
+    return (response.choices[0].message.content or "").strip()
+
+
+class SummaryRefresher:
+    """ Actualizaciones de resumen en segundo plano, una a la vez por chat. """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.refreshed = 0
+        self.failed = 0
+
+    def schedule(self, key: str, coro_factory):
+        """ Lanza coro_factory() salvo que ese chat ya tenga una actualización en curso. """
+        task = self._tasks.get(key)
+        if task is not None and not task.done():
+            return
+        self._tasks[key] = asyncio.create_task(self._run(key, coro_factory))
+
+    async def _run(self, key, coro_factory):
+        try:
+            await coro_factory()
+            self.refreshed += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"Error actualizando el resumen del chat {key}: {e}")
+        finally:
+            self._tasks.pop(key, None)
+
+    async def wait(self):
+        """ Espera las actualizaciones en curso (al apagar la app). """
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._tasks), "refreshed": self.refreshed, "failed": self.failed,
+                "tokenizer": "tiktoken" if tiktoken is not None and not _sin_tokenizer else "estimado",
+                "token_cache": count_tokens.cache_info()._asdict()}
+
+
+summary_refresher = SummaryRefresher()
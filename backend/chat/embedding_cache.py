@@ -0,0 +1,134 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from typing import List, Optional
+
+# Este módulo no importa nada del paquete backend: la ingesta de gacetas
+# (infra/script/rag/app-rag.py) lo carga directamente sin levantar la app.
+
+
+def embedding_key(deployment: str, text: str) -> str:
+    """
+    Hash de (deployment, texto). Solo se unifican espacios y la forma Unicode:
+    mayúsculas y acentos sí cambian el embedding, así que no se normalizan.
+    """
+    text = " ".join(unicodedata.normalize("NFC", text).split())
+    return hashlib.sha256(f"{deployment}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Cache de embeddings por (deployment, texto).
+
+    Nivel 1: LRU en memoria (vectores float32).
+    Nivel 2 (opcional): SQLite en disco con el vector empaquetado como blob float32.
+    Un embedding no caduca: si cambia el modelo cambia el deployment y, con él, la llave.
+    """
+
+    def __init__(self, max_size: int = 5000, db_path: Optional[str] = None):
+        self.max_size = max_size
+        self._items = OrderedDict()  # key -> np.ndarray float32
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._db = None
+
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings "
+                    "(key TEXT PRIMARY KEY, deployment TEXT, dim INTEGER, vector BLOB, created_at REAL)"
+                )
+            except sqlite3.Error as e:
+                print(f"Embedding cache: SQLite deshabilitado ({e})")
+                self._db = None
+
+    def get(self, deployment: str, text: str) -> Optional[List[float]]:
+        """ Embedding guardado para el texto, o None. """
+        key = embedding_key(deployment, text)
+
+        with self._lock:
+            vector = self._items.get(key)
+            if vector is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return vector.tolist()
+
+            vector = self._get_disk(key)
+            if vector is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self._put_memory(key, vector)
+                return vector.tolist()
+
+            self.misses += 1
+            return None
+
+    def set(self, deployment: str, text: str, embedding):
+        """ Guarda el embedding (se almacena como float32). """
+        key = embedding_key(deployment, text)
+        vector = np.asarray(embedding, dtype=np.float32)
+
+        with self._lock:
+            self._put_memory(key, vector)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO embeddings (key, deployment, dim, vector, created_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (key, deployment, vector.shape[0], vector.tobytes(), time.time())
+                    )
+                except sqlite3.Error as e:
+                    print(f"Embedding cache: error escribiendo en SQLite: {e}")
+
+    async def embed(self, client, deployment: str, text: str) -> List[float]:
+        """ Embedding del texto: del cache o de Azure OpenAI (y se guarda). """
+        embedding = self.get(deployment, text)
+        if embedding is not None:
+            return embedding
+        response = await client.embeddings.create(model=deployment, input=text)
+        embedding = response.data[0].embedding
+        self.set(deployment, text, embedding)
+        return embedding
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def _put_memory(self, key, vector):
+        self._items[key] = vector
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def _get_disk(self, key):
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Embedding cache: error leyendo SQLite: {e}")
+            return None
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32)
+
+
+embedding_cache = EmbeddingCache(
+    max_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "5000")),
+    db_path=os.getenv("EMBEDDING_CACHE_DB") or None
+)
@@ -1,44 +1,98 @@
 import os
-from azure.ai.contentsafety import ContentSafetyClient
+import asyncio
+from typing import Optional
+from azure.ai.contentsafety.aio import ContentSafetyClient
 from azure.core.credentials import AzureKeyCredential
+from backend.telemetry import stage
+from .blocklist import blocklist
 
-def check_text_safety(text: str) -> dict:
-    """ Llama al servicio Azure AI Content Safety para revisar un texto. """
-    
-    palabras_prohibidas = ["odio", "estupid", "idiota", "maldit"]
-    text_lower = text.lower()
-    
-    for palabra in palabras_prohibidas:
-        if palabra in text_lower:
-            return {
-                "flagged": True,
-                "severity": 1,
-                "reason": f"Palabra prohibida detectada: {palabra}"
-            }
+# Presupuesto total por llamada a Content Safety (segundos)
+CONTENT_SAFETY_TIMEOUT = float(os.getenv("CONTENT_SAFETY_TIMEOUT", "2.0"))
+# "open": si Azure falla el mensaje pasa | "closed": si Azure falla el mensaje se bloquea
+CONTENT_SAFETY_FAIL_MODE = os.getenv("CONTENT_SAFETY_FAIL_MODE", "open").lower()
+
+_safety_client = None
+
+async def init_safety_client():
+    """ Crea el cliente asíncrono de Content Safety (uno por proceso, reutiliza conexiones). """
+    global _safety_client
+    if _safety_client:
+        return _safety_client
 
-    # 2. FILTRO DE AZURE
     endpoint = os.getenv("AZURE_CONTENT_SAFETY_ENDPOINT")
     key = os.getenv("AZURE_CONTENT_SAFETY_KEY")
-    
     if not endpoint or not key:
+        return None
+
+    _safety_client = ContentSafetyClient(
+        endpoint,
+        AzureKeyCredential(key),
+        connection_timeout=CONTENT_SAFETY_TIMEOUT,
+        read_timeout=CONTENT_SAFETY_TIMEOUT,
+        # Un reintento como máximo; el presupuesto total lo corta asyncio.wait_for
+        retry_total=1
+    )
+    print("✅ [Content Safety] Cliente listo")
+    return _safety_client
+
+async def close_safety_client():
+    """ Cierra el cliente y su pool de conexiones (al apagar la app). """
+    global _safety_client
+    if _safety_client:
+        await _safety_client.close()
+        _safety_client = None
+
+def _error_result(reason: str) -> dict:
+    """ Resultado cuando Azure no respondió, según la política fail-open/fail-closed. """
+    if CONTENT_SAFETY_FAIL_MODE == "closed":
+        return {"flagged": True, "severity": 1, "reason": reason}
+    return {"flagged": False, "reason": reason}
+
+def check_blocklist(text: str) -> Optional[dict]:
+    """ Resultado de bloqueo si el texto tiene un término prohibido, o None. """
+    # Una sola pasada sobre el texto normalizado
+    with stage("blocklist"):
+        palabra = blocklist.match(text)
+    if palabra:
+        return {
+            "flagged": True,
+            "severity": 1,
+            "reason": f"Palabra prohibida detectada: {palabra}"
+        }
+    return None
+
+async def check_text_safety(text: str, include_blocklist: bool = True) -> dict:
+    """
+    Llama al servicio Azure AI Content Safety para revisar un texto.
+    include_blocklist=False si quien llama ya pasó el texto por check_blocklist.
+    """
+
+    # 1. BLOCKLIST
+    if include_blocklist:
+        bloqueo = check_blocklist(text)
+        if bloqueo:
+            return bloqueo
+
+    # 2. FILTRO DE AZURE
+    client = await init_safety_client()
+    if not client:
         return {"flagged": False, "reason": "MODERATION_DISABLED"}
 
-    client = ContentSafetyClient(endpoint, AzureKeyCredential(key))
-    
     request = {
         "text": text,
         "categories": ["Hate", "SelfHarm", "Sexual", "Violence"],
-        "blocklistNames": [] 
+        "blocklistNames": []
     }
-    
+
     try:
-        response = client.analyze_text(request)
-        
+        with stage("content_safety"):
+            response = await asyncio.wait_for(client.analyze_text(request), timeout=CONTENT_SAFETY_TIMEOUT)
+
         # Bajamos la tolerancia a > 0 para ser más estrictos
         flagged = any(result.severity > 0 for result in response.categories_analysis)
 
         analysis_simple = [
-            {"category": str(res.category), "severity": res.severity} 
+            {"category": str(res.category), "severity": res.severity}
             for res in response.categories_analysis
         ]
 
@@ -48,7 +102,10 @@ def check_text_safety(text: str) -> dict:
             "severity": max(r.severity for r in response.categories_analysis) if response.categories_analysis else 0,
             "reason": analysis_simple
         }
-        
+
+    except asyncio.TimeoutError:
+        print(f"Content Safety Timeout (>{CONTENT_SAFETY_TIMEOUT}s)")
+        return _error_result("TIMEOUT")
     except Exception as e:
         print(f"Content Safety Error: {e}")
-        return {"flagged": False, "reason": "API_ERROR"}
\ No newline at end of file
+        return _error_result("API_ERROR")
@@ -1,26 +1,59 @@
 """
 Office Agent - Agente conversacional con acceso a información vectorizada
-Instalación: pip install semantic-kernel psycopg2-binary openai azure-identity
+Instalación: pip install asyncpg openai
+
+El agente es un servicio de vida larga (uno por proceso): el pool de Postgres
+y el cliente de OpenAI se crean en before_serving y se comparten entre
+requests. El historial de cada conversación vive en un objeto Conversacion
+aparte, nunca en el agente.
 """
 
 import asyncio
-from typing import List, Dict
+from typing import List, Dict, Optional
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta
-from collections import defaultdict, Counter
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import openai
+from datetime import datetime
+import asyncpg
+from openai import AsyncAzureOpenAI
 import os
 import json
+from backend.telemetry import stage
+from .embedding_cache import embedding_cache
+from .context import pack, summarize
+from .vector_index import local_index
+from .retrieval_router import retrieval_router
+from .sketches import SpaceSaving, DayBuckets
 
 # Configuración
 COSMOS_CONNECTION_STRING = os.getenv("COSMOS_CONNECTION_STRING")
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
+# La app usa AZURE_OPENAI_KEY; el script suelto, AZURE_OPENAI_API_KEY
+AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY") or os.getenv("AZURE_OPENAI_KEY")
 AZURE_OPENAI_DEPLOYMENT = "gpt-4"
 AZURE_EMBEDDING_DEPLOYMENT = "text-embedding-ada-002"
 
+# Pool de Postgres
+OFFICE_AGENT_POOL_MIN = int(os.getenv("OFFICE_AGENT_POOL_MIN", "1"))
+OFFICE_AGENT_POOL_MAX = int(os.getenv("OFFICE_AGENT_POOL_MAX", "10"))
+# Sentencias preparadas que se guardan por conexión (0 = sin cache, p.ej. detrás de pgbouncer)
+OFFICE_AGENT_STATEMENT_CACHE = int(os.getenv("OFFICE_AGENT_STATEMENT_CACHE", "100"))
+# Las conexiones ociosas más de este tiempo se cierran y se reabren al necesitarse
+OFFICE_AGENT_IDLE_LIFETIME = float(os.getenv("OFFICE_AGENT_IDLE_LIFETIME", "300"))
+# Tiempo máximo por consulta (segundos)
+OFFICE_AGENT_QUERY_TIMEOUT = float(os.getenv("OFFICE_AGENT_QUERY_TIMEOUT", "5"))
+# Búsqueda aproximada (índice de infra/script/rag/vector-index.py): candidatos que recorre HNSW
+# por consulta (mayor = más recall, más lento; debe ser >= limit) y listas que revisa IVFFlat
+OFFICE_AGENT_HNSW_EF_SEARCH = int(os.getenv("OFFICE_AGENT_HNSW_EF_SEARCH", "40"))
+OFFICE_AGENT_IVFFLAT_PROBES = int(os.getenv("OFFICE_AGENT_IVFFLAT_PROBES", "10"))
+# Índice local (OFFICE_AGENT_LOCAL_INDEX): "first" = local y Postgres si no hay resultados | "only" = sin Postgres
+OFFICE_AGENT_LOCAL_INDEX_MODE = os.getenv("OFFICE_AGENT_LOCAL_INDEX_MODE", "first").lower()
+
+# Métricas de uso: documentos/queries/valores de metadata que se siguen en los tops,
+# días que cubren los buckets, campos de metadata y largo de query que se guardan
+METRICS_TOP_CAPACITY = int(os.getenv("OFFICE_AGENT_METRICS_TOP_CAPACITY", "200"))
+METRICS_WINDOW_DAYS = 30
+METRICS_MAX_METADATA_FIELDS = 16
+METRICS_QUERY_MAX_CHARS = 200
+
 @dataclass
 class Message:
     """Representa un mensaje en la conversación"""
@@ -34,25 +67,24 @@ class Message:
             self.timestamp = datetime.now()
 
 
-@dataclass
-class DocumentAccess:
-    """Registra el acceso a un documento"""
-
-    document_id: str
-    timestamp: datetime
-    query: str
-    similarity: float
-    metadata: Dict = field(default_factory=dict)
-
-
 class MetricsCollector:
-    """Recolector de métricas de uso de documentos"""
+    """
+    Recolector de métricas de uso de documentos con memoria fija: el agente
+    vive lo que vive el worker, así que no se guarda cada acceso. Los tops son
+    aproximados (Space-Saving) y los periodos salen de buckets diarios.
+    """
     
-    def __init__(self):
-        self.accesos: List[DocumentAccess] = []
+    def __init__(self, top_capacity: int = METRICS_TOP_CAPACITY, dias: int = METRICS_WINDOW_DAYS):
+        self.top_capacity = top_capacity
         self.queries_totales = 0
         self.queries_con_resultados = 0
         self.queries_sin_resultados = 0
+        self.total_accesos = 0
+        self.similarity_total = 0.0
+        self.documentos = SpaceSaving(top_capacity)
+        self.queries = SpaceSaving(top_capacity)
+        self.por_dia = DayBuckets(dias)
+        self.por_metadata: Dict[str, SpaceSaving] = {}
     
     def registrar_busqueda(self, query: str, documentos: List[Dict]):
         """Registra una búsqueda y sus resultados"""
@@ -61,46 +93,51 @@ class MetricsCollector:
         
         if documentos:
             self.queries_con_resultados += 1
+            self.queries.add(query[:METRICS_QUERY_MAX_CHARS])
             for doc in documentos:
-                self.accesos.append(DocumentAccess(
-                    document_id=doc['id'],
-                    timestamp=datetime.now(),
-                    query=query,
-                    similarity=doc['similarity'],
-                    metadata=doc.get('metadata', {})
-                ))
+                doc_id = str(doc['id'])
+                self.total_accesos += 1
+                self.similarity_total += doc['similarity']
+                self.documentos.add(doc_id)
+                self.por_dia.add(doc_id, doc['similarity'])
+                for campo, valor in (doc.get('metadata') or {}).items():
+                    contador = self.por_metadata.get(campo)
+                    if contador is None:
+                        if len(self.por_metadata) >= METRICS_MAX_METADATA_FIELDS:
+                            continue
+                        contador = self.por_metadata[campo] = SpaceSaving(self.top_capacity)
+                    contador.add(str(valor))
         else:
             self.queries_sin_resultados += 1
     
     def get_documentos_mas_accedidos(self, top_n: int = 10) -> List[tuple]:
-        """Obtiene los documentos más accedidos"""
-        contador = Counter([acceso.document_id for acceso in self.accesos])
-        return contador.most_common(top_n)
+        """Obtiene los documentos más accedidos (conteos aproximados)"""
+        return self.documentos.top(top_n)
     
     def get_queries_populares(self, top_n: int = 10) -> List[tuple]:
-        """Obtiene las queries más frecuentes"""        
-        contador = Counter([acceso.query for acceso in self.accesos])
-        return contador.most_common(top_n)
+        """Obtiene las queries más frecuentes (conteos aproximados)"""        
+        return self.queries.top(top_n)
     
     def get_estadisticas_por_periodo(self, dias: int = 7) -> Dict:
-        """Estadísticas de los últimos N días"""
-        fecha_limite = datetime.now() - timedelta(days=dias)
-        accesos_periodo = [a for a in self.accesos if a.timestamp >= fecha_limite]
+        """Estadísticas de los últimos N días (máximo METRICS_WINDOW_DAYS)"""
+        dias = min(dias, self.por_dia.days)
+        periodo = self.por_dia.window(dias)
         
         return {
-            'total_accesos': len(accesos_periodo),
-            'documentos_unicos': len(set(a.document_id for a in accesos_periodo)),
-            'similarity_promedio': sum(a.similarity for a in accesos_periodo) / len(accesos_periodo) if accesos_periodo else 0,
-            'accesos_por_dia': len(accesos_periodo) / dias if dias > 0 else 0
+            'total_accesos': periodo['count'],
+            'documentos_unicos': periodo['distinct'],
+            'similarity_promedio': periodo['similarity_sum'] / periodo['count'] if periodo['count'] else 0,
+            'accesos_por_dia': periodo['count'] / dias if dias > 0 else 0
         }
     
     def get_metricas_por_metadata(self, campo: str) -> Dict:
-        """Agrupa métricas por un campo de metadata"""
-        metricas = defaultdict(int)
-        for acceso in self.accesos:
-            valor = acceso.metadata.get(campo, 'Sin categoría')
-            metricas[valor] += 1
-        return dict(metricas)
+        """Agrupa métricas por un campo de metadata (valores más frecuentes)"""
+        contador = self.por_metadata.get(campo)
+        metricas = contador.items() if contador else {}
+        sin_campo = self.total_accesos - sum(metricas.values())
+        if sin_campo > 0:
+            metricas['Sin categoría'] = sin_campo
+        return metricas
     
     def exportar_metricas(self) -> Dict:
         """Exporta todas las métricas en formato JSON"""
@@ -110,7 +147,8 @@ class MetricsCollector:
                 'queries_exitosas': self.queries_con_resultados,
                 'queries_sin_resultados': self.queries_sin_resultados,
                 'tasa_exito': f"{(self.queries_con_resultados/self.queries_totales*100):.1f}%" if self.queries_totales > 0 else "0%",
-                'total_accesos_documentos': len(self.accesos)
+                'total_accesos_documentos': self.total_accesos,
+                'similarity_promedio': self.similarity_total / self.total_accesos if self.total_accesos else 0
             },
             'top_documentos': self.get_documentos_mas_accedidos(10),
             'top_queries': self.get_queries_populares(10),
@@ -133,7 +171,7 @@ class MetricsCollector:
         if self.queries_totales > 0:
             tasa = (self.queries_con_resultados / self.queries_totales) * 100
             print(f"  Tasa de éxito: {tasa:.1f}%")
-        print(f"Total de accesos a documentos: {len(self.accesos)}")
+        print(f"Total de accesos a documentos: {self.total_accesos}")
         
         # Documentos más accedidos
         print("\n🔥 TOP 10 DOCUMENTOS MÁS ACCEDIDOS")
@@ -169,7 +207,7 @@ class MetricsCollector:
         print(f"  • Similarity promedio: {stats_30d['similarity_promedio']:.2%}")
         
         # Métricas por categoría (si existe metadata)
-        if self.accesos and 'categoria' in self.accesos[0].metadata:
+        if 'categoria' in self.por_metadata:
             print("\n📑 ACCESOS POR CATEGORÍA")
             print("-" * 70)
             metricas_cat = self.get_metricas_por_metadata('categoria')
@@ -179,21 +217,55 @@ class MetricsCollector:
         print("\n" + "="*70 + "\n")
 
 
+@dataclass
+class Conversacion:
+    """Estado de una conversación (uno por request o por sesión, nunca compartido)"""
+
+    history: List[Message] = field(default_factory=list)
+    # Resumen de los mensajes que ya salieron del historial
+    summary: str = ""
+
+    def limpiar(self):
+        """Limpia el historial de conversación"""
+        self.history = []
+        self.summary = ""
+
+    def mostrar(self):
+        """Muestra el historial de conversación"""
+        print("\n" + "="*60)
+        print("HISTORIAL DE CONVERSACIÓN")
+        print("="*60)
+        for msg in self.history:
+            timestamp = msg.timestamp.strftime("%H:%M:%S")
+            print(f"[{timestamp}] {msg.role.upper()}: {msg.content[:100]}...")
+        print("="*60 + "\n")
+
+
 class OfficeAgent:
     """
     Agente conversacional con acceso a información vectorizada en Cosmos DB.
     Puede responder preguntas generales Y consultar documentos vectorizados cuando sea relevante.
     """
     
-    def __init__(self):
-        self.conversation_history: List[Message] = []
-        self.conn = None
-        self.openai_client = None
+    def __init__(self, min_size: int = OFFICE_AGENT_POOL_MIN, max_size: int = OFFICE_AGENT_POOL_MAX):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool: Optional[asyncpg.Pool] = None
+        self.openai_client: Optional[AsyncAzureOpenAI] = None
         self.agent_name = "Office Agent"
-        self.metrics = MetricsCollector()  # Sistema de métricas
-        
-        # Sistema de prompt del agente
-        self.system_prompt = f"""Eres {self.agent_name}, un asistente inteligente de oficina especializado en temas del gobierno de la ciudad de méxico.
+        self.metrics = MetricsCollector()  # Sistema de métricas (compartido por el proceso)
+
+    @property
+    def running(self) -> bool:
+        return self.openai_client is not None and (self.pool is not None or local_index.available)
+
+    @property
+    def solo_local(self) -> bool:
+        return OFFICE_AGENT_LOCAL_INDEX_MODE == "only" and local_index.available
+
+    def _system_prompt(self) -> str:
+        """Prompt de sistema del agente (estático: la fecha va al final, en procesar_mensaje)"""
+        return f"""Eres {self.agent_name}, un asistente inteligente de oficina especializado en temas del gobierno de la ciudad de méxico.
 
 CAPACIDADES:
 - Responder preguntas generales de forma conversacional, neutra y amigable
@@ -209,51 +281,69 @@ INSTRUCCIONES:
 4. Sé conversacional, claro y útil
 5. Si no encuentras información relevante en los documentos, responde con tu conocimiento general 
    pero menciona que no encontraste documentación específica
-
-Fecha actual: {datetime.now().strftime('%Y-%m-%d %H:%M')}
 """
 
     async def initialize(self):
-        """Inicializa conexiones a Cosmos DB y Azure OpenAI"""
-        ### Necesito adecuarme a la estrucura del proyecto de Ana!!
-        
-        #print(f"🚀 Inicializando {self.agent_name}...")
+        """Crea el pool de Postgres (Cosmos DB for PostgreSQL) y el cliente de Azure OpenAI"""
+        if self.running:
+            return
+
+        # Cliente de OpenAI
+        self.openai_client = AsyncAzureOpenAI(
+            api_key=AZURE_OPENAI_API_KEY,
+            api_version="2024-02-01",
+            azure_endpoint=AZURE_OPENAI_ENDPOINT
+        )
+        print("✓ Cliente Azure OpenAI configurado")
+
+        if self.solo_local:
+            print(f"✓ {self.agent_name} listo (solo índice local)\n")
+            return
         
-        # Conexión a Cosmos DB
         try:
-            self.conn = psycopg2.connect(
+            self.pool = await asyncpg.create_pool(
                 COSMOS_CONNECTION_STRING,
-                cursor_factory=RealDictCursor
+                min_size=self.min_size,
+                max_size=self.max_size,
+                statement_cache_size=OFFICE_AGENT_STATEMENT_CACHE,
+                max_inactive_connection_lifetime=OFFICE_AGENT_IDLE_LIFETIME,
+                command_timeout=OFFICE_AGENT_QUERY_TIMEOUT,
+                # Parámetros de búsqueda del índice vectorial, fijos por conexión
+                server_settings={
+                    "hnsw.ef_search": str(OFFICE_AGENT_HNSW_EF_SEARCH),
+                    "ivfflat.probes": str(OFFICE_AGENT_IVFFLAT_PROBES),
+                }
             )
-            print("✓ Conectado a Cosmos DB")
+            print("✓ Pool de Cosmos DB listo")
         except Exception as e:
             print(f"✗ Error conectando a Cosmos DB: {e}")
             raise
         
-        # Cliente de OpenAI
-        self.openai_client = openai.AzureOpenAI(
-            api_key=AZURE_OPENAI_API_KEY,
-            api_version="2024-02-01",
-            azure_endpoint=AZURE_OPENAI_ENDPOINT
-        )
-        print("✓ Cliente Azure OpenAI configurado")
-        
         print(f"✓ {self.agent_name} listo para conversar\n")
+
+    async def health(self) -> bool:
+        """Comprueba que el pool responde"""
+        if not self.running:
+            return False
+        if self.pool is None:
+            return local_index.available
+        try:
+            return await self.pool.fetchval("SELECT 1", timeout=OFFICE_AGENT_QUERY_TIMEOUT) == 1
+        except Exception as e:
+            print(f"✗ Health check de Postgres falló: {e}")
+            return False
     
-    def _generar_embedding(self, texto: str) -> List[float]:
+    async def _generar_embedding(self, texto: str) -> List[float]:
         """Genera embedding para un texto usando Azure OpenAI"""
         
         try:
-            response = self.openai_client.embeddings.create(
-                input=texto,
-                model=AZURE_EMBEDDING_DEPLOYMENT
-            )
-            return response.data[0].embedding
+            with stage("retrieval_embedding"):
+                return await embedding_cache.embed(self.openai_client, AZURE_EMBEDDING_DEPLOYMENT, texto)
         except Exception as e:
             print(f"Error generando embedding: {e}")
             return None
     
-    def _buscar_documentos_relevantes(self, query: str, limit: int = 3, threshold: float = 0.75) -> List[Dict]:
+    async def _buscar_documentos_relevantes(self, query: str, limit: int = 3, threshold: float = 0.75) -> List[Dict]:
         """
         Busca documentos vectorizados relevantes para la consulta
         
@@ -267,39 +357,49 @@ Fecha actual: {datetime.now().strftime('%Y-%m-%d %H:%M')}
         """
         
         # Generar embedding de la query
-        query_embedding = self._generar_embedding(query)
+        query_embedding = await self._generar_embedding(query)
         if not query_embedding:
             return []
         
-        # Convertir a formato compatible con pgvector
+        # Índice local en memoria compartida: evita el viaje de red a Postgres
+        if local_index.available:
+            # La búsqueda en NumPy es CPU: se hace fuera del event loop
+            with stage("retrieval_local"):
+                documents = await asyncio.to_thread(local_index.buscar_documentos, query_embedding, limit, threshold)
+            if documents or self.pool is None:
+                return documents
+        
+        # Convertir a formato compatible con pgvector (se envía como texto y se castea en SQL)
         embedding_str = "[" + ",".join(map(str, query_embedding)) + "]"
         
         try:
-            cur = self.conn.cursor()
-            
-            # Buscar documentos similares usando cosine similarity
-            # Nota: Ajusta los nombres de columnas según tu esquema
-            cur.execute("""
-                SELECT 
-                    id,
-                    content,
-                    metadata,
-                    1 - (embedding <=> %s::vector) AS similarity
-                FROM documents
-                WHERE 1 - (embedding <=> %s::vector) > %s
-                ORDER BY embedding <=> %s::vector
-                LIMIT %s
-            """, (embedding_str, embedding_str, threshold, embedding_str, limit))
-            
-            results = cur.fetchall()
-            cur.close()
+            # Buscar documentos similares usando cosine distance.
+            # ORDER BY distancia LIMIT k es la forma que usa el índice HNSW/IVFFlat;
+            # la distancia se calcula una vez y el umbral se aplica sobre los k resultados
+            # (un WHERE sobre la similitud obligaría a recorrer toda la tabla).
+            with stage("retrieval_postgres"):
+                results = await self.pool.fetch("""
+                    SELECT id, content, metadata, 1 - distance AS similarity
+                    FROM (
+                        SELECT id, content, metadata, embedding <=> $1::text::vector AS distance
+                        FROM documents
+                        ORDER BY distance
+                        LIMIT $3
+                    ) AS candidatos
+                    WHERE distance < 1 - $2::float8
+                    ORDER BY distance
+                """, embedding_str, threshold, limit)
             
             documents = []
             for row in results:
+                metadata = row['metadata'] or {}
+                if isinstance(metadata, str):
+                    # asyncpg entrega jsonb como texto
+                    metadata = json.loads(metadata)
                 documents.append({
                     'id': row['id'],
                     'content': row['content'],
-                    'metadata': row.get('metadata', {}),
+                    'metadata': metadata,
                     'similarity': float(row['similarity'])
                 })
             
@@ -311,9 +411,13 @@ Fecha actual: {datetime.now().strftime('%Y-%m-%d %H:%M')}
     
     def _necesita_busqueda_vectorial(self, mensaje: str) -> bool:
         """
-        Determina si el mensaje requiere búsqueda en documentos vectorizados
-        Usa keywords y contexto para decidir
+        Determina si el mensaje requiere búsqueda en documentos vectorizados.
+        Con OFFICE_AGENT_ROUTER_MODEL decide el clasificador (es/en/fr);
+        sin modelo se usan keywords y contexto
         """
+        if retrieval_router is not None:
+            with stage("retrieval_router"):
+                return retrieval_router.needs_retrieval(mensaje)
         
         # Keywords que sugieren búsqueda de documentos internos
         keywords_internos = [
@@ -339,8 +443,38 @@ Fecha actual: {datetime.now().strftime('%Y-%m-%d %H:%M')}
                 return True
         
         return False
+
+    async def contexto_documentos(self, mensaje_usuario: str) -> str:
+        """
+        Bloque de contexto con los documentos relevantes para el mensaje
+        ("" si no hace falta buscar o no se encontró nada)
+        """
+        if not self.running or not self._necesita_busqueda_vectorial(mensaje_usuario):
+            return ""
+
+        documentos_encontrados = await self._buscar_documentos_relevantes(mensaje_usuario, limit=3)
+        
+        # Registrar métricas de búsqueda
+        self.metrics.registrar_busqueda(mensaje_usuario, documentos_encontrados)
+        
+        if not documentos_encontrados:
+            return ""
+
+        # Construir contexto con documentos
+        contexto_partes = ["\n--- INFORMACIÓN DE DOCUMENTOS INTERNOS ---"]
+        for i, doc in enumerate(documentos_encontrados, 1):
+            metadata_info = ""
+            if doc['metadata']:
+                metadata_info = f" (Fuente: {doc['metadata'].get('source', 'N/A')})"
+            
+            contexto_partes.append(
+                f"\nDocumento {i}{metadata_info} [Relevancia: {doc['similarity']:.2%}]:\n{doc['content']}"
+            )
+        
+        contexto_partes.append("\n--- FIN DE DOCUMENTOS ---\n")
+        return "\n".join(contexto_partes)
     
-    async def procesar_mensaje(self, mensaje_usuario: str) -> str:
+    async def procesar_mensaje(self, mensaje_usuario: str, conversacion: Conversacion) -> str:
         """
         Procesa un mensaje del usuario y genera respuesta
         
@@ -351,69 +485,27 @@ Fecha actual: {datetime.now().strftime('%Y-%m-%d %H:%M')}
         4. Genera respuesta usando GPT con todo el contexto
         """
         
-        ### ******** AADAPTARLO CON EL DE ANA
-        ##print(f"\n💬 Usuario: {mensaje_usuario}")
-        
-        # Agregar mensaje del usuario al historial
-        self.conversation_history.append(Message(role="user", content=mensaje_usuario))
-        
-        # Determinar si necesita búsqueda vectorial
-        necesita_busqueda = self._necesita_busqueda_vectorial(mensaje_usuario)
+        contexto_documentos = await self.contexto_documentos(mensaje_usuario)
         
-        contexto_documentos = ""
-        documentos_encontrados = []
-        
-        if necesita_busqueda:
-            #print("🔍 Buscando en documentos vectorizados...")
-            documentos_encontrados = self._buscar_documentos_relevantes(mensaje_usuario, limit=3)
-            
-            # Registrar métricas de búsqueda
-            self.metrics.registrar_busqueda(mensaje_usuario, documentos_encontrados)
-            
-            if documentos_encontrados:
-                #print(f"✓ Encontrados {len(documentos_encontrados)} documentos relevantes")
-                
-                # Construir contexto con documentos
-                contexto_partes = ["\n--- INFORMACIÓN DE DOCUMENTOS INTERNOS ---"]
-                for i, doc in enumerate(documentos_encontrados, 1):
-                    metadata_info = ""
-                    if doc['metadata']:
-                        metadata_info = f" (Fuente: {doc['metadata'].get('source', 'N/A')})"
-                    
-                    contexto_partes.append(
-                        f"\nDocumento {i}{metadata_info} [Relevancia: {doc['similarity']:.2%}]:\n{doc['content']}"
-                    )
-                
-                contexto_partes.append("\n--- FIN DE DOCUMENTOS ---\n")
-                contexto_documentos = "\n".join(contexto_partes)
-            else:
-                pass
-                #print("ℹ️  No se encontraron documentos relevantes")
-        
-        # Construir mensajes para la API
-        messages = [
-            {"role": "system", "content": self.system_prompt}
-        ]
-        
-        # Agregar contexto de documentos si existe
-        if contexto_documentos:
-            messages.append({
-                "role": "system",
-                "content": contexto_documentos
-            })
+        # Prefijo estable primero (el proveedor lo cachea) y al final lo que cambia en cada mensaje
+        prefix = [{"role": "system", "content": self._system_prompt()}]
+        tail = {
+            "session": {"role": "system", "content": f"Fecha actual: {datetime.now().strftime('%Y-%m-%d %H:%M')}"},
+            "documents": {"role": "system", "content": contexto_documentos} if contexto_documentos else None,
+            "question": {"role": "user", "content": mensaje_usuario},
+        }
         
-        # Agregar historial de conversación (últimos 10 mensajes)
-        for msg in self.conversation_history[-10:]:
-            messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
+        # Historial dentro del presupuesto de tokens, del más nuevo al más viejo;
+        # lo que no cabe se agrega al resumen y sale del historial
+        historial = [{"role": msg.role, "content": msg.content} for msg in conversacion.history]
+        messages, overflow, _ = pack(AZURE_OPENAI_DEPLOYMENT, prefix, historial, tail,
+                                     conversacion.summary or None)
         
-        # Generar respuesta
-        #print("💭 Generando respuesta...")
+        # Agregar mensaje del usuario al historial de esta conversación
+        conversacion.history.append(Message(role="user", content=mensaje_usuario))
         
         try:
-            response = self.openai_client.chat.completions.create(
+            response = await self.openai_client.chat.completions.create(
                 model=AZURE_OPENAI_DEPLOYMENT,
                 messages=messages,
                 temperature=0.7,
@@ -423,31 +515,23 @@ Fecha actual: {datetime.now().strftime('%Y-%m-%d %H:%M')}
             respuesta = response.choices[0].message.content
             
             # Agregar respuesta al historial
-            self.conversation_history.append(Message(role="assistant", content=respuesta))
+            conversacion.history.append(Message(role="assistant", content=respuesta))
+            
+            if overflow:
+                try:
+                    conversacion.summary = await summarize(self.openai_client, AZURE_OPENAI_DEPLOYMENT,
+                                                           conversacion.summary, overflow)
+                    del conversacion.history[:len(overflow)]
+                except Exception as e:
+                    print(f"✗ Error actualizando el resumen: {e}")
             
             return respuesta
             
         except Exception as e:
             ## Esta va a costar trabajo capturalo , mmm....
             error_msg = f"Lo siento, ocurrió un error al procesar tu mensaje: {e}"
-            #print(f"✗ Error: {e}")
             return error_msg
     
-    def limpiar_historial(self):
-        """Limpia el historial de conversación"""
-        self.conversation_history = []
-        #print("🗑️  Historial de conversación limpiado")
-    
-    def mostrar_historial(self):
-        """Muestra el historial de conversación"""
-        print("\n" + "="*60)
-        print("HISTORIAL DE CONVERSACIÓN")
-        print("="*60)
-        for msg in self.conversation_history:
-            timestamp = msg.timestamp.strftime("%H:%M:%S")
-            print(f"[{timestamp}] {msg.role.upper()}: {msg.content[:100]}...")
-        print("="*60 + "\n")
-    
     def guardar_metricas(self, archivo: str = "metricas_office_agent.json"):
         """Guarda las métricas en un archivo JSON"""
         try:
@@ -473,11 +557,18 @@ Fecha actual: {datetime.now().strftime('%Y-%m-%d %H:%M')}
             print(f"✗ Error cargando métricas: {e}")
             return None
     
-    def close(self):
-        """Cierra conexiones"""
-        if self.conn:
-            self.conn.close()
-            #print("✓ Conexiones cerradas")
+    async def close(self):
+        """Cierra el pool y el cliente de OpenAI"""
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+        if self.openai_client:
+            await self.openai_client.close()
+            self.openai_client = None
+
+
+# Instancia compartida por la app (se inicia en before_serving)
+office_agent = OfficeAgent()
 
 
 async def main():
@@ -486,6 +577,7 @@ async def main():
     # Inicializar agente
     agent = OfficeAgent()
     await agent.initialize()
+    conversacion = Conversacion()
     
     print("="*60)
     print(f"  {agent.agent_name} - Chat Interactivo")
@@ -507,7 +599,7 @@ async def main():
     
     print("📝 Ejecutando ejemplos de conversación...\n")
     for ejemplo in ejemplos:
-        respuesta = await agent.procesar_mensaje(ejemplo)
+        respuesta = await agent.procesar_mensaje(ejemplo, conversacion)
         print(f"\n🤖 {agent.agent_name}: {respuesta}\n")
         print("-"*60)
         await asyncio.sleep(1)
@@ -530,7 +622,7 @@ async def main():
                 agent.guardar_metricas()
                 break
             elif mensaje.lower() == '/historial':
-                agent.mostrar_historial()
+                conversacion.mostrar()
                 continue
             elif mensaje.lower() == '/metricas':
                 agent.metrics.mostrar_reporte()
@@ -539,11 +631,11 @@ async def main():
                 agent.guardar_metricas()
                 continue
             elif mensaje.lower() == '/limpiar':
-                agent.limpiar_historial()
+                conversacion.limpiar()
                 continue
             
             # Procesar mensaje
-            respuesta = await agent.procesar_mensaje(mensaje)
+            respuesta = await agent.procesar_mensaje(mensaje, conversacion)
             print(f"\n🤖 {agent.agent_name}: {respuesta}\n")
             
         except KeyboardInterrupt:
@@ -553,7 +645,7 @@ async def main():
             print(f"\n❌ Error: {e}\n")
     
     # Cerrar conexiones
-    agent.close()
+    await agent.close()
 
 
 # Ejemplo simple de uso programático (sin modo interactivo)
@@ -562,17 +654,18 @@ async def ejemplo_simple():
     
     agent = OfficeAgent()
     await agent.initialize()
+    conversacion = Conversacion()
     
     # Hacer una pregunta
     respuesta = await agent.procesar_mensaje(
-        "¿Cuál es el proceso para reportar un incidente de seguridad?"
+        "¿Cuál es el proceso para reportar un incidente de seguridad?", conversacion
     )
     print(f"\nRespuesta: {respuesta}")
     
     # Otra pregunta (mantiene contexto)
     respuesta = await agent.procesar_mensaje(
-        "¿Y cuánto tiempo tengo para reportarlo?"
+        "¿Y cuánto tiempo tengo para reportarlo?", conversacion
     )
     print(f"\nRespuesta: {respuesta}")
     
-    agent.close()
+    await agent.close()
@@ -0,0 +1,145 @@
+"""
+Plantillas de prompt del chat.
+
+El prompt de sistema se divide en un prefijo estático (rol, reglas, idioma y
+formato de salida) y una parte volátil (fecha, perfil del usuario, documentos).
+Los prefijos se compilan una sola vez por idioma y modo de moderación; la parte
+volátil va al final del prompt, después del historial, siempre en el mismo
+orden. Así el inicio del prompt es idéntico entre requests y Azure OpenAI
+puede reutilizar su cache de prefijos (cobra y procesa menos tokens).
+"""
+
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from backend.telemetry import registry
+
+LANGUAGES = ("es", "en", "fr")
+
+JUDGE_RULES = """
+BLOCKING RULES (Respond 'UNSAFE'):
+1. Discrimination/Hate: Against gender, race, religion, nationality (e.g., "Women can't lead", "X people are bad").
+2. Insults/Attacks: Personal attacks (e.g., "You are stupid", "Idiot").
+3. Anti-Democratic: Denying human rights (e.g., "Don't vote").
+
+PASSING RULES (Respond 'SAFE'):
+1. Opinions on politics (even negative ones, if respectful).
+2. Questions about laws, procedures, or history.
+3. Civic criticism.
+"""
+
+JUDGE_PROMPT = f"""
+Role: Content Moderation AI for a Civic App.
+Task: Classify the user message.
+{JUDGE_RULES}
+Output: Respond ONLY with one word: 'SAFE' or 'UNSAFE'.
+""".strip()
+
+# Modo fusionado: el veredicto y la respuesta salen de una sola llamada
+FUSED_INSTRUCTION = f"""
+# SAFETY VERDICT (MANDATORY)
+Before answering, classify the user message with these rules:
+{JUDGE_RULES}
+# JSON OUTPUT
+Respond ONLY with a JSON object with exactly these keys:
+{{"verdict": "SAFE" or "UNSAFE", "answer": "<your Markdown answer, empty string if UNSAFE>"}}
+"""
+
+SYSTEM_PREFIX = """
+ROLE: You are **Civic Knit**, a Digital Civic Assistant specialized in government information, laws, procedures, and public policies. Your main goal is to facilitate civic life by providing clear, accessible, and accurate information.
+
+# CORE RULES & CONTEXT
+1. **IDENTITY:** Be neutral, objective, civic-minded, and strictly professional.
+2. **LOCATION SCOPE:** Your knowledge base is focused on **Mexico City (CDMX)**. All answers regarding procedures, laws, or programs must be framed within this jurisdiction unless the user explicitly asks about federal topics or another location.
+3. **KNOWLEDGE PRIORITY (RAG):** You have access to recent legal and normative documents. **YOU MUST PRIORITIZE this information** over your general knowledge to ensure currency and precision. If the context is not relevant, rely on your internal training.
+4. **MODERATION:** The user's message has already passed a safety filter. Always maintain a **respectful** and **helpful** tone. Never be punitive or repeat safety rules to the user.
+5. **SESSION DATA:** The system messages right before the user's message have the current date, the user profile and, when relevant, official documents. Use them.
+
+# OUTPUT INSTRUCTION
+- **LANGUAGE:** You MUST respond strictly in the language: **{lang}**.
+- **FORMAT:** Use **Markdown** (bolding, lists, headers) to make reading easier.
+- **CITATIONS:** If you used information from the provided documents, add a reference at the end (e.g., "Source: Official Gazette, Art. 5").
+"""
+
+SESSION_TEMPLATE = """# SESSION DATA
+- CURRENT DATE UTC: {now}
+- USER PROFILE: {profile}"""
+
+# Secciones del prompt en el orden en que se arma; las primeras tres forman el
+# prefijo estable (elegible para el cache del proveedor), el resto es nuevo en cada request
+SECTIONS = ("prefix", "summary", "history", "session", "documents", "question")
+CACHEABLE_SECTIONS = ("prefix", "summary", "history")
+
+prompt_tokens = registry.counter(
+    "civicknit_prompt_tokens_total", "Tokens del prompt de respuesta por sección.", ("section",))
+
+
+def _compile(lang: str, suffix: str = "") -> str:
+    return (SYSTEM_PREFIX.format(lang=lang).strip() + "\n" + suffix).strip()
+
+
+class PromptTemplates:
+    """ Prefijos precompilados por (idioma, modo) y la parte volátil del prompt. """
+
+    def __init__(self, languages=LANGUAGES, modes: Optional[Dict[str, str]] = None):
+        self.modes = {"judge": "", **(modes or {})}
+        self._prefixes = {
+            (lang, mode): _compile(lang, suffix)
+            for lang in languages
+            for mode, suffix in self.modes.items()
+        }
+        self.requests = 0
+        self.section_tokens = dict.fromkeys(SECTIONS, 0)
+
+    def prefix(self, lang: str, mode: str = "judge") -> str:
+        """ Prefijo estático; un idioma fuera de la lista se arma al vuelo (no se guarda). """
+        prefix = self._prefixes.get((lang, mode))
+        if prefix is None:
+            prefix = _compile(lang, self.modes.get(mode, ""))
+        return prefix
+
+    @staticmethod
+    def session(user: Optional[dict], now: Optional[datetime] = None, shared: bool = False) -> str:
+        """
+        Fecha y perfil del usuario (va al final del prompt). Con shared=True la
+        respuesta puede servirse a otros usuarios (cache semántico): sin el nombre.
+        """
+        now = (now or datetime.now(timezone.utc)).strftime('%Y-%m-%d %H:%M UTC')
+        if user and 'dbProfile' in user:
+            profile = user['dbProfile']
+            if shared:
+                user_context = f"Usuario de {profile.get('state')}, {profile.get('country')}"
+            else:
+                user_context = f"Usuario: {profile.get('name')}, {profile.get('state')}, {profile.get('country')}"
+        else:
+            user_context = "Usuario Invitado."
+        return SESSION_TEMPLATE.format(now=now, profile=user_context)
+
+    def tail(self, user: Optional[dict], documents: str, question: str,
+             shared: bool = False) -> Dict[str, Optional[Dict]]:
+        """ Parte volátil en orden fijo (sección -> mensaje) para context.pack. """
+        return {
+            "session": {"role": "system", "content": self.session(user, shared=shared)},
+            "documents": {"role": "system", "content": documents} if documents else None,
+            "question": {"role": "user", "content": question},
+        }
+
+    def record(self, sections: Dict[str, int]):
+        """ Acumula tokens por sección de un prompt armado. """
+        self.requests += 1
+        for section, tokens in sections.items():
+            self.section_tokens[section] = self.section_tokens.get(section, 0) + tokens
+            prompt_tokens.inc(tokens, section=section)
+
+    def stats(self) -> dict:
+        total = sum(self.section_tokens.values())
+        cacheable = sum(self.section_tokens[s] for s in CACHEABLE_SECTIONS)
+        requests = self.requests or 1
+        return {
+            "requests": self.requests,
+            "avg_tokens_by_section": {s: round(t / requests, 1) for s, t in self.section_tokens.items()},
+            "cacheable_ratio": round(cacheable / total, 4) if total else 0.0,
+        }
+
+
+prompt_templates = PromptTemplates(modes={"fused": FUSED_INSTRUCTION})
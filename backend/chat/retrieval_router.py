@@ -0,0 +1,111 @@
+import os
+import json
+import zlib
+import unicodedata
+import numpy as np
+from typing import Optional
+
+# Este módulo no importa nada del paquete backend: el script de entrenamiento
+# (infra/script/rag/train-router.py) lo carga directamente para usar el mismo featurize.
+
+# Tamaño del espacio de features (hashing trick)
+N_FEATURES = 2 ** 18
+# Longitudes de los n-gramas de caracteres (dentro de cada palabra, con bordes)
+CHAR_NGRAMS = (3, 4, 5)
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.split())
+
+
+def featurize(text: str, n_features: int = N_FEATURES, char_ngrams=CHAR_NGRAMS):
+    """
+    Features dispersas del texto: palabras completas + n-gramas de caracteres,
+    cada uno llevado a un índice con crc32. Devuelve (índices, valores) con norma L2 = 1.
+    Los n-gramas funcionan igual en español, inglés y francés (no hay listas de palabras).
+    """
+    counts = {}
+    for word in _normalize(text).split():
+        tokens = [f"w:{word}"]
+        padded = f"<{word}>"
+        for n in char_ngrams:
+            tokens.extend(padded[i:i + n] for i in range(max(len(padded) - n + 1, 0)))
+        for token in tokens:
+            idx = zlib.crc32(token.encode("utf-8")) % n_features
+            counts[idx] = counts.get(idx, 0.0) + 1.0
+
+    if not counts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    return indices, values / np.linalg.norm(values)
+
+
+class RetrievalRouter:
+    """
+    Clasificador (regresión logística sobre features hasheadas) que decide si un
+    mensaje necesita búsqueda de documentos. El modelo se entrena con
+    infra/script/rag/train-router.py y se guarda en un .npz.
+    """
+
+    def __init__(self, weights: np.ndarray, bias: float, threshold: float, meta: dict):
+        self.weights = weights
+        self.bias = bias
+        self.threshold = threshold
+        self.meta = meta
+        self.n_features = meta.get("n_features", N_FEATURES)
+        self.char_ngrams = tuple(meta.get("char_ngrams", CHAR_NGRAMS))
+        self.calls = 0
+        self.positives = 0
+
+    @classmethod
+    def load(cls, path: str, threshold: Optional[float] = None) -> "RetrievalRouter":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            weights = data["weights"].astype(np.float32)
+            bias = float(data["bias"])
+        return cls(weights, bias, threshold if threshold is not None else meta.get("threshold", 0.5), meta)
+
+    def save(self, path: str):
+        meta = {**self.meta, "threshold": self.threshold, "n_features": self.n_features,
+                "char_ngrams": list(self.char_ngrams)}
+        np.savez_compressed(path, weights=self.weights, bias=np.float32(self.bias), meta=json.dumps(meta))
+
+    def predict_proba(self, text: str) -> float:
+        indices, values = featurize(text, self.n_features, self.char_ngrams)
+        logit = float(self.weights[indices] @ values) + self.bias
+        return 1.0 / (1.0 + np.exp(-logit))
+
+    def needs_retrieval(self, text: str) -> bool:
+        self.calls += 1
+        necesita = self.predict_proba(text) >= self.threshold
+        self.positives += necesita
+        return necesita
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retrieval_rate": round(self.positives / self.calls, 4) if self.calls else 0.0,
+            "threshold": self.threshold,
+            "trained_at": self.meta.get("trained_at"),
+        }
+
+
+def load_router() -> Optional[RetrievalRouter]:
+    """ Router configurado por entorno, o None (se usa la heurística de palabras clave). """
+    path = os.getenv("OFFICE_AGENT_ROUTER_MODEL")
+    if not path:
+        return None
+    threshold = os.getenv("OFFICE_AGENT_ROUTER_THRESHOLD")
+    try:
+        router = RetrievalRouter.load(path, float(threshold) if threshold else None)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Router de búsqueda: no se pudo cargar {path} ({e}), usando palabras clave")
+        return None
+    print(f"✓ Router de búsqueda cargado (umbral {router.threshold:.2f})")
+    return router
+
+
+retrieval_router = load_router()
@@ -1,13 +1,27 @@
 import os
-import requests
+import json
+import time
 import asyncio
-from quart import Blueprint, request, jsonify, session
+from quart import Blueprint, Response, current_app, request, jsonify, session
 from openai import AsyncAzureOpenAI, BadRequestError
-from datetime import datetime, timezone
 from backend.database.connection import get_container
-from backend.database.models import ChatSession, ChatMessage
-from pydantic import ValidationError
-from .moderation import check_text_safety
+from backend.database.chat_store import (
+    append_turn, list_chat_headers, get_chat_messages, delete_chat_items, recent_history, save_summary
+)
+from backend.database.write_behind import write_behind
+from backend.database.bulk_delete import delete_by_query, delete_jobs
+from backend.telemetry import stage, llm_calls, llm_tokens
+from .moderation import check_blocklist, check_text_safety
+from .speech import speech_tokens
+from .office_agent import office_agent
+from .vector_index import local_index
+from .retrieval_router import retrieval_router
+from .stats import mode_stats
+from .verdict_cache import verdict_cache
+from .embedding_cache import embedding_cache
+from .semantic_cache import semantic_cache, SEMANTIC_CACHE_ENABLED, EMBEDDING_DEPLOYMENT
+from .prompts import prompt_templates, JUDGE_PROMPT
+from .context import pack, summarize, summary_refresher, CHAT_CONTEXT_MAX_MESSAGES, HISTORY_FETCH_MARGIN
 
 chat_bp = Blueprint('chat', __name__)
 
@@ -32,48 +46,50 @@ async def get_speech_token():
     if not speech_key or not speech_region:
         return jsonify({"error": "Faltan credenciales de voz"}), 500
 
-    fetch_token_url = f"https://{speech_region}.api.cognitive.microsoft.com/sts/v1.0/issueToken"
-    headers = {'Ocp-Apim-Subscription-Key': speech_key}
-    
     try:
-        # Requests es síncrono se manda a un hilo para no bloquear
-        response = await asyncio.to_thread(requests.post, fetch_token_url, headers=headers)
-        access_token = str(response.text)
-        return jsonify({"token": access_token, "region": speech_region})
-    except Exception as e:
-        print(e)
+        # Token compartido por región (se renueva antes de vencer)
+        access_token, expires_in = await speech_tokens.get_token(speech_region, speech_key)
+        return jsonify({"token": access_token, "region": speech_region, "expiresIn": expires_in})
+    except Exception:
         return jsonify({"error": "Error obteniendo token de voz"}), 500
 
 @chat_bp.route('/api/chats', methods=['GET'])
 async def get_chats():
+    """ Lista paginada de chats (id, título, fecha). Los mensajes se piden por chat. """
     container = await get_container()
     if 'user' not in session or not container:
-        return jsonify([]), 200
+        return jsonify({"chats": [], "continuation": None}), 200
     
     user_id = session['user']['oid']
-    query = "SELECT * FROM c WHERE c.userId = @userId AND c.type = 'chat' ORDER BY c.updatedAt DESC"
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    continuation = request.args.get('continuation') or None
     
     try:
-        query_iterable = container.query_items(
-            query=query, 
-            parameters=[{"name": "@userId", "value": user_id}] 
-        )
-        
-        items_crudos = [item async for item in query_iterable]
-        
-        chats_finales = []
-        for item in items_crudos:
-            try:
-                chat_obj = ChatSession(**item)
-                chats_finales.append(chat_obj.model_dump(by_alias=True, mode='json'))
-            except ValidationError as e:
-                print(f"Chat corrupto ignorado (ID: {item.get('id')}): {e}")
-                
-        return jsonify(chats_finales)
+        chats, continuation = await list_chat_headers(container, user_id, limit, continuation)
+        return jsonify({"chats": chats, "continuation": continuation})
 
     except Exception as e:
         print(f"Error leyendo chats: {e}")
-        return jsonify([])
+        return jsonify({"chats": [], "continuation": None})
+
+@chat_bp.route('/api/chats/<chat_id>', methods=['GET'])
+async def get_chat(chat_id):
+    """ Mensajes de un chat, paginados en orden cronológico. """
+    container = await get_container()
+    if 'user' not in session or not container:
+        return jsonify({"error": "401"}), 401
+
+    user_id = session['user']['oid']
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    continuation = request.args.get('continuation') or None
+
+    try:
+        messages, continuation = await get_chat_messages(container, user_id, chat_id, limit, continuation)
+        return jsonify({"id": chat_id, "messages": messages, "continuation": continuation})
+
+    except Exception as e:
+        print(f"Error leyendo chat {chat_id}: {e}")
+        return jsonify({"error": "failed"}), 500
 
 @chat_bp.route('/api/chats', methods=['DELETE'])
 async def delete_all_chats():
@@ -81,23 +97,17 @@ async def delete_all_chats():
     if 'user' not in session or not container:
         return jsonify({"error": "401"}), 401
     user_id = session['user']['oid']
-    try:
-        query = "SELECT * FROM c WHERE c.userId = @userId AND c.type = 'chat'"
-        query_iterable = container.query_items(
-            query=query, 
-            parameters=[{"name": "@userId", "value": user_id}] 
-        )
-        
-        items = []
-        async for item in query_iterable:
-            items.append(item)
-            
-        for item in items:
-            await container.delete_item(item=item['id'], partition_key=user_id)
-            
-        return jsonify({"status": "success"})
-    except Exception as e: 
-        return jsonify({"error": str(e)}), 500
+    params = [{"name": "@userId", "value": user_id}]
+
+    async def borrar_chats(job):
+        # Primero las cabeceras (la lista queda vacía de inmediato) y luego los mensajes
+        await delete_by_query(container, user_id, "SELECT c.id FROM c WHERE c.userId = @userId AND c.type = 'chat'", params, job)
+        await delete_by_query(container, user_id, "SELECT c.id FROM c WHERE c.userId = @userId AND c.type = 'chat_message'", params, job)
+
+    # Sin esto, un turno encolado justo antes se escribiría después y recrearía el chat
+    await write_behind.discard(user_id)
+    job_id = delete_jobs.start("chats", user_id, borrar_chats, container)
+    return jsonify({"status": "accepted", "jobId": job_id}), 202
 
 @chat_bp.route('/api/chats/<chat_id>', methods=['DELETE'])
 async def delete_chat(chat_id):
@@ -105,116 +115,459 @@ async def delete_chat(chat_id):
     if 'user' not in session or not container:
         return jsonify({"error": "401"}), 401
     try:
-        await container.delete_item(item=chat_id, partition_key=session['user']['oid'])
+        await write_behind.discard(session['user']['oid'], chat_id)
+        await delete_chat_items(container, session['user']['oid'], chat_id)
         return jsonify({"status": "success"})
     except Exception: 
         return jsonify({"error": "failed"}), 500
 
-@chat_bp.route('/chat', methods=['POST'])
-async def chat():
-    req = await request.get_json()
-    chat_id = req.get('chatId')
-    app_lang = req.get('lang', 'es')
-    user_message = req.get('message', '')
+def _flagged_payload(user_message, app_lang, severity):
+    """ Respuesta estándar cuando la moderación bloquea el mensaje. """
+    return {
+        "moderation_flagged": True,
+        "ai_response": MODERATION_WARNINGS.get(app_lang, MODERATION_WARNINGS['es']),
+        "severity": severity,
+        "original_message": user_message
+    }
 
-    if not user_message.strip():
-        return jsonify({"response": ""}), 400
-    moderation_result = await asyncio.to_thread(check_text_safety, user_message)
-    if moderation_result['flagged']:
-        warning_message = MODERATION_WARNINGS.get(app_lang, MODERATION_WARNINGS['es'])
-        
-        return jsonify({
-            "moderation_flagged": True,
-            "ai_response": warning_message,
-            "severity": moderation_result['severity'],
-            "original_message": user_message
-        })
-
-    # Le preguntamos a GPT si el mensaje es tóxico antes de responder.
+def _contar_uso(uso, response, llamada=True):
+    """
+    Acumula llamadas y tokens de una respuesta de OpenAI en el dict `uso`.
+    En streaming la llamada se cuenta al abrir el stream y los tokens llegan
+    en el último chunk (llamada=False).
+    """
+    if uso is None:
+        return
+    if llamada:
+        uso["llm_calls"] = uso.get("llm_calls", 0) + 1
+    usage = getattr(response, "usage", None)
+    if usage:
+        uso["prompt_tokens"] = uso.get("prompt_tokens", 0) + (usage.prompt_tokens or 0)
+        uso["completion_tokens"] = uso.get("completion_tokens", 0) + (usage.completion_tokens or 0)
+        # Tokens del prompt que Azure sirvió desde su cache de prefijos
+        details = getattr(usage, "prompt_tokens_details", None)
+        uso["cached_tokens"] = uso.get("cached_tokens", 0) + (getattr(details, "cached_tokens", 0) or 0)
+
+def _registrar_modo(mode, inicio, uso, flagged=False, fallback=False):
+    """ Estadísticas por modo y contadores de Prometheus de una petición atendida. """
+    mode_stats.registrar(mode, (time.perf_counter() - inicio) * 1000, uso, flagged=flagged, fallback=fallback)
+    llm_calls.inc(uso.get("llm_calls", 0), mode=mode)
+    llm_tokens.inc(uso.get("prompt_tokens", 0), mode=mode, kind="prompt")
+    llm_tokens.inc(uso.get("completion_tokens", 0), mode=mode, kind="completion")
+    llm_tokens.inc(uso.get("cached_tokens", 0), mode=mode, kind="cached")
+
+async def _juez_semantico(user_message, uso=None):
+    """ Le preguntamos a GPT si el mensaje es tóxico. Devuelve 'SAFE', 'UNSAFE' o None si falló. """
     try:
-        judge_response = await client.chat.completions.create(
-            model=os.getenv("AZURE_DEPLOYMENT_NAME"),
-            messages=[
-                {"role": "system", "content": """
-                 Role: Content Moderation AI for a Civic App.
-                 Task: Classify the user message.
-                 
-                 BLOCKING RULES (Respond 'UNSAFE'):
-                 1. Discrimination/Hate: Against gender, race, religion, nationality (e.g., "Women can't lead", "X people are bad").
-                 2. Insults/Attacks: Personal attacks (e.g., "You are stupid", "Idiot").
-                 3. Anti-Democratic: Denying human rights (e.g., "Don't vote").
-                 
-                 PASSING RULES (Respond 'SAFE'):
-                 1. Opinions on politics (even negative ones, if respectful).
-                 2. Questions about laws, procedures, or history.
-                 3. Civic criticism.
-                 
-                 Output: Respond ONLY with one word: 'SAFE' or 'UNSAFE'.
-                 """},
-                {"role": "user", "content": user_message}
-            ],
-            temperature=0
-        )
+        with stage("judge"):
+            judge_response = await client.chat.completions.create(
+                model=os.getenv("AZURE_DEPLOYMENT_NAME"),
+                messages=[
+                    {"role": "system", "content": JUDGE_PROMPT},
+                    {"role": "user", "content": user_message}
+                ],
+                temperature=0
+            )
+        _contar_uso(uso, judge_response)
         
         veredicto = judge_response.choices[0].message.content.strip()
         
-        if "UNSAFE" in veredicto:        
-            warning_message = MODERATION_WARNINGS.get(app_lang, MODERATION_WARNINGS['es'])
-
-            return jsonify({
-                "moderation_flagged": True,
-                "ai_response": warning_message, # <-- Enviamos el texto traducido
-                "severity": 5,
-                "original_message": user_message
-            })
+        return "UNSAFE" if "UNSAFE" in veredicto else "SAFE"
 
     except Exception as e:
         print(f"Error en Juez Semántico: {e}")
-    
-    container = await get_container()
-    user = session.get("user")
 
-    now_utc = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M UTC')
+    return None
 
-    # Lógica de contexto de usuario
-    if user and 'dbProfile' in user:
-        profile = user['dbProfile']
-        user_context = f"Usuario: {profile.get('name')}, {profile.get('state')}, {profile.get('country')}"
-    else:
-        user_context = "Usuario Invitado."
-    
-    SYSTEM_PROMPT = f"""
-    ROLE: You are **Civic Knit**, a Digital Civic Assistant specialized in government information, laws, procedures, and public policies. Your main goal is to facilitate civic life by providing clear, accessible, and accurate information.
+def _safety_confiable(moderation_result):
+    """ El resultado solo vale para el cache si Content Safety respondió de verdad (no fail-open/closed). """
+    return moderation_result.get('reason') not in ("API_ERROR", "TIMEOUT", "MODERATION_DISABLED")
+
+async def _moderar_sin_cache(user_message, paralelo=False, uso=None):
+    """
+    Content Safety + juez GPT. Devuelve (veredicto, cacheable) con
+    veredicto = {"flagged": bool, "severity": int}.
 
-    # CORE RULES & CONTEXT
-    1. **IDENTITY:** Be neutral, objective, civic-minded, and strictly professional.
-    2. **LOCATION SCOPE:** Your knowledge base is focused on **Mexico City (CDMX)**. All answers regarding procedures, laws, or programs must be framed within this jurisdiction unless the user explicitly asks about federal topics or another location.
-    3. **KNOWLEDGE PRIORITY (RAG):** You have access to recent legal and normative documents. **YOU MUST PRIORITIZE this information** over your general knowledge to ensure currency and precision. If the context is not relevant, rely on your internal training.
-    4. **MODERATION:** The user's message has already passed a safety filter. Always maintain a **respectful** and **helpful** tone. Never be punitive or repeat safety rules to the user.
+    Con paralelo=True ambos corren a la vez; el primero que bloquee cancela al otro.
+    """
+    if not paralelo:
+        moderation_result = await check_text_safety(user_message, include_blocklist=False)
+        if moderation_result['flagged']:
+            return {"flagged": True, "severity": moderation_result['severity']}, _safety_confiable(moderation_result)
+        juez = await _juez_semantico(user_message, uso)
+        cacheable = juez is not None and _safety_confiable(moderation_result)
+        return {"flagged": juez == "UNSAFE", "severity": 5 if juez == "UNSAFE" else 0}, cacheable
+
+    safety_task = asyncio.create_task(check_text_safety(user_message, include_blocklist=False))
+    judge_task = asyncio.create_task(_juez_semantico(user_message, uso))
+    pendientes = {safety_task, judge_task}
+    cacheable = True
+    try:
+        while pendientes:
+            terminadas, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+            for task in terminadas:
+                if task is safety_task:
+                    moderation_result = task.result()
+                    if moderation_result['flagged']:
+                        return {"flagged": True, "severity": moderation_result['severity']}, _safety_confiable(moderation_result)
+                    cacheable = cacheable and _safety_confiable(moderation_result)
+                else:
+                    juez = task.result()
+                    if juez == "UNSAFE":
+                        return {"flagged": True, "severity": 5}, True
+                    cacheable = cacheable and juez is not None
+        return {"flagged": False, "severity": 0}, cacheable
+    finally:
+        for task in pendientes:
+            task.cancel()
+
+async def _moderar_mensaje(user_message, app_lang, paralelo=False, uso=None):
+    """ Moderación con cache de veredictos. Devuelve el payload de bloqueo o None. """
+    # La blocklist va antes del cache: un término recién agregado aplica aunque haya un SAFE guardado
+    bloqueo = check_blocklist(user_message)
+    if bloqueo:
+        return _flagged_payload(user_message, app_lang, bloqueo['severity'])
+
+    veredicto = verdict_cache.get(user_message)
+    if veredicto is None:
+        with stage("moderation"):
+            veredicto, cacheable = await _moderar_sin_cache(user_message, paralelo=paralelo, uso=uso)
+        if cacheable:
+            verdict_cache.set(user_message, veredicto)
 
-    # OUTPUT INSTRUCTION
-    - **LANGUAGE:** You MUST respond strictly in the language: **{app_lang}**.
-    - **FORMAT:** Use **Markdown** (bolding, lists, headers) to make reading easier.
-    - **CITATIONS:** If you used information from the provided documents, add a reference at the end (e.g., "Source: Official Gazette, Art. 5").
+    if veredicto["flagged"]:
+        return _flagged_payload(user_message, app_lang, veredicto["severity"])
+    return None
 
-    # SESSION DATA
-    - CURRENT DATE UTC: {now_utc}
-    - USER PROFILE: {user_context}
+def _parse_fusionado(content):
+    """ Extrae (unsafe, answer) de la salida estructurada. None si no es válida. """
+    try:
+        data = json.loads(content or "")
+        verdict = str(data.get("verdict", "")).strip().upper()
+        answer = data.get("answer", "")
+    except (ValueError, AttributeError):
+        return None
+    if verdict not in ("SAFE", "UNSAFE") or not isinstance(answer, str):
+        return None
+    if verdict == "SAFE" and not answer.strip():
+        return None
+    return verdict == "UNSAFE", answer
+
+async def _responder_fusionado(user_message, app_lang, messages, paralelo=False, uso=None):
     """
+    Moderación + respuesta en una sola llamada (Content Safety sigue aparte).
+
+    Devuelve (payload de bloqueo o None, respuesta) o None si la salida
+    estructurada no se pudo interpretar y hay que usar el juez por separado.
+    """
+    bloqueo = check_blocklist(user_message)
+    if bloqueo:
+        return _flagged_payload(user_message, app_lang, bloqueo['severity']), None
+
+    # Veredicto en cache: no hace falta pedirlo de nuevo
+    veredicto = verdict_cache.get(user_message)
+    if veredicto is not None:
+        if veredicto["flagged"]:
+            return _flagged_payload(user_message, app_lang, veredicto["severity"]), None
+        return None, await _generar_respuesta(messages, uso)
 
-    from .office_agent import agent
-    agent = agent()
+    fused_messages = [
+        {"role": "system", "content": prompt_templates.prefix(app_lang, "fused")},
+        *messages[1:]
+    ]
 
+    def llamada_fusionada():
+        return client.chat.completions.create(
+            model=os.getenv("AZURE_DEPLOYMENT_NAME"),
+            messages=fused_messages,
+            temperature=0.7,
+            response_format={"type": "json_object"}
+        )
+
+    # En modo especulativo la llamada arranca junto con Content Safety; si no, solo
+    # se crea cuando la moderación pasó (si check_text_safety falla no queda nada colgado)
+    answer_task = asyncio.create_task(llamada_fusionada()) if paralelo else None
     try:
+        moderation_result = await check_text_safety(user_message, include_blocklist=False)
+    except BaseException:
+        if answer_task:
+            await _descartar_especulativa(answer_task)
+        raise
+
+    if moderation_result['flagged']:
+        if answer_task:
+            await _descartar_especulativa(answer_task)
+        if _safety_confiable(moderation_result):
+            verdict_cache.set(user_message, {"flagged": True, "severity": moderation_result['severity']})
+        return _flagged_payload(user_message, app_lang, moderation_result['severity']), None
+
+    with stage("generation"):
+        response = await (answer_task or llamada_fusionada())
+
+    _contar_uso(uso, response)
+    parsed = _parse_fusionado(response.choices[0].message.content)
+    if parsed is None:
+        return None
+
+    unsafe, answer = parsed
+    if unsafe:
+        verdict_cache.set(user_message, {"flagged": True, "severity": 5})
+        return _flagged_payload(user_message, app_lang, 5), None
+    if _safety_confiable(moderation_result):
+        verdict_cache.set(user_message, {"flagged": False, "severity": 0})
+    return None, answer
+
+async def _generar_respuesta(messages, uso=None):
+    """ Llamada de respuesta normal (sin moderación). """
+    with stage("generation"):
         response = await client.chat.completions.create(
             model=os.getenv("AZURE_DEPLOYMENT_NAME"),
-            messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": user_message}],
+            messages=messages,
             temperature=0.7
         )
-        ai_response = response.choices[0].message.content
+    _contar_uso(uso, response)
+    return response.choices[0].message.content
+
+async def _embedding_pregunta(user_message):
+    """ Embedding de la pregunta para el cache semántico (None si falla). """
+    try:
+        with stage("question_embedding"):
+            return await embedding_cache.embed(client, EMBEDDING_DEPLOYMENT, user_message)
+    except Exception as e:
+        print(f"Error generando embedding de la pregunta: {e}")
+        return None
+
+def _scope_semantico(app_lang, user):
+    """
+    Clave del cache semántico: idioma y la parte del perfil que lleva el prompt
+    compartido (estado y país; el nombre no entra, ver _answer_messages).
+    """
+    profile = (user or {}).get('dbProfile')
+    if not profile:
+        return app_lang
+    return f"{app_lang}|{profile.get('state')}|{profile.get('country')}"
+
+async def _lookup_semantico(scope, embedding_task):
+    """ Espera el embedding y busca una respuesta equivalente. Devuelve (embedding, respuesta o None). """
+    embedding = await embedding_task
+    if embedding is None:
+        return None, None
+    return embedding, semantic_cache.lookup(scope, embedding)
+
+async def _responder_con_cache_semantico(user_message, app_lang, user, messages_task, paralelo=False, uso=None):
+    """
+    Moderación (con juez) en paralelo con el embedding de la pregunta y el armado
+    del prompt; si la pregunta pasa y hay una equivalente en cache se devuelve esa
+    respuesta. Los prompts que no son compartibles (con historial, resumen o
+    nombre del usuario, ver _answer_messages) no usan el cache.
+    """
+    embedding_task = asyncio.create_task(_embedding_pregunta(user_message))
+
+    flagged = await _moderar_mensaje(user_message, app_lang, paralelo=paralelo, uso=uso)
+    if flagged:
+        embedding_task.cancel()
+        return flagged, None
+
+    messages, shared = await messages_task
+    if not shared:
+        embedding_task.cancel()
+        return None, await _generar_respuesta(messages, uso)
+
+    scope = _scope_semantico(app_lang, user)
+    embedding, cached = await _lookup_semantico(scope, embedding_task)
+    if cached is not None:
+        return None, cached
+
+    ai_response = await _generar_respuesta(messages, uso)
+    if embedding is not None and ai_response:
+        semantic_cache.store(scope, embedding, ai_response)
+    return None, ai_response
+
+async def _responder_con_juez(user_message, app_lang, messages_task, paralelo=False, uso=None):
+    """
+    Flujo de dos llamadas: moderación (Content Safety + juez) y luego la respuesta.
+    El prompt (`messages_task`) se arma mientras corre la moderación.
+    """
+    # Modo especulativo: la respuesta arranca en cuanto el prompt está listo, sin esperar la moderación
+    answer_task = None
+    if paralelo:
+        answer_task = asyncio.create_task(_generacion_especulativa(messages_task))
+
+    flagged = await _moderar_mensaje(user_message, app_lang, paralelo=paralelo, uso=uso)
+    if flagged:
+        if answer_task:
+            await _descartar_especulativa(answer_task)
+        return flagged, None
+
+    if not answer_task:
+        messages, _ = await messages_task
+        return None, await _generar_respuesta(messages, uso)
+
+    # Con generación especulativa solo se mide lo que queda por esperar
+    with stage("generation"):
+        response = await answer_task
+    _contar_uso(uso, response)
+    return None, response.choices[0].message.content
+
+async def _generacion_especulativa(messages_task, **kwargs):
+    """ Llamada de respuesta que espera el prompt (para lanzarla junto con la moderación). """
+    messages, _ = await messages_task
+    return await client.chat.completions.create(
+        model=os.getenv("AZURE_DEPLOYMENT_NAME"),
+        messages=messages,
+        temperature=0.7,
+        **kwargs
+    )
+
+async def _descartar_especulativa(answer_task):
+    """ Cancela (o cierra) una generación especulativa que ya no se va a usar. """
+    if not answer_task.done():
+        answer_task.cancel()
+        return
+    if answer_task.cancelled() or answer_task.exception():
+        return
+    # Si era un stream ya abierto, liberamos la conexión
+    result = answer_task.result()
+    if hasattr(result, "close"):
+        await result.close()
+
+async def _contexto_documentos(user_message):
+    """ Documentos de la gaceta para la pregunta ("" si el agente no está activo). """
+    if not office_agent.running:
+        return ""
+    with stage("retrieval"):
+        return await office_agent.contexto_documentos(user_message)
+
+async def _historial(container, user, chat_id):
+    """
+    Turnos anteriores del chat y su resumen: (mensajes, resumen, summaryUpTo).
+    Incluye los turnos que siguen en la cola write-behind (aún no están en Cosmos).
+    """
+    if not (current_app.config.get("CHAT_HISTORY_ENABLED") and container and user and chat_id):
+        return [], None, None
+    user_id = user.get("oid")
+    try:
+        with stage("history"):
+            mensajes, resumen, hasta = await recent_history(
+                container, user_id, chat_id, CHAT_CONTEXT_MAX_MESSAGES + HISTORY_FETCH_MARGIN)
+    except Exception as e:
+        print(f"Error leyendo el historial: {e}")
+        mensajes, resumen, hasta = [], None, None
+
+    guardados = {m["key"] for m in mensajes}
+    for pregunta, respuesta, timestamp in write_behind.pending_turns(user_id, chat_id):
+        for n, (role, text) in enumerate((("user", pregunta), ("assistant", respuesta))):
+            if f"{timestamp}_{n}" not in guardados:
+                mensajes.append({"role": role, "content": text, "key": f"{timestamp}_{n}"})
+    return mensajes, resumen, hasta
+
+def _programar_resumen(container, user_id, chat_id, resumen, overflow):
+    """ Agrega al resumen del chat los mensajes que salieron de la ventana (en segundo plano). """
+    async def actualizar():
+        with stage("summary"):
+            nuevo = await summarize(client, os.getenv("AZURE_DEPLOYMENT_NAME"), resumen, overflow)
+        if nuevo:
+            await save_summary(container, user_id, chat_id, nuevo, overflow[-1]["key"])
+    summary_refresher.schedule(f"{user_id}:{chat_id}", actualizar)
+
+async def _answer_messages(app_lang, user, user_message, container=None, chat_id=None):
+    """
+    Mensajes para la llamada de respuesta: prefijo precompilado del idioma,
+    resumen e historial del chat dentro del presupuesto de tokens del deployment
+    y al final lo que cambia en cada request (fecha y perfil, documentos de la
+    gaceta si el agente está activo, la pregunta).
+
+    Devuelve (messages, shared): `shared` indica que el prompt no depende del
+    usuario ni de la conversación y su respuesta puede ir al cache semántico.
+    Es la única fuente de esa decisión (prompt, búsqueda y guardado en el cache).
+    """
+    contexto, (historial, resumen, hasta) = await asyncio.gather(
+        _contexto_documentos(user_message), _historial(container, user, chat_id)
+    )
+    prefix = [{"role": "system", "content": prompt_templates.prefix(app_lang)}]
+    # Sin historial la respuesta puede ir al cache semántico y servirse a otros usuarios:
+    # el prompt no lleva el nombre del usuario
+    shared = SEMANTIC_CACHE_ENABLED and not historial and not resumen
+    tail = prompt_templates.tail(user, contexto, user_message, shared=shared)
+
+    messages, overflow, stats = pack(os.getenv("AZURE_DEPLOYMENT_NAME"), prefix, historial, tail, resumen, hasta)
+    prompt_templates.record(stats["sections"])
+    if overflow:
+        _programar_resumen(container, user.get("oid"), chat_id, resumen, overflow)
+    return messages, shared
+
+async def _guardar_turno(container, user, chat_id, user_message, ai_response):
+    """ Persiste el turno (pregunta + respuesta) como items append-only del chat. """
+    if not (user and chat_id and ai_response):
+        return
+    if not container and not write_behind.running:
+        return
+
+    # Write-behind: el worker lo guarda en segundo plano; si no se pudo encolar, en línea
+    if await write_behind.enqueue(user.get("oid"), chat_id, user_message, ai_response):
+        return
+
+    try:
+        with stage("persist"):
+            await append_turn(container, user.get("oid"), chat_id, user_message, ai_response)
+    except Exception as e:
+        print(f"Error guardando: {e}")
+
+def _sse(event, data):
+    """ Serializa un frame Server-Sent Events. """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@chat_bp.route('/chat', methods=['POST'])
+async def chat():
+    req = await request.get_json()
+    chat_id = req.get('chatId')
+    app_lang = req.get('lang', 'es')
+    user_message = req.get('message', '')
+
+    if not user_message.strip():
+        return jsonify({"response": ""}), 400
+
+    container = await get_container()
+    user = session.get("user")
+
+    # Documentos e historial se buscan mientras corre la moderación
+    messages_task = asyncio.create_task(_answer_messages(app_lang, user, user_message, container, chat_id))
+    speculative = current_app.config.get("CHAT_SPECULATIVE_GENERATION")
+    mode = current_app.config.get("CHAT_MODERATION_MODE", "judge")
+
+    uso = {}
+    fallback = False
+    flagged = False
+    # Modo con el que se atendió de verdad: "fused" solo si se hizo la llamada fusionada
+    # (los turnos que van al cache semántico pasan por el juez aunque el modo sea "fused")
+    efectivo = "judge"
+    inicio = time.perf_counter()
+    try:
+        resultado = None
+        if mode == "fused":
+            # La llamada fusionada lleva la respuesta: necesita el prompt completo desde el inicio
+            messages, shared = await messages_task
+            if not shared:
+                efectivo = "fused"
+                resultado = await _responder_fusionado(user_message, app_lang, messages, paralelo=speculative, uso=uso)
+                if resultado is None:
+                    # Salida estructurada ilegible: volvemos al juez por separado
+                    print("Salida fusionada inválida, usando juez semántico")
+                    fallback = True
+        if resultado is None and SEMANTIC_CACHE_ENABLED and not fallback:
+            # El cache semántico necesita el veredicto antes de buscar: usa el juez por separado
+            # (los seguimientos no se buscan en el cache: dependen de la conversación)
+            resultado = await _responder_con_cache_semantico(user_message, app_lang, user, messages_task, paralelo=speculative, uso=uso)
+        if resultado is None:
+            resultado = await _responder_con_juez(user_message, app_lang, messages_task, paralelo=speculative, uso=uso)
+
+        flagged, ai_response = resultado
+        if flagged:
+            return jsonify(flagged)
 
     except BadRequestError as e:
         if e.code == 'content_filter':
+            flagged = True
             return jsonify({
                 "moderation_flagged": True,
                 "ai_response": "Contenido bloqueado por las políticas de seguridad de Azure AI.",
@@ -224,23 +577,172 @@ async def chat():
         ai_response = "Error en la solicitud."
     except Exception as e:
         ai_response = f"Error {e} de conexión."
+    finally:
+        # Mensaje bloqueado o error: el prompt ya no se usa
+        if not messages_task.done():
+            messages_task.cancel()
+        # También se cuentan los errores y los bloqueos de content_filter
+        _registrar_modo(efectivo, inicio, uso, flagged=bool(flagged), fallback=fallback)
 
     # Persistencia (Guardar chat)
-    if user and container and chat_id and ai_response:
-        # (Tu lógica de guardado sigue igual aquí...)
-        user_id = user.get("oid")
+    await _guardar_turno(container, user, chat_id, user_message, ai_response)
+
+    return jsonify({"response": ai_response})
+
+@chat_bp.route('/api/chat/stats', methods=['GET'])
+async def get_chat_stats():
+    """ Contadores por modo de moderación (llamadas, tokens, latencia) y del cache de veredictos. """
+    return jsonify({
+        "modes": mode_stats.snapshot(),
+        "moderation_cache": verdict_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "local_vector_index": local_index.stats(),
+        "retrieval_router": retrieval_router.stats() if retrieval_router else None,
+        "write_behind": write_behind.stats(),
+        "speech_tokens": speech_tokens.stats(),
+        "conversation_context": summary_refresher.stats(),
+        "prompt_sections": prompt_templates.stats()
+    })
+
+@chat_bp.route('/chat/stream', methods=['POST'])
+async def chat_stream():
+    """
+    Variante en streaming de /chat (Server-Sent Events).
+    Siempre usa el juez por separado: la salida JSON del modo fusionado no se puede emitir
+    por deltas, así que CHAT_MODERATION_MODE solo aplica a /chat. Estas peticiones se
+    registran en las estadísticas por modo como "judge".
+
+    Frames emitidos:
+        moderation -> {"flagged": bool, ...payload de bloqueo si aplica}
+        delta      -> {"text": fragmento de la respuesta}
+        done       -> {"response": respuesta completa}
+    """
+    req = await request.get_json()
+    chat_id = req.get('chatId')
+    app_lang = req.get('lang', 'es')
+    user_message = req.get('message', '')
+
+    if not user_message.strip():
+        return jsonify({"response": ""}), 400
+
+    # La sesión solo es accesible dentro del request, la leemos antes de generar
+    container = await get_container()
+    user = session.get("user")
+
+    # Documentos e historial se buscan mientras corre la moderación (la tarea
+    # se crea aquí, dentro del request, para que conserve su contexto)
+    messages_task = asyncio.create_task(_answer_messages(app_lang, user, user_message, container, chat_id))
+    speculative = current_app.config.get("CHAT_SPECULATIVE_GENERATION")
+    uso = {}
+
+    async def generate():
+        inicio = time.perf_counter()
+        resultado = {"flagged": False}
         try:
-            try:
-                chat_doc = await container.read_item(item=chat_id, partition_key=user_id)
-                chat_session = ChatSession(**chat_doc)
-            except Exception:
-                chat_session = ChatSession(id=chat_id, userId=user_id, title=user_message[:30]+"...", messages=[])
-            
-            chat_session.messages.append(ChatMessage(role="user", text=user_message))
-            chat_session.messages.append(ChatMessage(role="ai", text=ai_response))
-            chat_session.updatedAt = datetime.now(timezone.utc).isoformat()
-            await container.upsert_item(body=chat_session.model_dump())
+            async for frame in _stream_frames(resultado):
+                yield frame
+        finally:
+            # Mensaje bloqueado, error o cliente desconectado: el prompt ya no se usa
+            if not messages_task.done():
+                messages_task.cancel()
+            _registrar_modo("judge", inicio, uso, flagged=resultado["flagged"])
+
+    async def _stream_frames(resultado):
+        # Modo especulativo: abrimos el stream en cuanto el prompt está listo, mientras corre la moderación
+        answer_task = None
+        if speculative:
+            answer_task = asyncio.create_task(_generacion_especulativa(
+                messages_task, stream=True, stream_options={"include_usage": True}))
+
+        embedding_task = None
+        if SEMANTIC_CACHE_ENABLED:
+            embedding_task = asyncio.create_task(_embedding_pregunta(user_message))
+
+        flagged = await _moderar_mensaje(user_message, app_lang, paralelo=speculative, uso=uso)
+        if flagged:
+            resultado["flagged"] = True
+            if answer_task:
+                await _descartar_especulativa(answer_task)
+            if embedding_task:
+                embedding_task.cancel()
+            yield _sse("moderation", {"flagged": True, **flagged})
+            yield _sse("done", {"response": flagged["ai_response"]})
+            return
+
+        yield _sse("moderation", {"flagged": False})
+
+        partes = []
+        embedding = None
+        try:
+            messages, shared = await messages_task
+            if embedding_task and not shared:
+                # El prompt depende del usuario o de la conversación: no se busca en el cache
+                embedding_task.cancel()
+                embedding_task = None
+
+            if embedding_task:
+                embedding, cached = await _lookup_semantico(_scope_semantico(app_lang, user), embedding_task)
+                if cached is not None:
+                    if answer_task:
+                        await _descartar_especulativa(answer_task)
+                    yield _sse("delta", {"text": cached})
+                    await _guardar_turno(container, user, chat_id, user_message, cached)
+                    yield _sse("done", {"response": cached})
+                    return
+
+            if answer_task:
+                stream = await answer_task
+            else:
+                stream = await client.chat.completions.create(
+                    model=os.getenv("AZURE_DEPLOYMENT_NAME"),
+                    messages=messages,
+                    temperature=0.7,
+                    stream=True,
+                    # El último chunk trae los tokens de la llamada
+                    stream_options={"include_usage": True}
+                )
+            _contar_uso(uso, stream)
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    _contar_uso(uso, chunk, llamada=False)
+                # Azure manda un primer chunk sin choices (prompt_filter_results); el último, el del uso, tampoco trae
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    partes.append(delta)
+                    yield _sse("delta", {"text": delta})
+
+            if embedding is not None and partes:
+                semantic_cache.store(_scope_semantico(app_lang, user), embedding, "".join(partes))
+
+        except BadRequestError as e:
+            if e.code == 'content_filter':
+                resultado["flagged"] = True
+                blocked = {
+                    "moderation_flagged": True,
+                    "ai_response": "Contenido bloqueado por las políticas de seguridad de Azure AI.",
+                    "severity": 2,
+                    "original_message": user_message
+                }
+                yield _sse("moderation", {"flagged": True, **blocked})
+                yield _sse("done", {"response": blocked["ai_response"]})
+                return
+            partes = ["Error en la solicitud."]
         except Exception as e:
-            print(f"Error guardando: {e}")
+            partes = [f"Error {e} de conexión."]
+
+        ai_response = "".join(partes)
+
+        # Persistencia (Guardar chat) antes de cerrar el stream
+        await _guardar_turno(container, user, chat_id, user_message, ai_response)
+
+        yield _sse("done", {"response": ai_response})
 
-    return jsonify({"response": ai_response})
\ No newline at end of file
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Evita que proxies (App Service / nginx) acumulen el stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.timeout = None
+    return response
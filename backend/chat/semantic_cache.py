@@ -0,0 +1,205 @@
+import os
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import List, Optional
+
+# Histograma de similitud del mejor vecino: 20 cubetas de 0.05 entre 0 y 1
+HISTOGRAM_BINS = 20
+# Filas con las que arranca la matriz de un ámbito; se duplica al llenarse
+INITIAL_CAPACITY = 16
+
+
+class _LangIndex:
+    """
+    Matriz float32 normalizada (cola circular) con las respuestas de un ámbito.
+    Arranca chica y duplica su capacidad al llenarse, sin pasar de max_capacity.
+    """
+
+    def __init__(self, dim: int, max_capacity: int):
+        capacity = max(1, min(INITIAL_CAPACITY, max_capacity))
+        self.max_capacity = max_capacity
+        self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.expires_at = np.zeros(capacity, dtype=np.float64)  # 0 = vacío
+        self.answers: List[Optional[str]] = [None] * capacity
+        self.start = 0  # posición de la entrada más vieja
+        self.size = 0
+
+    def _grow(self):
+        """ Duplica la capacidad dejando las entradas en orden desde la posición 0. """
+        capacity = len(self.answers)
+        orden = [(self.start + i) % capacity for i in range(self.size)]
+        nueva = min(capacity * 2, self.max_capacity)
+        matrix = np.zeros((nueva, self.matrix.shape[1]), dtype=np.float32)
+        matrix[:self.size] = self.matrix[orden]
+        expires_at = np.zeros(nueva, dtype=np.float64)
+        expires_at[:self.size] = self.expires_at[orden]
+        self.answers = [self.answers[i] for i in orden] + [None] * (nueva - self.size)
+        self.matrix, self.expires_at, self.start = matrix, expires_at, 0
+
+    def add(self, vector: np.ndarray, answer: str, expires_at: float):
+        """ Agrega la entrada (quien llama libera lugar antes si se llegó al tope). """
+        if self.size == len(self.answers):
+            self._grow()
+        slot = (self.start + self.size) % len(self.answers)
+        self.matrix[slot] = vector
+        self.expires_at[slot] = expires_at
+        self.answers[slot] = answer
+        self.size += 1
+
+    def pop_oldest(self):
+        """ Descarta la entrada más vieja del ámbito. """
+        slot = self.start
+        self.expires_at[slot] = 0
+        self.answers[slot] = None
+        self.start = (slot + 1) % len(self.answers)
+        self.size -= 1
+
+    def best(self, vector: np.ndarray, now: float):
+        """ (similitud, respuesta) del vecino vigente más cercano, o (None, None). """
+        vigentes = self.expires_at > now
+        if not vigentes.any():
+            return None, None
+        sims = self.matrix @ vector
+        sims[~vigentes] = -np.inf
+        idx = int(np.argmax(sims))
+        return float(sims[idx]), self.answers[idx]
+
+
+class SemanticCache:
+    """
+    Cache semántico de respuestas: preguntas parecidas (coseno >= threshold)
+    en el mismo ámbito reutilizan la respuesta guardada. El ámbito es el idioma
+    más lo que la respuesta puede depender del usuario (lo arma quien llama).
+
+    El índice vive en memoria (una matriz float32 por ámbito), así que la
+    búsqueda es un producto matriz-vector. Se invalida completo cuando cambia
+    el marcador de versión del corpus (lo actualiza la ingesta de gacetas).
+
+    `max_entries` es el tope global: los ámbitos salen del perfil (estado y
+    país son texto libre), así que al llegar al tope se descarta la entrada
+    más vieja del ámbito usado hace más tiempo (LRU sobre ámbitos).
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 7 * 86400, max_entries: int = 5000,
+                 corpus_marker: Optional[str] = None, marker_check_interval: float = 30.0):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.corpus_marker = corpus_marker
+        self.marker_check_interval = marker_check_interval
+        self._indexes = OrderedDict()
+        self._entries = 0
+        self._corpus_version = self._read_marker()
+        self._marker_checked_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.histogram = [0] * HISTOGRAM_BINS
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _read_marker(self):
+        if not self.corpus_marker:
+            return None
+        try:
+            with open(self.corpus_marker, "r", encoding="utf-8") as f:
+                return f.read().strip() or str(os.path.getmtime(self.corpus_marker))
+        except OSError:
+            return None
+
+    def _check_corpus(self):
+        now = time.monotonic()
+        if not self.corpus_marker or now - self._marker_checked_at < self.marker_check_interval:
+            return
+        self._marker_checked_at = now
+        version = self._read_marker()
+        if version != self._corpus_version:
+            print(f"Semantic cache: corpus actualizado ({self._corpus_version} -> {version}), invalidando")
+            self._corpus_version = version
+            self.invalidate()
+
+    def invalidate(self):
+        """ Descarta todas las respuestas guardadas. """
+        self._indexes = OrderedDict()
+        self._entries = 0
+        self.invalidations += 1
+
+    def lookup(self, scope: str, embedding) -> Optional[str]:
+        """ Respuesta guardada para una pregunta equivalente, o None. """
+        self._check_corpus()
+        index = self._indexes.get(scope)
+        if index is None:
+            self.misses += 1
+            return None
+        self._indexes.move_to_end(scope)
+
+        similarity, answer = index.best(self._normalize(embedding), time.time())
+        if similarity is not None:
+            bucket = min(max(int(similarity * HISTOGRAM_BINS), 0), HISTOGRAM_BINS - 1)
+            self.histogram[bucket] += 1
+
+        if similarity is not None and similarity >= self.threshold:
+            self.hits += 1
+            return answer
+        self.misses += 1
+        return None
+
+    def store(self, scope: str, embedding, answer: str):
+        """ Guarda la respuesta generada para la pregunta. """
+        if self.max_entries <= 0:
+            return
+        vector = self._normalize(embedding)
+        index = self._indexes.get(scope)
+        if index is not None and index.matrix.shape[1] != vector.shape[0]:
+            # Cambió el modelo de embeddings: lo guardado en el ámbito ya no sirve
+            self._entries -= index.size
+            del self._indexes[scope]
+
+        if self._entries >= self.max_entries:
+            self._evict()
+        index = self._indexes.get(scope)
+        if index is None:
+            index = self._indexes[scope] = _LangIndex(vector.shape[0], self.max_entries)
+        self._indexes.move_to_end(scope)
+        index.add(vector, answer, time.time() + self.ttl)
+        self._entries += 1
+
+    def _evict(self):
+        """ Libera una entrada: la más vieja del ámbito menos usado (se borra si queda vacío). """
+        scope, index = next(iter(self._indexes.items()))
+        index.pop_oldest()
+        self._entries -= 1
+        if index.size == 0:
+            del self._indexes[scope]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        now = time.time()
+        return {
+            "entries": {scope: int((idx.expires_at > now).sum()) for scope, idx in self._indexes.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+            "threshold": self.threshold,
+            "similarity_histogram": {
+                f"{i / HISTOGRAM_BINS:.2f}-{(i + 1) / HISTOGRAM_BINS:.2f}": count
+                for i, count in enumerate(self.histogram)
+            },
+        }
+
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+EMBEDDING_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-ada-002")
+
+semantic_cache = SemanticCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", str(7 * 86400))),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000")),
+    corpus_marker=os.getenv("SEMANTIC_CACHE_CORPUS_MARKER") or None
+)
@@ -0,0 +1,134 @@
+"""
+Estructuras de memoria fija para métricas de un proceso de vida larga.
+
+- SpaceSaving: los k elementos más frecuentes de un flujo (heavy hitters).
+  Cada conteo reportado sobreestima el real a lo más en su `error`.
+- HyperLogLog: número aproximado de elementos distintos (~3% de error con
+  1024 registros) que se puede unir entre buckets.
+- DayBuckets: anillo de contadores diarios para ventanas de los últimos N días.
+"""
+
+import hashlib
+from datetime import date
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class SpaceSaving:
+    """ Top-k aproximado con `capacity` contadores (algoritmo Space-Saving). """
+
+    def __init__(self, capacity: int = 200):
+        self.capacity = capacity
+        self._counts: Dict[str, list] = {}  # clave -> [conteo, error]
+
+    def add(self, key: str, count: int = 1):
+        entry = self._counts.get(key)
+        if entry is not None:
+            entry[0] += count
+            return
+        if len(self._counts) < self.capacity:
+            self._counts[key] = [count, 0]
+            return
+        # Se reemplaza al menor: el nuevo hereda su conteo como error máximo
+        menor = min(self._counts, key=lambda k: self._counts[k][0])
+        minimo = self._counts.pop(menor)[0]
+        self._counts[key] = [minimo + count, minimo]
+
+    def top(self, n: int = 10) -> List[tuple]:
+        """ [(clave, conteo)] de mayor a menor, como Counter.most_common. """
+        ordenados = sorted(self._counts.items(), key=lambda item: item[1][0], reverse=True)
+        return [(key, entry[0]) for key, entry in ordenados[:n]]
+
+    def items(self) -> Dict[str, int]:
+        return {key: entry[0] for key, entry in self._counts.items()}
+
+    def __len__(self):
+        return len(self._counts)
+
+
+class HyperLogLog:
+    """ Cardinalidad aproximada con 2**precision registros de un byte. """
+
+    def __init__(self, precision: int = 10):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, key: str):
+        h = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+        idx = h >> (64 - self.precision)
+        resto = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - resto.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def clear(self):
+        self.registers[:] = 0
+
+    @staticmethod
+    def estimate(registers: np.ndarray) -> int:
+        m = len(registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimacion = alpha * m * m / float(np.sum(np.ldexp(1.0, -registers.astype(np.int32))))
+        ceros = int(np.count_nonzero(registers == 0))
+        if estimacion <= 2.5 * m and ceros:
+            # Rango bajo: conteo lineal (prácticamente exacto con pocos elementos)
+            estimacion = m * np.log(m / ceros)
+        return int(round(estimacion))
+
+
+class _DayBucket:
+    __slots__ = ("day", "count", "similarity_sum", "distinct")
+
+    def __init__(self, precision: int):
+        self.day: Optional[int] = None
+        self.count = 0
+        self.similarity_sum = 0.0
+        self.distinct = HyperLogLog(precision)
+
+
+class DayBuckets:
+    """
+    Contadores por día en un anillo de `days` posiciones: un día nuevo
+    reutiliza el bucket de hace `days` días. Consultar una ventana cuesta
+    O(días), sin importar cuántos eventos hubo.
+    """
+
+    def __init__(self, days: int = 30, precision: int = 10):
+        self.days = days
+        self._buckets = [_DayBucket(precision) for _ in range(days)]
+
+    def _bucket(self, today: int) -> Optional[_DayBucket]:
+        bucket = self._buckets[today % self.days]
+        if bucket.day is not None and bucket.day > today:
+            # Un evento más viejo que el anillo (reloj movido hacia atrás)
+            return None
+        if bucket.day != today:
+            bucket.day = today
+            bucket.count = 0
+            bucket.similarity_sum = 0.0
+            bucket.distinct.clear()
+        return bucket
+
+    def add(self, key: str, similarity: float, today: Optional[date] = None):
+        bucket = self._bucket((today or date.today()).toordinal())
+        if bucket is None:
+            return
+        bucket.count += 1
+        bucket.similarity_sum += similarity
+        bucket.distinct.add(key)
+
+    def window(self, dias: int, today: Optional[date] = None) -> Dict:
+        """ Agregados de los últimos `dias` días (hoy incluido; máximo `days`). """
+        hoy = (today or date.today()).toordinal()
+        dias = max(0, min(dias, self.days))
+        vigentes = [b for b in self._buckets if b.day is not None and 0 <= hoy - b.day < dias]
+        count = sum(b.count for b in vigentes)
+        distintos = 0
+        if vigentes:
+            distintos = HyperLogLog.estimate(np.maximum.reduce([b.distinct.registers for b in vigentes]))
+        return {
+            "count": count,
+            "distinct": distintos,
+            "similarity_sum": sum(b.similarity_sum for b in vigentes),
+        }
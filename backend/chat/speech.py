@@ -0,0 +1,100 @@
+"""
+Tokens de Azure Speech compartidos por región.
+
+El STS de Azure entrega tokens válidos por 10 minutos. Guardamos uno por
+región y lo renovamos en segundo plano antes de que venza; las renovaciones
+simultáneas se juntan en una sola llamada (single-flight).
+"""
+
+import os
+import time
+import asyncio
+import httpx
+
+# Vigencia del token de Azure (segundos)
+TOKEN_TTL = 600
+# A partir de esta edad se sirve el token actual y se renueva en segundo plano
+SPEECH_TOKEN_REFRESH_AFTER = float(os.getenv("SPEECH_TOKEN_REFRESH_AFTER", "480"))
+# Margen para no entregar un token a punto de vencer
+EXPIRY_MARGIN = 30
+
+
+class SpeechTokenService:
+
+    def __init__(self, refresh_after: float = SPEECH_TOKEN_REFRESH_AFTER, timeout: float = 5.0):
+        self.refresh_after = refresh_after
+        self.timeout = timeout
+        self._client = None
+        self._tokens = {}     # region -> (token, emitido en monotonic)
+        self._inflight = {}   # region -> Task de renovación en curso
+        self.sts_calls = 0
+        self.hits = 0
+        self.errors = 0
+
+    def start(self):
+        """ Cliente HTTP asíncrono con keep-alive (en before_serving). """
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+
+    async def close(self):
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_token(self, region: str, key: str):
+        """ Devuelve (token, segundos de vigencia restantes). """
+        cached = self._tokens.get(region)
+        now = time.monotonic()
+        if cached:
+            token, issued_at = cached
+            age = now - issued_at
+            if age < TOKEN_TTL - EXPIRY_MARGIN:
+                self.hits += 1
+                if age >= self.refresh_after:
+                    # Refresh-ahead: el que pide no espera la renovación
+                    self._refresh(region, key)
+                return token, int(TOKEN_TTL - age)
+
+        token, issued_at = await asyncio.shield(self._refresh(region, key))
+        return token, int(TOKEN_TTL - (time.monotonic() - issued_at))
+
+    def _refresh(self, region: str, key: str) -> asyncio.Task:
+        """ Una sola renovación por región a la vez; los demás esperan la misma tarea. """
+        task = self._inflight.get(region)
+        if task is None or task.done():
+            task = asyncio.create_task(self._fetch(region, key))
+            self._inflight[region] = task
+            task.add_done_callback(self._on_refresh_done)
+        return task
+
+    def _on_refresh_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            # Se registra aquí para que una renovación de fondo fallida no quede sin leer
+            print(f"Error renovando token de voz: {task.exception()}")
+
+    async def _fetch(self, region: str, key: str):
+        self.start()
+        url = f"https://{region}.api.cognitive.microsoft.com/sts/v1.0/issueToken"
+        self.sts_calls += 1
+        try:
+            response = await self._client.post(url, headers={'Ocp-Apim-Subscription-Key': key})
+            response.raise_for_status()
+        except Exception:
+            self.errors += 1
+            raise
+        entry = (response.text, time.monotonic())
+        self._tokens[region] = entry
+        return entry
+
+    def stats(self) -> dict:
+        return {
+            "regions": list(self._tokens),
+            "sts_calls": self.sts_calls,
+            "hits": self.hits,
+            "errors": self.errors,
+        }
+
+
+speech_tokens = SpeechTokenService()
@@ -0,0 +1,45 @@
+from collections import defaultdict
+
+
+class ModeStats:
+    """ Contadores por modo de moderación (judge / fused) para comparar costo y latencia. """
+
+    def __init__(self):
+        self._por_modo = defaultdict(lambda: {
+            "requests": 0,
+            "flagged": 0,
+            "fallbacks": 0,
+            "llm_calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_tokens": 0,
+            "latency_ms_total": 0.0,
+        })
+
+    def registrar(self, modo: str, latency_ms: float, uso: dict, flagged: bool = False, fallback: bool = False):
+        """ Acumula una petición atendida en el modo indicado. """
+        stats = self._por_modo[modo]
+        stats["requests"] += 1
+        stats["flagged"] += int(flagged)
+        stats["fallbacks"] += int(fallback)
+        stats["llm_calls"] += uso.get("llm_calls", 0)
+        stats["prompt_tokens"] += uso.get("prompt_tokens", 0)
+        stats["completion_tokens"] += uso.get("completion_tokens", 0)
+        stats["cached_tokens"] += uso.get("cached_tokens", 0)
+        stats["latency_ms_total"] += latency_ms
+
+    def snapshot(self) -> dict:
+        """ Copia de los contadores con promedios por petición. """
+        resultado = {}
+        for modo, stats in self._por_modo.items():
+            requests = stats["requests"] or 1
+            resultado[modo] = {
+                **stats,
+                "latency_ms_avg": round(stats["latency_ms_total"] / requests, 1),
+                "llm_calls_avg": round(stats["llm_calls"] / requests, 2),
+                "tokens_avg": round((stats["prompt_tokens"] + stats["completion_tokens"]) / requests, 1),
+            }
+        return resultado
+
+
+mode_stats = ModeStats()
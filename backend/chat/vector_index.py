@@ -0,0 +1,237 @@
+"""
+Índice vectorial local (memory-mapped) de los chunks de la gaceta.
+
+Lo genera infra/script/rag/export-vector-index.py en un directorio con una
+carpeta por versión y un archivo CURRENT que apunta a la vigente:
+
+    <dir>/CURRENT                 nombre de la versión vigente (se reemplaza con os.replace)
+    <dir>/<versión>/manifest.json count, dim y, si aplica, las particiones IVF
+    <dir>/<versión>/vectors.f32   matriz N x dim float32, filas normalizadas
+    <dir>/<versión>/centroids.f32 centroides IVF (opcional)
+    <dir>/<versión>/meta.jsonl    id, texto y metadata de cada fila
+    <dir>/<versión>/meta.idx      offsets int64 de cada línea de meta.jsonl
+
+Todo se abre con mmap en solo lectura: los workers de Hypercorn comparten las
+mismas páginas del page cache del sistema y ninguno guarda una copia propia.
+Una reconstrucción crea otra versión y cambia CURRENT; cada worker la detecta
+y cambia de índice en una sola asignación. La versión anterior se cierra
+(descriptor y mmaps) pasado un margen, cuando ya no quedan búsquedas sobre ella.
+"""
+
+import os
+import json
+import time
+import threading
+import numpy as np
+from typing import Dict, List, Optional
+
+# Filas por bloque en la búsqueda exacta (acota la memoria temporal de Q @ V.T)
+BLOCK_ROWS = 65536
+
+
+class _IndexVersion:
+    """ Una versión exportada del índice, abierta con mmap. """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.path = path
+        self.count = self.manifest["count"]
+        self.dim = self.manifest["dim"]
+        self.vectors = np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r",
+                                 shape=(self.count, self.dim))
+        self.offsets = np.memmap(os.path.join(path, "meta.idx"), dtype=np.int64, mode="r")
+        self._meta_file = open(os.path.join(path, "meta.jsonl"), "rb")
+
+        ivf = self.manifest.get("ivf")
+        self.centroids = None
+        self.list_offsets = None
+        if ivf:
+            self.centroids = np.memmap(os.path.join(path, "centroids.f32"), dtype=np.float32, mode="r",
+                                       shape=(ivf["nlist"], self.dim))
+            self.list_offsets = np.asarray(ivf["offsets"], dtype=np.int64)
+
+    def meta(self, row: int) -> dict:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(os.pread(self._meta_file.fileno(), end - start, start))
+
+    def close(self):
+        """ Cierra meta.jsonl y suelta los mmaps (se desmapean al soltar la última referencia). """
+        if self._meta_file is not None:
+            self._meta_file.close()
+            self._meta_file = None
+        self.vectors = self.offsets = self.centroids = None
+
+
+def _merge_topk(best_scores, best_rows, scores, rows, k):
+    """ Junta los mejores k actuales con un bloque nuevo (por fila de consulta). """
+    if best_scores is not None:
+        scores = np.concatenate([best_scores, scores], axis=1)
+        rows = np.concatenate([best_rows, rows], axis=1)
+    if scores.shape[1] > k:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, top, axis=1)
+        rows = np.take_along_axis(rows, top, axis=1)
+    return scores, rows
+
+
+class LocalVectorIndex:
+    """
+    Búsqueda top-k por similitud coseno sobre el índice exportado.
+
+    Modo exacto: producto matriz-matriz por bloques (varias consultas a la vez).
+    Modo IVF (si el índice trae particiones): solo se recorren las `nprobe`
+    particiones con centroide más parecido a la consulta.
+    """
+
+    def __init__(self, directory: Optional[str], nprobe: int = 8, reload_interval: float = 30.0,
+                 retire_grace: float = 60.0):
+        self.directory = directory
+        self.nprobe = nprobe
+        self.reload_interval = reload_interval
+        # Segundos que una versión reemplazada sigue abierta (búsquedas en curso en otros hilos)
+        self.retire_grace = retire_grace
+        self._version: Optional[_IndexVersion] = None
+        self._version_name = None
+        self._retired = []  # [(instante monotonic para cerrar, versión)]
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.reloads = 0
+
+    @property
+    def available(self) -> bool:
+        self._maybe_reload()
+        return self._version is not None
+
+    def _read_current(self):
+        try:
+            with open(os.path.join(self.directory, "CURRENT"), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _maybe_reload(self):
+        """ Cambia a la versión que indique CURRENT (revisa cada reload_interval segundos). """
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            if self._version is not None and now - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = now
+            self._close_retired(now)
+            name = self._read_current()
+            if not name or name == self._version_name:
+                return
+            try:
+                version = _IndexVersion(os.path.join(self.directory, name))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Índice vectorial local: no se pudo abrir {name}: {e}")
+                return
+            # Una sola asignación: las búsquedas en curso terminan con la versión anterior
+            anterior = self._version
+            self._version, self._version_name = version, name
+            if anterior is not None:
+                self._retired.append((now + self.retire_grace, anterior))
+            self.reloads += 1
+            ivf_info = f", IVF {len(version.list_offsets) - 1} particiones" if version.centroids is not None else ""
+            print(f"✓ Índice vectorial local {name}: {version.count} chunks, dim {version.dim}{ivf_info}")
+
+    def _close_retired(self, now: float):
+        pendientes = []
+        for close_at, version in self._retired:
+            if close_at <= now:
+                version.close()
+            else:
+                pendientes.append((close_at, version))
+        self._retired = pendientes
+
+    def search(self, queries, k: int = 3) -> List[List[tuple]]:
+        """ Para cada consulta, lista de (fila, similitud) de mayor a menor. """
+        self._maybe_reload()
+        return self._search(self._version, queries, k)
+
+    def _search(self, version, queries, k):
+        if version is None or version.count == 0:
+            return [[] for _ in range(len(queries))]
+
+        q = np.asarray(queries, dtype=np.float32)
+        q = q / np.maximum(np.linalg.norm(q, axis=1, keepdims=True), 1e-12)
+        k = min(k, version.count)
+        self.searches += len(q)
+
+        if version.centroids is None:
+            scores, rows = self._search_exact(version, q, k, 0, version.count)
+        else:
+            scores, rows = self._search_ivf(version, q, k)
+
+        resultados = []
+        for s, r in zip(scores, rows):
+            orden = np.argsort(-s)
+            resultados.append([(int(r[i]), float(s[i])) for i in orden if r[i] >= 0])
+        return resultados
+
+    def _search_exact(self, version, q, k, lo, hi):
+        best_scores = best_rows = None
+        for start in range(lo, hi, BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, hi)
+            scores = q @ version.vectors[start:end].T
+            rows = np.broadcast_to(np.arange(start, end), scores.shape)
+            best_scores, best_rows = _merge_topk(best_scores, best_rows, scores, rows, k)
+        return best_scores, best_rows
+
+    def _search_ivf(self, version, q, k):
+        nprobe = min(self.nprobe, len(version.centroids))
+        cercanos = np.argpartition(-(q @ version.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        all_scores = np.full((len(q), k), -np.inf, dtype=np.float32)
+        all_rows = np.full((len(q), k), -1, dtype=np.int64)
+        for i, listas in enumerate(cercanos):
+            best_scores = best_rows = None
+            for lista in listas:
+                lo, hi = version.list_offsets[lista], version.list_offsets[lista + 1]
+                if hi <= lo:
+                    continue
+                scores, rows = self._search_exact(version, q[i:i + 1], k, lo, hi)
+                best_scores, best_rows = _merge_topk(best_scores, best_rows, scores, rows, k)
+            if best_scores is not None:
+                n = best_scores.shape[1]
+                all_scores[i, :n], all_rows[i, :n] = best_scores[0], best_rows[0]
+        return all_scores, all_rows
+
+    def buscar_documentos(self, embedding, limit: int = 3, threshold: float = 0.75) -> List[Dict]:
+        """ Mismo formato que OfficeAgent._buscar_documentos_relevantes. """
+        self._maybe_reload()
+        # Filas y metadata deben salir de la misma versión aunque otra entre en medio
+        version = self._version
+        documentos = []
+        for row, similarity in self._search(version, [embedding], limit)[0]:
+            if similarity <= threshold:
+                continue
+            meta = version.meta(row)
+            documentos.append({
+                'id': meta['id'],
+                'content': meta['content'],
+                'metadata': meta.get('metadata', {}),
+                'similarity': similarity
+            })
+        return documentos
+
+    def stats(self) -> dict:
+        version = self._version
+        return {
+            "version": self._version_name,
+            "count": version.count if version else 0,
+            "ivf": version is not None and version.centroids is not None,
+            "searches": self.searches,
+            "reloads": self.reloads,
+            "retired_open": len(self._retired),
+        }
+
+
+local_index = LocalVectorIndex(
+    os.getenv("OFFICE_AGENT_LOCAL_INDEX") or None,
+    nprobe=int(os.getenv("OFFICE_AGENT_LOCAL_INDEX_NPROBE", "8"))
+)
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+
+def normalize_text(text: str) -> str:
+    """ Minúsculas (casefold), sin acentos y con espacios colapsados. """
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.split())
+
+
+def text_key(text: str) -> str:
+    """ Hash estable del texto normalizado. """
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """
+    Cache de veredictos de moderación (Content Safety + juez) por texto normalizado.
+
+    Nivel 1: LRU en memoria con TTL.
+    Nivel 2 (opcional): SQLite en disco para sobrevivir reinicios.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 86400, db_path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()  # key -> (expira_en, veredicto)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._db = None
+
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, verdict TEXT, expires_at REAL)"
+                )
+            except sqlite3.Error as e:
+                print(f"Verdict cache: SQLite deshabilitado ({e})")
+                self._db = None
+
+    def get(self, text: str) -> Optional[dict]:
+        """ Veredicto guardado para el texto, o None si no existe o expiró. """
+        key = text_key(text)
+        now = time.time()
+
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                expires_at, verdict = item
+                if expires_at > now:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return verdict
+                del self._items[key]
+
+            row = self._get_disk(key, now)
+            if row is not None:
+                verdict, expires_at = row
+                self.hits += 1
+                self.disk_hits += 1
+                # Conserva el vencimiento original: leer no extiende la vida del veredicto
+                self._put_memory(key, verdict, expires_at)
+                return verdict
+
+            self.misses += 1
+            return None
+
+    def set(self, text: str, verdict: dict):
+        """ Guarda el veredicto combinado ({"flagged", "severity"}). """
+        key = text_key(text)
+        expires_at = time.time() + self.ttl
+
+        with self._lock:
+            self._put_memory(key, verdict, expires_at)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO verdicts (key, verdict, expires_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(verdict), expires_at)
+                    )
+                except sqlite3.Error as e:
+                    print(f"Verdict cache: error escribiendo en SQLite: {e}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def _put_memory(self, key, verdict, expires_at):
+        self._items[key] = (expires_at, verdict)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def _get_disk(self, key, now):
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT verdict, expires_at FROM verdicts WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Verdict cache: error leyendo SQLite: {e}")
+            return None
+        if row is None:
+            return None
+        if row[1] <= now:
+            self._db.execute("DELETE FROM verdicts WHERE key = ?", (key,))
+            return None
+        return json.loads(row[0]), row[1]
+
+
+verdict_cache = VerdictCache(
+    max_size=int(os.getenv("MODERATION_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("MODERATION_CACHE_TTL", "86400")),
+    db_path=os.getenv("MODERATION_CACHE_DB") or None
+)
@@ -29,4 +29,20 @@ class Config:
 
     # Azure Speech Services
     AZURE_SPEECH_KEY = os.getenv("AZURE_SPEECH_KEY")
-    AZURE_SPEECH_REGION = os.getenv("AZURE_SPEECH_REGION")
\ No newline at end of file
+    AZURE_SPEECH_REGION = os.getenv("AZURE_SPEECH_REGION")
+
+    # Chat
+    # Arranca la respuesta en paralelo con la moderación y la descarta si se bloquea
+    CHAT_SPECULATIVE_GENERATION = os.getenv("CHAT_SPECULATIVE_GENERATION", "false").lower() == "true"
+
+    # Moderación: "judge" (juez GPT + respuesta, dos llamadas) o "fused" (una llamada con veredicto JSON)
+    CHAT_MODERATION_MODE = os.getenv("CHAT_MODERATION_MODE", "judge").lower()
+
+    # Turnos anteriores del chat en el prompt (dentro de CHAT_CONTEXT_BUDGET, con resumen de lo más viejo)
+    CHAT_HISTORY_ENABLED = os.getenv("CHAT_HISTORY_ENABLED", "true").lower() == "true"
+
+    # Guardado de turnos en segundo plano (la respuesta no espera a Cosmos)
+    WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+
+    # Office Agent: documentos de la gaceta (pgvector) como contexto de las respuestas
+    OFFICE_AGENT_ENABLED = os.getenv("OFFICE_AGENT_ENABLED", "false").lower() == "true"
@@ -0,0 +1,165 @@
+"""
+Borrado masivo en Cosmos DB como trabajo en segundo plano.
+
+Los ids se leen con una consulta que solo proyecta `c.id` y se borran con
+concurrencia acotada. Para borrar una partición completa (cuenta de usuario)
+se puede usar delete-by-partition-key si la cuenta de Cosmos lo tiene habilitado.
+El endpoint HTTP solo arranca el trabajo y devuelve un id para consultar su estado.
+
+El estado del trabajo también se guarda en Cosmos (un item por trabajo, en su
+propia partición y sin el userId), así que cualquier worker de Hypercorn
+puede responder la consulta aunque el trabajo corra en otro.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+# Borrados simultáneos por trabajo
+DELETE_CONCURRENCY = int(os.getenv("COSMOS_DELETE_CONCURRENCY", "20"))
+# Requiere la feature "Delete by partition key" activada en la cuenta de Cosmos
+DELETE_BY_PARTITION_KEY = os.getenv("COSMOS_DELETE_BY_PARTITION_KEY", "false").lower() == "true"
+# Trabajos terminados que se conservan para consultar su estado (segundos)
+JOB_RETENTION = 3600
+
+
+async def delete_by_query(container, user_id: str, query: str, parameters: list, job: dict = None,
+                          concurrency: int = DELETE_CONCURRENCY):
+    """ Borra (con concurrencia acotada) los items que devuelve una consulta `SELECT c.id`. """
+    semaforo = asyncio.Semaphore(concurrency)
+    job = job if job is not None else {"deleted": 0, "failed": 0}
+
+    async def borrar(item_id):
+        async with semaforo:
+            try:
+                await container.delete_item(item=item_id, partition_key=user_id)
+                job["deleted"] += 1
+            except CosmosResourceNotFoundError:
+                # Ya no existe: el resultado es el mismo
+                job["deleted"] += 1
+            except Exception as e:
+                job["failed"] += 1
+                print(f"❌ [DB] Error borrando {item_id}: {e}")
+
+    query_iterable = container.query_items(query=query, parameters=parameters, partition_key=user_id)
+    tareas = set()
+    async for item in query_iterable:
+        tareas.add(asyncio.create_task(borrar(item["id"])))
+        # No acumulamos miles de tareas pendientes mientras se lee la consulta
+        if len(tareas) >= concurrency * 4:
+            _, tareas = await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+    if tareas:
+        await asyncio.wait(tareas)
+    return job
+
+
+async def delete_partition(container, user_id: str, job: dict = None):
+    """ Borra todos los items del usuario (la partición completa). """
+    if DELETE_BY_PARTITION_KEY:
+        try:
+            await container.delete_all_items_by_partition_key(user_id)
+            if job is not None:
+                job["mode"] = "partition_key"
+            return job
+        except Exception as e:
+            print(f"❌ [DB] delete-by-partition-key no disponible, borrando item por item: {e}")
+
+    return await delete_by_query(
+        container, user_id,
+        "SELECT c.id FROM c WHERE c.userId = @userId",
+        [{"name": "@userId", "value": user_id}],
+        job
+    )
+
+
+def _public(job: dict) -> dict:
+    return {k: v for k, v in job.items() if k != "userId"}
+
+
+class DeleteJobs:
+    """ Trabajos de borrado del proceso (en memoria) con su estado publicado en Cosmos. """
+
+    def __init__(self):
+        self._jobs = {}
+        self._tasks = {}
+
+    def start(self, kind: str, user_id: str, coro_factory, container=None) -> str:
+        """
+        Arranca un trabajo; coro_factory(job) debe devolver la corrutina que borra.
+        Con `container`, el estado se publica en Cosmos al empezar y al terminar.
+        """
+        self._purge()
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "userId": user_id,
+            "status": "running",
+            "deleted": 0,
+            "failed": 0,
+            "startedAt": time.time(),
+            "finishedAt": None,
+        }
+        self._jobs[job_id] = job
+        self._tasks[job_id] = asyncio.create_task(self._run(job, coro_factory, container))
+        return job_id
+
+    async def _publish(self, container, job):
+        if container is None:
+            return
+        try:
+            await container.upsert_item(body={
+                **_public(job), "userId": f"delete-job:{job['id']}", "type": "delete_job", "ttl": JOB_RETENTION
+            })
+        except Exception as e:
+            print(f"❌ [DB] No se pudo guardar el estado del trabajo {job['id']}: {e}")
+
+    async def _run(self, job, coro_factory, container=None):
+        await self._publish(container, job)
+        try:
+            await coro_factory(job)
+            job["status"] = "failed" if job["failed"] else "done"
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            print(f"❌ [DB] Trabajo de borrado {job['id']} falló: {e}")
+        finally:
+            job["finishedAt"] = time.time()
+            self._tasks.pop(job["id"], None)
+        await self._publish(container, job)
+
+    async def get(self, job_id: str, container=None):
+        """ Estado del trabajo: de este proceso o, si corre en otro worker, de Cosmos. """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return _public(job)
+        if container is None:
+            return None
+        try:
+            item = await container.read_item(item=job_id, partition_key=f"delete-job:{job_id}")
+        except CosmosResourceNotFoundError:
+            return None
+        if item.get("finishedAt") and item["finishedAt"] < time.time() - JOB_RETENTION:
+            # Sin TTL en el contenedor el item no vence solo: se borra al consultarlo
+            try:
+                await container.delete_item(item=job_id, partition_key=f"delete-job:{job_id}")
+            except Exception:
+                pass
+            return None
+        return {k: item.get(k) for k in ("id", "kind", "status", "deleted", "failed", "startedAt", "finishedAt",
+                                         "mode", "error") if k in item}
+
+    async def wait(self, timeout: float = 30.0):
+        """ Espera los trabajos en curso (al apagar la app). """
+        if self._tasks:
+            await asyncio.wait(list(self._tasks.values()), timeout=timeout)
+
+    def _purge(self):
+        limite = time.time() - JOB_RETENTION
+        for job_id in [j for j, job in self._jobs.items() if job["finishedAt"] and job["finishedAt"] < limite]:
+            del self._jobs[job_id]
+
+
+delete_jobs = DeleteJobs()
@@ -0,0 +1,221 @@
+"""
+Almacenamiento de chats en Cosmos DB.
+
+Cada chat es un documento cabecera pequeño (type='chat': título, fechas y
+contador) y cada mensaje es un item propio (type='chat_message') bajo la
+misma partición del usuario. Guardar un turno es un solo batch transaccional
+de tamaño fijo, sin importar qué tan larga sea la conversación.
+
+Los documentos antiguos que traen `messages` embebidos se siguen leyendo.
+
+La cabecera también guarda el resumen acumulado de los mensajes que ya no
+caben en el prompt (`summary`) y el sortKey del último que cubre (`summaryUpTo`).
+"""
+
+import re
+import uuid
+import asyncio
+from datetime import datetime, timezone
+from azure.cosmos.exceptions import (
+    CosmosAccessConditionFailedError, CosmosBatchOperationError, CosmosResourceNotFoundError
+)
+from .models import ChatSession, ChatMessage, ChatMessageItem
+from .bulk_delete import delete_by_query
+
+
+def _batch_status(error: CosmosBatchOperationError):
+    """ Código de estado de la operación que hizo fallar el batch. """
+    try:
+        return error.operation_responses[error.error_index].get("statusCode")
+    except (TypeError, IndexError, AttributeError):
+        return error.status_code
+
+
+# Límite de operaciones por batch transaccional de Cosmos
+MAX_BATCH_OPERATIONS = 100
+
+
+async def append_turn(container, user_id: str, chat_id: str, user_message: str, ai_response: str):
+    """ Agrega pregunta y respuesta al chat (crea la cabecera si es el primer turno). """
+    await append_turns(container, user_id, chat_id, [(user_message, ai_response, None)])
+
+
+async def append_turns(container, user_id: str, chat_id: str, turns: list):
+    """
+    Agrega varios turnos del mismo chat en orden.
+
+    turns: lista de (user_message, ai_response, timestamp ISO o None = ahora).
+    Se usa un batch por cada bloque de turnos que cabe en MAX_BATCH_OPERATIONS.
+    """
+    turns_por_batch = (MAX_BATCH_OPERATIONS - 1) // 2
+    for start in range(0, len(turns), turns_por_batch):
+        await _append_batch(container, user_id, chat_id, turns[start:start + turns_por_batch])
+
+
+def message_id(chat_id: str, sort_key: str) -> str:
+    """ Id determinista del mensaje: reintentar el mismo turno no lo duplica. """
+    return f"msg_{uuid.uuid5(uuid.NAMESPACE_URL, f'{chat_id}/{sort_key}').hex}"
+
+
+async def _append_batch(container, user_id: str, chat_id: str, turns: list):
+    items = []
+    for user_message, ai_response, timestamp in turns:
+        timestamp = timestamp or datetime.now(timezone.utc).isoformat()
+        for n, (role, text) in enumerate((("user", user_message), ("ai", ai_response))):
+            sort_key = f"{timestamp}_{n}"
+            items.append(ChatMessageItem(id=message_id(chat_id, sort_key), userId=user_id, chatId=chat_id,
+                                         role=role, text=text, timestamp=timestamp, sortKey=sort_key))
+    message_ops = [("create", (item.model_dump(),)) for item in items]
+    now = items[-1].timestamp
+
+    header_patch = ("patch", (chat_id, [
+        {"op": "set", "path": "/updatedAt", "value": now},
+        {"op": "incr", "path": "/messageCount", "value": len(items)},
+    ]))
+    header_new = ChatSession(
+        id=chat_id, userId=user_id, title=turns[0][0][:30]+"...",
+        createdAt=items[0].timestamp, updatedAt=now, messageCount=len(items)
+    ).model_dump(exclude={"messages"})
+
+    # Lo normal es que la cabecera ya exista: intentamos patch y si no, la creamos.
+    # Si dos primeros turnos compiten, el perdedor recibe 409 y vuelve al patch.
+    for header_op in (header_patch, ("create", (header_new,)), header_patch):
+        try:
+            await container.execute_item_batch(batch_operations=[*message_ops, header_op], partition_key=user_id)
+            return
+        except CosmosBatchOperationError as e:
+            status = _batch_status(e)
+            if status == 409 and getattr(e, "error_index", len(message_ops)) < len(message_ops):
+                # Un mensaje ya existe: un intento anterior de este mismo batch se guardó
+                # (solo se perdió la respuesta) y, al ser transaccional, la cabecera también
+                return
+            if status not in (404, 409):
+                raise
+    raise RuntimeError(f"No se pudo guardar el turno del chat {chat_id}")
+
+
+async def list_chat_headers(container, user_id: str, page_size: int = 20, continuation: str = None):
+    """ Una página de chats (solo id, título y fecha) del más reciente al más antiguo. """
+    query_iterable = container.query_items(
+        query=(
+            "SELECT c.id, c.title, c.updatedAt FROM c "
+            "WHERE c.userId = @userId AND c.type = 'chat' ORDER BY c.updatedAt DESC"
+        ),
+        parameters=[{"name": "@userId", "value": user_id}],
+        partition_key=user_id,
+        max_item_count=page_size
+    )
+    pages = query_iterable.by_page(continuation)
+    async for page in pages:
+        return [item async for item in page], pages.continuation_token
+    return [], None
+
+
+async def get_chat_messages(container, user_id: str, chat_id: str, page_size: int = 50, continuation: str = None):
+    """
+    Una página de mensajes de un chat. En la primera página se anteponen los
+    mensajes embebidos de documentos antiguos, si los hay.
+    """
+    legacy = []
+    if not continuation:
+        query_iterable = container.query_items(
+            query="SELECT c.messages FROM c WHERE c.userId = @userId AND c.type = 'chat' AND c.id = @chatId",
+            parameters=[{"name": "@userId", "value": user_id}, {"name": "@chatId", "value": chat_id}],
+            partition_key=user_id
+        )
+        async for header in query_iterable:
+            legacy = [ChatMessage(**m).model_dump(mode='json') for m in header.get("messages") or []]
+
+    messages, continuation = await list_messages(container, user_id, chat_id, page_size, continuation)
+    return legacy + messages, continuation
+
+
+async def list_messages(container, user_id: str, chat_id: str, page_size: int = 50, continuation: str = None):
+    """ Una página de mensajes del chat en orden. Devuelve (mensajes, token de continuación). """
+    query_iterable = container.query_items(
+        query=(
+            "SELECT c.role, c.text, c.timestamp FROM c "
+            "WHERE c.userId = @userId AND c.type = 'chat_message' AND c.chatId = @chatId "
+            "ORDER BY c.sortKey"
+        ),
+        parameters=[{"name": "@userId", "value": user_id}, {"name": "@chatId", "value": chat_id}],
+        partition_key=user_id,
+        max_item_count=page_size
+    )
+    pages = query_iterable.by_page(continuation)
+    async for page in pages:
+        return [item async for item in page], pages.continuation_token
+    return [], None
+
+
+async def recent_history(container, user_id: str, chat_id: str, limit: int):
+    """
+    Contexto guardado de un chat para armar el prompt: (mensajes, resumen, summaryUpTo).
+
+    Mensajes: los últimos `limit` del más viejo al más nuevo, {"role", "content", "key"},
+    con los embebidos de documentos antiguos antes. Lee la cabecera y la página en paralelo.
+    """
+    async def cabecera():
+        try:
+            return await container.read_item(item=chat_id, partition_key=user_id)
+        except CosmosResourceNotFoundError:
+            return {}
+
+    async def ultimos():
+        query_iterable = container.query_items(
+            query=(
+                "SELECT c.role, c.text, c.sortKey FROM c "
+                "WHERE c.userId = @userId AND c.type = 'chat_message' AND c.chatId = @chatId "
+                "ORDER BY c.sortKey DESC"
+            ),
+            parameters=[{"name": "@userId", "value": user_id}, {"name": "@chatId", "value": chat_id}],
+            partition_key=user_id,
+            max_item_count=limit
+        )
+        async for page in query_iterable.by_page():
+            return [item async for item in page]
+        return []
+
+    header, items = await asyncio.gather(cabecera(), ultimos())
+    legacy = [
+        {"role": m.get("role"), "text": m.get("text", ""), "sortKey": m.get("timestamp", "")}
+        for m in header.get("messages") or []
+    ]
+    mensajes = [
+        {"role": "assistant" if m["role"] == "ai" else m["role"], "content": m["text"], "key": m["sortKey"]}
+        for m in [*legacy, *reversed(items)]
+    ][-limit:]
+    return mensajes, header.get("summary") or None, header.get("summaryUpTo") or None
+
+
+# sortKey de un mensaje: timestamp ISO + "_n" (los mensajes embebidos antiguos solo traen el timestamp)
+SORT_KEY_RE = re.compile(r"\d{4}-\d{2}-\d{2}T[0-9:.]+(?:Z|[+-]\d{2}:\d{2})?(?:_\d+)?")
+
+
+async def save_summary(container, user_id: str, chat_id: str, summary: str, up_to: str):
+    """ Guarda el resumen acumulado en la cabecera (si otro resumen más nuevo ganó, no se pisa). """
+    # El predicado de Cosmos no admite parámetros: solo se interpola un sortKey válido
+    if not SORT_KEY_RE.fullmatch(up_to or ""):
+        raise ValueError(f"summaryUpTo inválido: {up_to!r}")
+    try:
+        await container.patch_item(
+            item=chat_id, partition_key=user_id,
+            patch_operations=[
+                {"op": "set", "path": "/summary", "value": summary},
+                {"op": "set", "path": "/summaryUpTo", "value": up_to},
+            ],
+            filter_predicate=f"FROM c WHERE NOT IS_DEFINED(c.summaryUpTo) OR c.summaryUpTo < '{up_to}'"
+        )
+    except (CosmosResourceNotFoundError, CosmosAccessConditionFailedError):
+        # Sin cabecera todavía (turno en la cola) o ya hay un resumen más nuevo
+        pass
+
+
+async def delete_chat_items(container, user_id: str, chat_id: str):
+    """ Borra la cabecera y todos los mensajes de un chat. """
+    await delete_by_query(
+        container, user_id,
+        "SELECT c.id FROM c WHERE c.userId = @userId AND c.type = 'chat_message' AND c.chatId = @chatId",
+        [{"name": "@userId", "value": user_id}, {"name": "@chatId", "value": chat_id}]
+    )
+    await container.delete_item(item=chat_id, partition_key=user_id)
@@ -1,26 +1,88 @@
 import os
+import time
 from azure.cosmos.aio import CosmosClient
 from azure.cosmos import PartitionKey
+from backend.telemetry import METRICS_ENABLED, cosmos_request_seconds, cosmos_request_units, record_stage
 
 _container_client = None
 
+# Tipo de operación según el método HTTP (queries y batches se distinguen por header)
+_OPERACIONES = {"GET": "read", "POST": "create", "PUT": "replace", "PATCH": "patch", "DELETE": "delete"}
+
+
+def _cosmos_operation(http_request) -> str:
+    headers = http_request.headers
+    if headers.get("x-ms-documentdb-isquery") or headers.get("x-ms-cosmos-is-query-plan-request"):
+        return "query"
+    if headers.get("x-ms-cosmos-is-batch-request"):
+        return "batch"
+    if headers.get("x-ms-documentdb-is-upsert"):
+        return "upsert"
+    return _OPERACIONES.get(http_request.method, http_request.method.lower())
+
+
+def _cosmos_request_hook(request):
+    request.context["civicknit_inicio"] = time.perf_counter()
+
+
+def _cosmos_response_hook(response):
+    """ Latencia y RU de cada request HTTP a Cosmos (cada reintento cuenta aparte). """
+    inicio = response.context.get("civicknit_inicio")
+    if inicio is None:
+        return
+    segundos = time.perf_counter() - inicio
+    operation = _cosmos_operation(response.http_request)
+    cosmos_request_seconds.observe(segundos, operation=operation, status=str(response.http_response.status_code))
+    charge = response.http_response.headers.get("x-ms-request-charge")
+    if charge:
+        cosmos_request_units.inc(float(charge), operation=operation)
+    record_stage(f"cosmos_{operation}", segundos)
+
+async def _activar_ttl(database, container):
+    """
+    Los contenedores creados antes no tienen defaultTtl y Cosmos ignora el
+    campo `ttl` de los items (estado de los borrados masivos). Se activa con
+    -1: sin vencimiento por defecto, solo vencen los items que traen `ttl`.
+    """
+    try:
+        props = await container.read()
+        if props.get("defaultTtl") is not None:
+            return
+        # replace_container reemplaza toda la definición: se conservan índices y conflictos
+        await database.replace_container(
+            container,
+            partition_key=PartitionKey(path="/userId"),
+            default_ttl=-1,
+            indexing_policy=props.get("indexingPolicy"),
+            conflict_resolution_policy=props.get("conflictResolutionPolicy")
+        )
+        print("✓ [DB] TTL por item activado en el contenedor")
+    except Exception as e:
+        print(f"❌ [DB] No se pudo activar el TTL del contenedor: {e}")
+
 async def get_container():
     global _container_client
     if _container_client: 
         return _container_client
     
     try:
+        hooks = {}
+        if METRICS_ENABLED:
+            hooks = {"raw_request_hook": _cosmos_request_hook, "raw_response_hook": _cosmos_response_hook}
         client = CosmosClient(
             url=os.getenv("COSMOS_ENDPOINT"), 
-            credential=os.getenv("COSMOS_KEY")
+            credential=os.getenv("COSMOS_KEY"),
+            **hooks
         )
 
         database = await client.create_database_if_not_exists(id=os.getenv("COSMOS_DB_NAME"))
 
         _container_client = await database.create_container_if_not_exists(
             id=os.getenv("COSMOS_CONTAINER_NAME"),
-            partition_key=PartitionKey(path="/userId")
+            partition_key=PartitionKey(path="/userId"),
+            default_ttl=-1
         )
+        await _activar_ttl(database, _container_client)
 
         print("✅ [DB] Conectado")
         return _container_client
@@ -44,8 +44,22 @@ class ChatSession(BaseModel):
     title: str
     createdAt: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
     updatedAt: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    messageCount: int = 0
+    # Solo en documentos antiguos; los mensajes nuevos se guardan como ChatMessageItem
     messages: List[ChatMessage] = []
 
     class Config:
         populate_by_name = True
-        extra = 'ignore'
\ No newline at end of file
+        extra = 'ignore'
+
+# Mensaje guardado como item propio (append-only) bajo la misma partición del usuario
+class ChatMessageItem(ChatMessage):
+    id: str
+    userId: str # Partition Key
+    chatId: str
+    type: str = "chat_message" # Siempre fijo
+    sortKey: str # Orden dentro del chat: "<timestamp del turno>_<n>"
+
+    class Config:
+        populate_by_name = True
+        extra = 'ignore'
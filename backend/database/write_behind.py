@@ -0,0 +1,209 @@
+"""
+Cola write-behind para guardar los turnos del chat sin hacer esperar la respuesta.
+
+El request encola el turno y regresa; un worker en segundo plano agrupa los
+turnos pendientes por chat, los escribe en Cosmos (un batch por chat) y
+reintenta con backoff. La cola es acotada: si se llena, quien encola espera
+(backpressure) y si aun así no hay lugar, el turno se escribe en línea.
+
+Al borrar un chat o la cuenta, `discard` descarta los turnos de ese usuario
+que siguen en la cola (el worker los salta) y espera la escritura en curso,
+para que un turno encolado justo antes no vuelva a crear el chat.
+"""
+
+import os
+import time
+import asyncio
+from datetime import datetime, timezone
+from .connection import get_container
+from .chat_store import append_turns
+
+
+class WriteBehindQueue:
+
+    def __init__(self, max_size: int = 1000, batch_size: int = 50, max_retries: int = 5,
+                 put_timeout: float = 1.0, flush_timeout: float = 10.0):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.put_timeout = put_timeout
+        self.flush_timeout = flush_timeout
+        self._queue = None
+        self._worker = None
+        # Turnos encolados que todavía no están en Cosmos, por (usuario, chat)
+        self._pending = {}
+        # Descartes: (usuario, chat o None = todos) -> instante (monotonic) del descarte
+        self._discarded = {}
+        self._current = None
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+        self.inline_writes = 0
+        self.dropped = 0
+        self.last_write_lag_ms = 0.0
+        self.max_write_lag_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def start(self):
+        """ Arranca el worker (en before_serving, dentro del event loop de la app). """
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._worker = asyncio.create_task(self._run())
+        print("✅ [DB] Cola write-behind iniciada")
+
+    async def stop(self):
+        """ Espera a que se vacíe la cola (con límite) y detiene el worker. """
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self.flush_timeout)
+        except asyncio.TimeoutError:
+            print(f"❌ [DB] Cola write-behind: {self._queue.qsize()} turnos sin guardar al apagar")
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def enqueue(self, user_id: str, chat_id: str, user_message: str, ai_response: str) -> bool:
+        """ Encola un turno. Devuelve False si no se pudo (el llamador debe escribirlo en línea). """
+        if not self.running:
+            return False
+        turn = (time.monotonic(), user_id, chat_id, user_message, ai_response,
+                datetime.now(timezone.utc).isoformat())
+        try:
+            await asyncio.wait_for(self._queue.put(turn), timeout=self.put_timeout)
+        except asyncio.TimeoutError:
+            self.inline_writes += 1
+            return False
+        self.enqueued += 1
+        self._pending.setdefault((user_id, chat_id), []).append(turn)
+        return True
+
+    def pending_turns(self, user_id: str, chat_id: str) -> list:
+        """ Turnos del chat aún sin escribir: (user_message, ai_response, timestamp ISO). """
+        return [(t[3], t[4], t[5]) for t in self._pending.get((user_id, chat_id), ())]
+
+    async def discard(self, user_id: str, chat_id: str = None):
+        """
+        Descarta los turnos encolados del usuario (de un chat o de todos) y
+        espera la escritura en curso. Se llama antes de borrar en Cosmos.
+        """
+        ahora = time.monotonic()
+        # Los descartes viejos ya no aplican a nada de la cola
+        limite = ahora - 3600
+        self._discarded = {k: t for k, t in self._discarded.items() if t >= limite}
+        self._discarded[(user_id, chat_id)] = ahora
+        for key in [k for k in self._pending if k[0] == user_id and chat_id in (None, k[1])]:
+            self.dropped += len(self._pending.pop(key))
+        if self._current is not None and not self._current.done():
+            await asyncio.wait({self._current}, timeout=self.flush_timeout)
+
+    def _is_discarded(self, turn) -> bool:
+        encolado, user_id, chat_id = turn[0], turn[1], turn[2]
+        for key in ((user_id, chat_id), (user_id, None)):
+            descartado = self._discarded.get(key)
+            if descartado is not None and encolado <= descartado:
+                return True
+        return False
+
+    def _forget(self, user_id, chat_id, turns):
+        pendientes = self._pending.get((user_id, chat_id))
+        if pendientes is None:
+            return
+        pendientes[:] = [t for t in pendientes if t not in turns]
+        if not pendientes:
+            del self._pending[(user_id, chat_id)]
+
+    def stats(self) -> dict:
+        oldest_age_ms = 0.0
+        if self._queue is not None and not self._queue.empty():
+            # El deque interno de asyncio.Queue mantiene el orden de llegada
+            oldest_age_ms = (time.monotonic() - self._queue._queue[0][0]) * 1000
+        return {
+            "running": self.running,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_size": self.max_size,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "retries": self.retries,
+            "inline_writes": self.inline_writes,
+            "dropped": self.dropped,
+            "last_write_lag_ms": round(self.last_write_lag_ms, 1),
+            "max_write_lag_ms": round(self.max_write_lag_ms, 1),
+            "oldest_pending_age_ms": round(oldest_age_ms, 1),
+        }
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                self._current = asyncio.ensure_future(self._write(batch))
+                await self._current
+            except Exception as e:
+                print(f"❌ [DB] Cola write-behind: error inesperado: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, batch):
+        # Agrupamos por chat conservando el orden de llegada
+        por_chat = {}
+        for turn in batch:
+            if self._is_discarded(turn):
+                continue
+            por_chat.setdefault((turn[1], turn[2]), []).append(turn)
+
+        container = await get_container()
+        await asyncio.gather(*(
+            self._write_chat(container, user_id, chat_id, turns)
+            for (user_id, chat_id), turns in por_chat.items()
+        ))
+
+    async def _write_chat(self, container, user_id, chat_id, turns):
+        try:
+            await self._write_chat_retrying(container, user_id, chat_id, turns)
+        finally:
+            self._forget(user_id, chat_id, turns)
+
+    async def _write_chat_retrying(self, container, user_id, chat_id, turns):
+        for attempt in range(self.max_retries + 1):
+            # El chat se borró mientras se reintentaba
+            turns = [t for t in turns if not self._is_discarded(t)]
+            if not turns:
+                return
+            try:
+                if container is None:
+                    raise RuntimeError("Cosmos no disponible")
+                await append_turns(container, user_id, chat_id, [(t[3], t[4], t[5]) for t in turns])
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += len(turns)
+                    print(f"❌ [DB] Turnos del chat {chat_id} descartados tras {attempt + 1} intentos: {e}")
+                    return
+                self.retries += 1
+                await asyncio.sleep(min(0.2 * 2 ** attempt, 5.0))
+                if container is None:
+                    container = await get_container()
+
+        lag_ms = (time.monotonic() - turns[0][0]) * 1000
+        self.written += len(turns)
+        self.last_write_lag_ms = lag_ms
+        self.max_write_lag_ms = max(self.max_write_lag_ms, lag_ms)
+
+
+write_behind = WriteBehindQueue(
+    max_size=int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "1000")),
+    batch_size=int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "50"))
+)
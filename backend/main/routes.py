@@ -1,6 +1,9 @@
-from quart import Blueprint, render_template, session, request, jsonify, url_for
+from quart import Blueprint, Response, render_template, session, request, jsonify, url_for
 from backend.database.connection import get_container
+from backend.database.bulk_delete import delete_partition, delete_jobs
+from backend.database.write_behind import write_behind
 from backend.database.models import UserProfile, PersonalInfo, Preferences
+from backend.telemetry import METRICS_ENABLED, METRICS_TOKEN, registry
 from pydantic import ValidationError
 from .services import get_profile_by_key
 
@@ -82,25 +85,31 @@ async def delete_account():
         return jsonify({"error": "401"}), 401
     
     user_id = session['user']['oid']
-    
-    try:
-        # Borrado en cascada de todo lo del usuario
-        items = []
-        query_iterable = container.query_items(
-            query="SELECT * FROM c WHERE c.userId = @userId",
-            parameters=[{"name": "@userId", "value": user_id}],
-        )
-        
-        async for item in query_iterable:
-            items.append(item)
-        
-        for item in items:
-            await container.delete_item(item=item['id'], partition_key=user_id)
-            
-        session.clear()
-        return jsonify({"status": "success"})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+
+    # Los turnos del usuario que siguen en la cola write-behind ya no se escriben
+    await write_behind.discard(user_id)
+    # Borrado en cascada de todo lo del usuario, en segundo plano
+    job_id = delete_jobs.start("account", user_id, lambda job: delete_partition(container, user_id, job), container)
+    session.clear()
+    return jsonify({"status": "accepted", "jobId": job_id}), 202
+
+@main_bp.route('/api/delete-jobs/<job_id>')
+async def delete_job_status(job_id):
+    # El id es aleatorio (uuid4) y no expone el userId; sirve aunque la sesión ya no exista
+    # y aunque el trabajo corra en otro worker (el estado se lee de Cosmos)
+    job = await delete_jobs.get(job_id, await get_container())
+    if not job:
+        return jsonify({"error": "404"}), 404
+    return jsonify(job)
+
+@main_bp.route('/metrics')
+async def metrics():
+    """ Métricas del worker en formato Prometheus (cada worker de Hypercorn expone las suyas). """
+    if not METRICS_ENABLED:
+        return jsonify({"error": "404"}), 404
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "401"}), 401
+    return Response(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 @main_bp.route('/use-cases')
 async def use_cases():
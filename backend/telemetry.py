@@ -0,0 +1,175 @@
+"""
+Métricas del proceso en formato Prometheus (GET /metrics) y tiempos por etapa
+del request (header Server-Timing).
+
+Todo vive en memoria con tamaño fijo: un histograma son unos cuantos contadores
+por combinación de labels y registrar una medición es una búsqueda binaria y
+una suma. Las etapas se miden con `stage("nombre")`; si el código corre dentro
+de un request, la duración también se anota para el Server-Timing.
+"""
+
+import os
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Si se define, GET /metrics exige "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or None
+
+# Límites (segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pares = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class Counter:
+    """ Contador monótono con labels. """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1.0, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """ Histograma acumulativo con límites fijos (como el de prometheus_client). """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {}  # labels -> [conteos por bucket (+Inf al final), suma]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            serie = self._series.get(key)
+            if serie is None:
+                serie = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][i] += 1
+            serie[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in sorted(self._series.items())]
+        for key, counts, total in series:
+            acumulado = 0
+            for limite, n in zip((*self.buckets, "+Inf"), counts):
+                acumulado += n
+                le = 'le="+Inf"' if limite == "+Inf" else f'le="{limite:g}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {acumulado}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {acumulado}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """ Texto en el formato de exposición de Prometheus (0.0.4). """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    "civicknit_http_request_seconds", "Duración de los requests HTTP.", ("route", "method", "status"))
+stage_seconds = registry.histogram(
+    "civicknit_stage_seconds", "Duración de cada etapa del chat (moderación, juez, generación, Cosmos, búsqueda).",
+    ("stage",))
+llm_calls = registry.counter(
+    "civicknit_llm_calls_total", "Llamadas a Azure OpenAI por modo de moderación.", ("mode",))
+llm_tokens = registry.counter(
+    "civicknit_llm_tokens_total", "Tokens de Azure OpenAI por modo y tipo (prompt/completion/cached).", ("mode", "kind"))
+cosmos_request_seconds = registry.histogram(
+    "civicknit_cosmos_request_seconds", "Duración de cada request HTTP a Cosmos DB.", ("operation", "status"))
+cosmos_request_units = registry.counter(
+    "civicknit_cosmos_request_units_total", "Request units (RU) cobradas por Cosmos DB.", ("operation",))
+
+# ====================================================================
+#              ETAPAS Y SERVER-TIMING
+# ====================================================================
+
+_timings: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("server_timings", default=None)
+
+
+def start_request():
+    """ Abre la lista de tiempos del request actual (la comparten las tareas que cree). """
+    _timings.set([])
+
+
+def record_stage(name: str, seconds: float):
+    if not METRICS_ENABLED:
+        return
+    stage_seconds.observe(seconds, stage=name)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str):
+    """ Mide el bloque como la etapa `name` (sirve igual alrededor de un await). """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - inicio)
+
+
+def server_timing_header() -> Optional[str]:
+    """ Valor del header Server-Timing con las etapas del request (sumadas por nombre). """
+    timings = _timings.get()
+    if not timings:
+        return None
+    totales = {}
+    for name, seconds in timings:
+        totales[name] = totales.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totales.items())
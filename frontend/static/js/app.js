@@ -37,6 +37,28 @@ window.civicApp = function () {
         player: null,
         isPreparingRecording: false,
         speechRecognizer: null,
+        speechToken: null,
+        speechTokenRequest: null,
+
+        // Token de voz compartido por micrófono y lectura en voz alta (se reusa hasta poco antes de vencer)
+        async getSpeechToken() {
+            if (this.speechToken && Date.now() < this.speechToken.expiresAt) return this.speechToken;
+            if (this.speechTokenRequest) return this.speechTokenRequest;
+
+            this.speechTokenRequest = (async () => {
+                try {
+                    const tokenRes = await fetch('/api/speech-token');
+                    const tokenData = await tokenRes.json();
+                    if (tokenData.error) throw new Error(tokenData.error);
+                    const ttl = Math.max((tokenData.expiresIn || 0) - 60, 0) * 1000;
+                    this.speechToken = { ...tokenData, expiresAt: Date.now() + ttl };
+                    return this.speechToken;
+                } finally {
+                    this.speechTokenRequest = null;
+                }
+            })();
+            return this.speechTokenRequest;
+        },
 
         showToastMessage(msg, type = 'success') {
             this.toast = { show: true, message: msg, type: type };
@@ -192,9 +214,7 @@ window.civicApp = function () {
 
             try {
                 // obtener token efímero del backend
-                const tokenRes = await fetch('/api/speech-token');
-                const tokenData = await tokenRes.json();
-                if (tokenData.error) throw new Error(tokenData.error);
+                const tokenData = await this.getSpeechToken();
 
                 const speechConfig = SpeechSDK.SpeechConfig.fromAuthorizationToken(
                     tokenData.token,
@@ -321,8 +341,7 @@ window.civicApp = function () {
                 this.currentSpeakingText = cleanText;
                 this.isSpeaking = true;
 
-                const tokenRes = await fetch('/api/speech-token');
-                const tokenData = await tokenRes.json();
+                const tokenData = await this.getSpeechToken();
 
                 const speechConfig = SpeechSDK.SpeechConfig.fromAuthorizationToken(
                     tokenData.token,
@@ -403,17 +422,14 @@ window.civicApp = function () {
         chats: [],
         activeChatId: null,
         loading: false,
+        chatsContinuation: null,
+        loadingChats: false,
+        chatLoads: {},
 
         async initChat() {
-            // Usuario- cargar de API
+            // Usuario- cargar de API (solo la lista; los mensajes se piden al abrir cada chat)
             if (this.isLoggedIn) {
-                try {
-                    const res = await fetch('/api/chats');
-                    if (res.ok) {
-                        this.chats = await res.json();
-                        this.chats = this.chats.map(c => ({ ...c, messages: c.messages || [] }));
-                    }
-                } catch (e) { console.error(e); }
+                await this.loadMoreChats();
             }
             // Invitado - cargar de LocalStorage
             else {
@@ -427,8 +443,62 @@ window.civicApp = function () {
 
             if (!this.isLoggedIn) {
                 this.$watch('chats', val => localStorage.setItem('civic_chats', JSON.stringify(val)));
+            } else {
+                this.$watch('activeChatId', id => { if (id) this.loadChatMessages(id); });
+                if (this.activeChatId) this.loadChatMessages(this.activeChatId);
             }
         },
+
+        // Siguiente página de la lista de chats (id, título, fecha)
+        async loadMoreChats() {
+            if (this.loadingChats) return;
+            this.loadingChats = true;
+            try {
+                let url = '/api/chats?limit=30';
+                if (this.chatsContinuation) url += '&continuation=' + encodeURIComponent(this.chatsContinuation);
+                const res = await fetch(url);
+                if (res.ok) {
+                    const data = await res.json();
+                    const known = new Set(this.chats.map(c => c.id));
+                    const page = data.chats
+                        .filter(c => !known.has(c.id))
+                        .map(c => ({ ...c, messages: [], loaded: false }));
+                    this.chats = [...this.chats, ...page];
+                    this.chatsContinuation = data.continuation;
+                }
+            } catch (e) { console.error(e); }
+            finally { this.loadingChats = false; }
+        },
+
+        // Carga (una sola vez) todas las páginas de mensajes de un chat
+        loadChatMessages(id) {
+            const chat = this.chats.find(c => c.id === id);
+            if (!chat || chat.loaded !== false) return Promise.resolve();
+            if (this.chatLoads[id]) return this.chatLoads[id];
+
+            this.chatLoads[id] = (async () => {
+                try {
+                    const messages = [];
+                    let continuation = null;
+                    do {
+                        let url = `/api/chats/${encodeURIComponent(id)}?limit=100`;
+                        if (continuation) url += '&continuation=' + encodeURIComponent(continuation);
+                        const res = await fetch(url);
+                        if (!res.ok) throw new Error('Error loading chat');
+                        const data = await res.json();
+                        messages.push(...data.messages);
+                        continuation = data.continuation;
+                    } while (continuation);
+
+                    chat.messages = [...messages, ...chat.messages];
+                    chat.loaded = true;
+                    this.chats = [...this.chats];
+                    if (this.activeChatId === id) this.scrollToBottom();
+                } catch (e) { console.error(e); }
+                finally { delete this.chatLoads[id]; }
+            })();
+            return this.chatLoads[id];
+        },
         createNewChat() { this.activeChatId = null; this.mobileMenuOpen = false; },
 
         async deleteChat(id, event) {
@@ -477,9 +547,11 @@ window.civicApp = function () {
         async sendMessage(text) {
             if (!text || !text.trim()) return;
             let chat = this.chats.find(c => c.id === this.activeChatId);
+            // Si el historial del chat aún no llega, lo esperamos para no mezclar mensajes
+            if (chat && chat.loaded === false) await this.loadChatMessages(chat.id);
             if (!chat) {
                 const newId = this.isLoggedIn ? 'chat_' + Date.now() : Date.now();
-                chat = { id: newId, title: text.substring(0, 30) + '...', messages: [] };
+                chat = { id: newId, title: text.substring(0, 30) + '...', messages: [], loaded: true };
                 this.chats.unshift(chat);
                 this.activeChatId = newId;
             }
@@ -489,28 +561,65 @@ window.civicApp = function () {
             this.scrollToBottom();
 
             try {
-                const res = await fetch('/chat', {
+                const res = await fetch('/chat/stream', {
                     method: 'POST', headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({ message: text, chatId: chat.id, lang: this.lang })
                 });
-                const data = await res.json();
-                console.log("DATOS RECIBIDOS:", data);
-
-                // --- CORRECCIÓN AQUÍ ---
-                if (data.moderation_flagged) {
-                    // Agregamos is_flagged: true DENTRO del objeto del mensaje
-                    chat.messages.push({ 
-                        role: 'ai', 
-                        text: data.ai_response, 
-                        is_flagged: true 
-                    });
-                    
-                    this.showToastMessage(this.t[this.lang].toast_error_content_safety, 'error');
-                } else {
-                    // Respuesta normal (Sin flag)
-                    chat.messages.push({ role: 'ai', text: data.response });
+                if (!res.ok || !res.body) throw new Error('Stream error ' + res.status);
+
+                // mensaje de la IA que se va llenando con cada delta
+                let aiMsg = null;
+                const renderDelta = (delta) => {
+                    if (!aiMsg) {
+                        chat.messages.push({ role: 'ai', text: '' });
+                        aiMsg = chat.messages[chat.messages.length - 1];
+                        this.loading = false;
+                    }
+                    aiMsg.text += delta;
+                    this.scrollToBottom();
+                };
+
+                const handleFrame = (event, data) => {
+                    if (event === 'moderation' && data.flagged) {
+                        chat.messages.push({
+                            role: 'ai',
+                            text: data.ai_response,
+                            is_flagged: true
+                        });
+                        this.showToastMessage(this.t[this.lang].toast_error_content_safety, 'error');
+                        aiMsg = false;
+                    } else if (event === 'delta' && aiMsg !== false) {
+                        renderDelta(data.text);
+                    } else if (event === 'done' && aiMsg !== false) {
+                        // el frame final trae la respuesta completa (también en errores)
+                        if (!aiMsg) renderDelta('');
+                        aiMsg.text = data.response;
+                    }
+                };
+
+                // parser SSE incremental: frames separados por línea en blanco
+                const reader = res.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+
+                    let sep;
+                    while ((sep = buffer.indexOf('\n\n')) !== -1) {
+                        const frame = buffer.slice(0, sep);
+                        buffer = buffer.slice(sep + 2);
+
+                        let event = 'message';
+                        let payload = '';
+                        for (const line of frame.split('\n')) {
+                            if (line.startsWith('event:')) event = line.slice(6).trim();
+                            else if (line.startsWith('data:')) payload += line.slice(5).trim();
+                        }
+                        if (payload) handleFrame(event, JSON.parse(payload));
+                    }
                 }
-                // Eliminé la línea extra que tenías aquí abajo que duplicaba el mensaje
 
             } catch (error) { 
                 console.error(error);
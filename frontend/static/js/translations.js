@@ -2,6 +2,7 @@ window.CIVIC_DATA = {
     es: {
         new_chat: 'Nuevo Chat',
         history: 'HISTORIAL',
+        load_more_chats: 'Ver más',
         settings: 'Ajustes',
         login: 'Iniciar Sesión',
         logout: 'Cerrar Sesión',
@@ -115,6 +116,7 @@ window.CIVIC_DATA = {
     en: {
         new_chat: 'New Chat',
         history: 'HISTORY',
+        load_more_chats: 'Load more',
         settings: 'Settings',
         login: 'Log In',
         logout: 'Log Out',
@@ -227,6 +229,7 @@ window.CIVIC_DATA = {
     fr: {
         new_chat: 'Nouveau chat',
         history: 'HISTORIQUE',
+        load_more_chats: 'Voir plus',
         settings: 'Paramètres',
         login: 'Connexion',
         logout: 'Déconnexion',
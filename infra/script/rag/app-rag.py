@@ -1,11 +1,52 @@
+"""
+Ingesta de las gacetas (markdown) en Postgres con embeddings de Azure OpenAI.
+
+    python app-rag.py
+    python app-rag.py --root cdmx_gacetas/ --tpm 240000 --rpm 1400
+    python app-rag.py --restart        # ignora el checkpoint y vuelve a cargar todo
+
+La ingesta es un pipeline con colas acotadas, así que la memoria no depende
+del tamaño del archivo:
+
+    archivos (generador) -> chunking (procesos) -> cola -> embeddings en lotes (input=[...])
+        -> cola -> COPY a Postgres
+
+Cada archivo se parte en chunks de ~512 tokens por encabezados y artículos
+(ver chunker.py). El trabajo de CPU corre en un pool de procesos.
+
+Los embeddings se piden en lotes, con límite de requests y tokens por minuto.
+Un 429 pausa a todos los envíos el tiempo que indique Azure. Un archivo se
+carga completo o no se carga: sus filas se reemplazan en una sola
+transacción y después se anota en el checkpoint. Al interrumpir y volver a
+correr, se salta lo que ya está en el checkpoint. Al final se reportan los
+archivos cargados, los que fallaron y el motivo.
+
+Cada archivo se identifica (checkpoint y source_filename) por su ruta relativa
+a --root, así dos gacetas con el mismo nombre en carpetas distintas no se pisan.
+Las ingestas anteriores usaban solo el nombre: esos archivos no están en el
+checkpoint con su ruta nueva, se vuelven a cargar y al reemplazarlos también
+se borran sus filas guardadas con el nombre viejo.
+"""
+
 import os
 import glob
+import time
+import asyncio
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import asyncpg
-from openai import AsyncAzureOpenAI
-from datetime import datetime
-import asyncio
-from typing import Optional, List 
+from dataclasses import dataclass, field
+from openai import (AsyncAzureOpenAI, APIConnectionError, APITimeoutError, BadRequestError,
+                    InternalServerError, RateLimitError)
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Cache de embeddings compartido con el backend (el módulo no depende del resto de la app)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "backend", "chat"))
+from embedding_cache import EmbeddingCache
+from chunker import chunk_path, source_name, CHUNK_TARGET_TOKENS, CHUNK_OVERLAP_TOKENS
 
 # ----------------------------------------------------
 # 1. CONFIGURACIÓN (REEMPLAZA ESTOS VALORES)
@@ -17,157 +58,509 @@ DB_USER = os.environ['AZURE_DB_USER_PSQL']
 DB_PASS = os.environ['AZURE_DB_PASSWORD']
 DB_NAME = os.environ['AZURE_DB_NAME_PSQL']
 POSTGRES_TABLE = "gazette_chunks"
+# Tabla temporal (por conexión) donde cae el COPY antes de pasar a POSTGRES_TABLE
+STAGING_TABLE = "gazette_chunks_staging"
 
 # Azure OpenAI Configuration
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_API_KEY") 
-OPENAI_DEPLOYMENT_ID = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT") 
+AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_API_KEY")
+OPENAI_DEPLOYMENT_ID = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
 
 # File Path
-FILE_ROOT_PATH = "cdmx_gacetas/" 
+FILE_ROOT_PATH = "cdmx_gacetas/"
+
+# Cuota del deployment de embeddings (ajústala a la de tu recurso de Azure OpenAI)
+EMBEDDING_RPM = int(os.getenv("EMBEDDING_RPM", "1000"))
+EMBEDDING_TPM = int(os.getenv("EMBEDDING_TPM", "150000"))
+# Textos por request y tope estimado de tokens por request
+EMBEDDING_BATCH_SIZE = 16
+EMBEDDING_BATCH_TOKENS = 60000
+# Requests de embeddings en vuelo
+EMBEDDING_CONCURRENCY = 4
+# Reintentos de un lote ante 429 / timeouts / errores 5xx
+EMBEDDING_MAX_RETRIES = 6
+
+# Procesos que parten los archivos en chunks (0 = uno por núcleo)
+CHUNK_WORKERS = 0
 
-# Concurrencia Máxima (Ajusta según las cuotas de tu API de OpenAI)
-MAX_CONCURRENCY = 100 
+# Archivos en cada cola (lo que puede haber en memoria entre etapas)
+QUEUE_SIZE = 64
+# Archivos por transacción y conexiones que escriben en paralelo
+DB_BATCH_FILES = 50
+DB_WRITERS = 2
 
-# Inicializar Cliente Asíncrono de Azure OpenAI
+# Archivos ya cargados (uno por línea); permite retomar una ingesta interrumpida
+CHECKPOINT_PATH = os.getenv("INGEST_CHECKPOINT", "ingest_checkpoint.txt")
+
+# Embeddings ya calculados en ingestas anteriores (re-ingestar no vuelve a pagar la API)
+EMBEDDING_CACHE_DB = os.getenv("EMBEDDING_CACHE_DB", "embedding_cache.db")
+embedding_cache = EmbeddingCache(max_size=1000, db_path=EMBEDDING_CACHE_DB)
+
+# Inicializar Cliente Asíncrono de Azure OpenAI (los reintentos los maneja el pipeline)
 client = AsyncAzureOpenAI(
     api_key=AZURE_OPENAI_KEY,
     api_version="2024-02-01",
-    azure_endpoint=AZURE_OPENAI_ENDPOINT
+    azure_endpoint=AZURE_OPENAI_ENDPOINT,
+    max_retries=0
 )
 
 # ----------------------------------------------------
-# 2. FUNCIONES CRÍTICAS ASÍNCRONAS
+# 2. ARCHIVOS
+# ----------------------------------------------------
+
+def estimate_tokens(text: str) -> int:
+    """ ~4 caracteres por token (solo para el límite de tokens por minuto). """
+    return (len(text) + 3) // 4
+
+
+@dataclass
+class GazetteFile:
+    """ Un archivo en el pipeline: sus chunks y, conforme llegan, sus embeddings. """
+    file_name: str
+    gazette_date: date
+    collection_name: str
+    chunks: List[Tuple[str, str]]  # (chunk_id, texto)
+    vectors: List[Optional[List[float]]] = field(default_factory=list)
+    pending: int = 0
+    error: Optional[str] = None
+
+
+def walk_files(root: str) -> Iterator[str]:
+    """ Rutas de los .md bajo `root`, una a la vez (sin listar todo el árbol en memoria). """
+    yield from glob.iglob(os.path.join(root, "**", "*.md"), recursive=True)
+
+
+# ----------------------------------------------------
+# 3. PROGRESO Y CHECKPOINT
 # ----------------------------------------------------
 
-def classify_collection(date_gaceta: datetime) -> str:
-    """Clasifica la fecha en collection1 o collection2."""
-    # (Lógica de clasificación igual)
-    start_c1 = datetime(2024, 10, 1).date()
-    end_c1 = datetime(2025, 1, 31).date()
-    date = date_gaceta.date()
-    
-    if start_c1 <= date <= end_c1:
-        return "collection1"
-    elif date.year >= 2025 or date.month >= 2:
-        return "collection2"
-    else:
-        return "unknown" 
-
-async def get_openai_embedding(text: str) -> Optional[List[float]]:
-    """Llama a la API de forma asíncrona y aplica el casteo a float32."""
+class Checkpoint:
+    """ Nombres de los archivos ya cargados, en un archivo de texto de solo agregar. """
+
+    def __init__(self, path: str, restart: bool = False):
+        self.path = path
+        self.done = set()
+        if restart and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.done = {line.strip() for line in f if line.strip()}
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def mark(self, file_names: List[str]):
+        self._file.write("".join(f"{name}\n" for name in file_names))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.done.update(file_names)
+
+    def close(self):
+        self._file.close()
+
+
+class Progress:
+    """ Conteos por archivo y por chunk, con el motivo de cada archivo fallido. """
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.files_ok = 0
+        self.chunks_ok = 0
+        self.skipped_checkpoint = 0
+        self.skipped_invalid: Dict[str, str] = {}
+        self.failed: Dict[str, str] = {}
+        self.embedding_requests = 0
+        self.embedding_retries = 0
+
+    def ok(self, files: List[GazetteFile]):
+        self.files_ok += len(files)
+        self.chunks_ok += sum(len(f.chunks) for f in files)
+        if self.files_ok // 500 != (self.files_ok - len(files)) // 500:
+            self.report_line()
+
+    def fail(self, file: GazetteFile, reason: str):
+        self.failed[file.file_name] = reason
+        print(f"❌ {file.file_name}: {reason}")
+
+    def report_line(self):
+        elapsed = time.perf_counter() - self.inicio
+        print(f"  {self.files_ok} archivos ({self.chunks_ok} chunks) en {elapsed:.0f}s | "
+              f"fallidos: {len(self.failed)} | requests de embeddings: {self.embedding_requests}")
+
+    def report(self):
+        print("\n--- INGESTA COMPLETADA ---")
+        print(f"Archivos cargados: {self.files_ok} ({self.chunks_ok} chunks)")
+        print(f"Archivos fallidos: {len(self.failed)}")
+        print(f"Archivos inválidos (saltados): {len(self.skipped_invalid)}")
+        print(f"Archivos ya cargados (checkpoint): {self.skipped_checkpoint}")
+        print(f"Requests de embeddings: {self.embedding_requests} (reintentos: {self.embedding_retries})")
+        print(f"Tiempo total: {time.perf_counter() - self.inicio:.1f}s")
+        for name, reason in list(self.failed.items())[:20]:
+            print(f"  ✗ {name}: {reason}")
+        if len(self.failed) > 20:
+            print(f"  ... y {len(self.failed) - 20} más")
+
+# ----------------------------------------------------
+# 4. EMBEDDINGS
+# ----------------------------------------------------
+
+class RateLimiter:
+    """ Requests y tokens por minuto: dos cubetas que se rellenan de forma continua. """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._resume_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def pause(self, seconds: float):
+        """ Tras un 429 nadie envía hasta que pase `seconds`. """
+        self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    async def acquire(self, tokens: int):
+        tokens = min(tokens, self.tpm)
+        async with self._lock:
+            while True:
+                espera = self._resume_at - time.monotonic()
+                if espera <= 0:
+                    self._refill()
+                    if self._requests >= 1 and self._tokens >= tokens:
+                        self._requests -= 1
+                        self._tokens -= tokens
+                        return
+                    espera = max((1 - self._requests) * 60 / self.rpm, (tokens - self._tokens) * 60 / self.tpm)
+                await asyncio.sleep(espera)
+
+
+def _retry_after(error) -> Optional[float]:
+    response = getattr(error, "response", None)
     try:
-        response = await client.embeddings.create( 
-            model=OPENAI_DEPLOYMENT_ID,
-            input=text
-        )
-        vector_float64 = response.data[0].embedding
-        
-        # Casteo de float64 a float32
-        vector_float32_list = np.array(vector_float64, dtype=np.float32).tolist()
-        
-        return vector_float32_list
-    except Exception as e:
-        # Esto captura errores de API (ej. Rate Limiting)
-        print(f"❌ Error API/Embedding: {str(e)[:100]}...")
-        # Devolver None permite que el flujo continúe sin bloquearse
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
         return None
 
-async def insert_chunk(pool, data_tuple: tuple):
-    """Inserta un chunk en la DB dentro de una transacción."""
-    INSERT_SQL = f"""
-        INSERT INTO {POSTGRES_TABLE} (chunk_id, source_filename, chunk_text, collection_name, gazette_date, embedding)
-        VALUES ($1, $2, $3, $4, $5, $6);
+
+class Embedder:
     """
-    try:
-        async with pool.acquire() as conn: # Adquirir una conexión del pool
-            # Usar await para ejecutar el comando
-            await conn.execute(INSERT_SQL, *data_tuple)
-        return True
-    except Exception as e:
-        print(f"❌ Error DB para {data_tuple[0]}: {e}")
-        return False
+    Junta chunks de varios archivos en requests de `batch_size` textos y los
+    envía con a lo más `concurrency` en vuelo. Un archivo pasa a la cola de
+    salida cuando tiene todos sus embeddings.
+    """
+
+    def __init__(self, progress: Progress, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 batch_tokens: int = EMBEDDING_BATCH_TOKENS, concurrency: int = EMBEDDING_CONCURRENCY,
+                 rpm: int = EMBEDDING_RPM, tpm: int = EMBEDDING_TPM):
+        self.progress = progress
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        self.limiter = RateLimiter(rpm, tpm)
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+        self._out: Optional[asyncio.Queue] = None
+
+    async def run(self, files_in: asyncio.Queue, files_out: asyncio.Queue):
+        """ Consume archivos hasta recibir None; al terminar espera los lotes en vuelo. """
+        self._out = files_out
+        lote, tokens_lote = [], 0
+        terminado = False
+        while not terminado:
+            try:
+                # Si la lectura se atrasa, el lote incompleto se envía en vez de esperar
+                file = await asyncio.wait_for(files_in.get(), timeout=0.5 if lote else None)
+            except asyncio.TimeoutError:
+                await self._dispatch(lote)
+                lote, tokens_lote = [], 0
+                continue
+            if file is None:
+                terminado = True
+                continue
+
+            file.vectors = [None] * len(file.chunks)
+            for i, (_, text) in enumerate(file.chunks):
+                cached = embedding_cache.get(OPENAI_DEPLOYMENT_ID, text)
+                if cached is not None:
+                    file.vectors[i] = cached
+                    continue
+                tokens = estimate_tokens(text)
+                if lote and (len(lote) >= self.batch_size or tokens_lote + tokens > self.batch_tokens):
+                    await self._dispatch(lote)
+                    lote, tokens_lote = [], 0
+                file.pending += 1
+                lote.append((file, i, text))
+                tokens_lote += tokens
+            if not file.pending:
+                await self._out.put(file)
+
+        await self._dispatch(lote)
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    async def _dispatch(self, lote):
+        if not lote:
+            return
+        await self._slots.acquire()
+        task = asyncio.create_task(self._send(lote))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, lote):
+        try:
+            await self._embed_batch(lote)
+        finally:
+            self._slots.release()
+
+    async def _embed_batch(self, lote):
+        textos = [text for _, _, text in lote]
+        response, error = None, None
+        for intento in range(EMBEDDING_MAX_RETRIES + 1):
+            await self.limiter.acquire(sum(estimate_tokens(t) for t in textos))
+            self.progress.embedding_requests += 1
+            try:
+                response = await client.embeddings.create(model=OPENAI_DEPLOYMENT_ID, input=textos)
+                break
+            except BadRequestError as e:
+                if len(lote) > 1:
+                    # Un texto inválido (p. ej. demasiado largo) no debe tirar al resto del lote
+                    mitad = len(lote) // 2
+                    await self._embed_batch(lote[:mitad])
+                    await self._embed_batch(lote[mitad:])
+                    return
+                error = f"embedding rechazado: {str(e)[:100]}"
+                break
+            except (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError) as e:
+                error = f"embedding sin respuesta tras {intento + 1} intentos ({type(e).__name__})"
+                if intento == EMBEDDING_MAX_RETRIES:
+                    break
+                espera = _retry_after(e) or min(60.0, 2 ** intento)
+                if isinstance(e, RateLimitError):
+                    self.limiter.pause(espera)
+                self.progress.embedding_retries += 1
+                await asyncio.sleep(espera)
+
+        if response is None:
+            for file, _, _ in lote:
+                file.error = file.error or error
+                await self._chunk_done(file)
+            return
+
+        for (file, i, text), item in zip(lote, sorted(response.data, key=lambda d: d.index)):
+            # Casteo de float64 a float32
+            vector = np.asarray(item.embedding, dtype=np.float32)
+            embedding_cache.set(OPENAI_DEPLOYMENT_ID, text, vector)
+            file.vectors[i] = vector.tolist()
+            await self._chunk_done(file)
+
+    async def _chunk_done(self, file: GazetteFile):
+        file.pending -= 1
+        if file.pending:
+            return
+        if file.error:
+            self.progress.fail(file, file.error)
+        else:
+            await self._out.put(file)
+
+# ----------------------------------------------------
+# 5. CARGA EN POSTGRES
+# ----------------------------------------------------
+
+async def _init_connection(conn):
+    """ Tabla temporal de la conexión; se vacía sola al terminar cada transacción. """
+    await conn.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+            chunk_id text, source_filename text, chunk_text text,
+            collection_name text, gazette_date date, embedding text
+        ) ON COMMIT DELETE ROWS
+    """)
+
+
+def _records(files: List[GazetteFile]):
+    for file in files:
+        for (chunk_id, text), vector in zip(file.chunks, file.vectors):
+            # pgvector no tiene codec binario en asyncpg: el vector viaja como texto y se castea
+            yield (chunk_id, file.file_name, text, file.collection_name, file.gazette_date,
+                   "[" + ",".join(map(str, vector)) + "]")
+
+
+async def insert_files(pool, files: List[GazetteFile]):
+    """
+    Reemplaza las filas de los archivos en una transacción: COPY a la tabla
+    temporal, DELETE de lo que hubiera de esos archivos e INSERT ... SELECT.
+
+    Las ingestas anteriores guardaban solo el nombre del archivo (sin la
+    subcarpeta): también se borran esas filas para no dejar chunks viejos.
+    """
+    nombres = {f.file_name for f in files}
+    nombres |= {os.path.basename(nombre) for nombre in nombres}
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.copy_records_to_table(STAGING_TABLE, records=list(_records(files)))
+            await conn.execute(
+                f"DELETE FROM {POSTGRES_TABLE} WHERE source_filename = ANY($1::text[])",
+                sorted(nombres)
+            )
+            await conn.execute(f"""
+                INSERT INTO {POSTGRES_TABLE} (chunk_id, source_filename, chunk_text, collection_name, gazette_date, embedding)
+                SELECT chunk_id, source_filename, chunk_text, collection_name, gazette_date, embedding::vector
+                FROM {STAGING_TABLE}
+            """)
+
+
+async def write_files(pool, files_in: asyncio.Queue, checkpoint: Checkpoint, progress: Progress,
+                      batch_files: int = DB_BATCH_FILES):
+    """ Escritor: junta hasta `batch_files` archivos listos por transacción, hasta recibir None. """
+    terminado = False
+    while not terminado:
+        lote = []
+        file = await files_in.get()
+        # Cada escritor recibe su propio None: se deja de juntar al encontrarlo
+        while file is not None:
+            lote.append(file)
+            if len(lote) >= batch_files or files_in.empty():
+                break
+            file = files_in.get_nowait()
+        terminado = file is None
+        if not lote:
+            continue
+
+        try:
+            await insert_files(pool, lote)
+            cargados = lote
+        except Exception as e:
+            # Se reintenta archivo por archivo para aislar al que falla
+            print(f"❌ Error DB en un lote de {len(lote)} archivos ({str(e)[:100]}), reintentando uno por uno")
+            cargados = []
+            for file in lote:
+                try:
+                    await insert_files(pool, [file])
+                    cargados.append(file)
+                except Exception as e:
+                    progress.fail(file, f"error DB: {str(e)[:100]}")
+        if cargados:
+            checkpoint.mark([f.file_name for f in cargados])
+            progress.ok(cargados)
 
 # ----------------------------------------------------
-# 3. COORDINACIÓN ASÍNCRONA
+# 6. COORDINACIÓN ASÍNCRONA
 # ----------------------------------------------------
 
-async def process_and_insert_files_async():
-    """Coordina la lectura de archivos, vectorización concurrente y la inserción."""
-    # Pool de Conexiones para manejar la concurrencia de la DB
+async def read_files(root: str, files_out: asyncio.Queue, checkpoint: Checkpoint, progress: Progress,
+                     executor: ProcessPoolExecutor, workers: int, target: int, overlap: int):
+    """
+    Productor: los archivos pendientes se leen y parten en el pool de procesos,
+    con a lo más dos por proceso en vuelo (la cola acotada frena la lectura).
+    """
+    loop = asyncio.get_running_loop()
+    en_vuelo = {}
+
+    async def entregar(terminados):
+        for future in terminados:
+            file_name = en_vuelo.pop(future)
+            try:
+                name, gazette_date, collection_name, chunks = future.result()
+            except (ValueError, OSError) as e:
+                progress.skipped_invalid[file_name] = str(e)
+                print(f"❌ Error: {file_name}: {e}. Saltando.")
+                continue
+            await files_out.put(GazetteFile(name, gazette_date, collection_name, chunks))
+
+    for path in walk_files(root):
+        file_name = source_name(path, root)
+        if file_name in checkpoint.done:
+            progress.skipped_checkpoint += 1
+            continue
+        en_vuelo[loop.run_in_executor(executor, chunk_path, path, target, overlap, root)] = file_name
+        if len(en_vuelo) >= workers * 2:
+            terminados, _ = await asyncio.wait(en_vuelo, return_when=asyncio.FIRST_COMPLETED)
+            await entregar(terminados)
+    if en_vuelo:
+        terminados, _ = await asyncio.wait(en_vuelo)
+        await entregar(terminados)
+    await files_out.put(None)
+
+
+async def process_and_insert_files_async(args):
+    """Coordina lectura, vectorización por lotes y carga; las etapas corren a la vez."""
     pool = await asyncpg.create_pool(
         host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS,
-        min_size=10, max_size=MAX_CONCURRENCY 
+        min_size=1, max_size=args.db_writers, init=_init_connection
     )
-    
-    tasks = []
-    
-    # 1. Leer todos los archivos y crear las tareas de vectorización
-    for file_path in glob.glob(os.path.join(FILE_ROOT_PATH, "**", "*.md"), recursive=True):
-        
-        file_name = os.path.basename(file_path)
-        
-        try:
-            date_str = file_name[:10]
-            gazette_date = datetime.strptime(date_str, '%Y-%m-%d')
-            collection_name = classify_collection(gazette_date)
-        except ValueError:
-            print(f"❌ Error: No se pudo parsear la fecha del archivo: {file_name}. Saltando.")
-            continue
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            chunk_text = f.read()
+    checkpoint = Checkpoint(args.checkpoint, restart=args.restart)
+    progress = Progress()
+    embedder = Embedder(progress, batch_size=args.batch_size, batch_tokens=args.batch_tokens,
+                        concurrency=args.concurrency, rpm=args.rpm, tpm=args.tpm)
 
-        if not chunk_text.strip():
-            continue
+    workers = args.chunk_workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers)
+
+    leidos = asyncio.Queue(maxsize=args.queue_size)
+    vectorizados = asyncio.Queue(maxsize=args.queue_size)
 
-        chunk_id = file_name.replace('.md', '')
-        
-        # Se crea una 'Tarea' asíncrona para cada chunk
-        task = process_single_chunk(pool, chunk_id, file_name, chunk_text, collection_name, gazette_date)
-        tasks.append(task)
-    
-    # 2. Ejecutar todas las tareas concurrentemente
-    print(f"Iniciando procesamiento concurrente de {len(tasks)} archivos...")
-    # asyncio.gather ejecuta todas las tareas a la vez
-    results = await asyncio.gather(*tasks) 
-    
-    successful_inserts = sum(results)
-    print("\n--- INGESTA COMPLETADA ---")
-    print(f"Total de tareas intentadas: {len(tasks)}")
-    print(f"Chunks insertados con éxito: {successful_inserts}")
-    
-    await pool.close()
-
-async def process_single_chunk(pool, chunk_id, file_name, chunk_text, collection_name, gazette_date):
-    """Procesa un solo chunk: vectoriza e inserta."""
-    vector = await get_openai_embedding(chunk_text) # El bottleneck de red se espera
-    
-    if vector:
-        data_tuple = (
-            chunk_id, 
-            file_name, 
-            chunk_text, 
-            collection_name, 
-            gazette_date.date(), # Insertar solo la fecha
-            vector
+    async def vectorizar():
+        await embedder.run(leidos, vectorizados)
+        for _ in range(args.db_writers):
+            await vectorizados.put(None)
+
+    print(f"Iniciando ingesta de {args.root} ({len(checkpoint.done)} archivos ya en el checkpoint)...")
+    try:
+        await asyncio.gather(
+            read_files(args.root, leidos, checkpoint, progress, executor, workers,
+                       args.chunk_tokens, args.chunk_overlap),
+            vectorizar(),
+            *(write_files(pool, vectorizados, checkpoint, progress, args.db_batch_files)
+              for _ in range(args.db_writers))
         )
-        # 🔑 Inserción asíncrona en la DB
-        return await insert_chunk(pool, data_tuple) 
-    else:
-        # El embedding falló (ej. Rate limit)
-        return False
+    finally:
+        executor.shutdown(cancel_futures=True)
+        checkpoint.close()
+        await pool.close()
+
+    progress.report()
+    cache_stats = embedding_cache.stats()
+    print(f"Embeddings desde cache: {cache_stats['hits']} | llamadas a la API: {cache_stats['misses']} "
+          f"(hit rate {cache_stats['hit_rate']:.1%})")
 
+    # Avisamos al backend que el corpus cambió (invalida su cache semántico)
+    corpus_marker = os.getenv("SEMANTIC_CACHE_CORPUS_MARKER")
+    if corpus_marker and progress.files_ok:
+        with open(corpus_marker, 'w', encoding='utf-8') as f:
+            f.write(datetime.now().isoformat())
 
 # ----------------------------------------------------
-# 4. PUNTO DE ENTRADA
+# 7. PUNTO DE ENTRADA
 # ----------------------------------------------------
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingesta de las gacetas en Postgres (pgvector)")
+    parser.add_argument("--root", default=FILE_ROOT_PATH)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--restart", action="store_true", help="Borra el checkpoint y recarga todo")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TARGET_TOKENS, help="Tokens objetivo por chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP_TOKENS, help="Tokens repetidos entre chunks")
+    parser.add_argument("--chunk-workers", type=int, default=CHUNK_WORKERS, help="Procesos de chunking (0 = núcleos)")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE, help="Textos por request de embeddings")
+    parser.add_argument("--batch-tokens", type=int, default=EMBEDDING_BATCH_TOKENS)
+    parser.add_argument("--concurrency", type=int, default=EMBEDDING_CONCURRENCY)
+    parser.add_argument("--rpm", type=int, default=EMBEDDING_RPM, help="Requests por minuto del deployment")
+    parser.add_argument("--tpm", type=int, default=EMBEDDING_TPM, help="Tokens por minuto del deployment")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--db-batch-files", type=int, default=DB_BATCH_FILES)
+    parser.add_argument("--db-writers", type=int, default=DB_WRITERS)
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
     # La función main debe ser el punto de entrada síncrono que llama al asíncrono
     try:
-        asyncio.run(process_and_insert_files_async())
+        asyncio.run(process_and_insert_files_async(parse_args()))
     except KeyboardInterrupt:
-        print("\nProceso interrumpido por el usuario.")
+        print("\nProceso interrumpido por el usuario (el checkpoint permite retomarlo).")
     except Exception as e:
-        print(f"\n❌ ERROR FATAL EN EL MAIN: {e}")
\ No newline at end of file
+        print(f"\n❌ ERROR FATAL EN EL MAIN: {e}")
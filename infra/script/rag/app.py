@@ -2,7 +2,9 @@ import asyncio
 import os
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents.indexes import SearchIndexerClient
-from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient
+from azure.core.pipeline.transport import AioHttpTransport
+import aiohttp
 from azure.search.documents.indexes.models import (
     DataSourceConnection,
     SearchIndexerSkillset,
@@ -16,6 +18,8 @@ from azure.search.documents.indexes.models import (
     HighWaterMarkChangeDetectionPolicy,
 )
 
+from retrieval import BM25Index, LatencyTracker, hedged_call, reciprocal_rank_fusion
+
 # *** Finalmente no funciona tiene problemas con el SDK ***
 
 # =========================
@@ -36,6 +40,16 @@ DATASOURCE_CURRENT = "data-source-current"
 INDEXER_HISTORIC = "rag-indexer-1"
 INDEXER_CURRENT = "rag-indexer-2"
 
+# Fusión: peso de cada lista en RRF (la preferencia por lo reciente la da el boost por fecha) y corpus para BM25
+FUSION_WEIGHTS = {INDEX_NAMES[0]: 1.0, INDEX_NAMES[1]: 1.0, "bm25": 0.8}
+BM25_CORPUS_PATH = os.getenv("BM25_CORPUS_PATH", "cdmx_gacetas/")
+
+# Tiempo máximo por índice (segundos): al vencer, la fusión sigue con los resultados parciales
+SEARCH_DEADLINES = {
+    INDEX_NAMES[0]: float(os.getenv("SEARCH_DEADLINE_HISTORIC", "1.5")),
+    INDEX_NAMES[1]: float(os.getenv("SEARCH_DEADLINE_CURRENT", "1.5")),
+}
+
 # Cliente de Azure AI Search (para crear/gestionar recursos)
 search_admin_client = SearchIndexerClient(
     endpoint=AZURE_SEARCH_ENDPOINT, 
@@ -211,26 +225,79 @@ def create_search_resources():
 #              PARALLEL SEARCH AND FUSION FUNCTION
 # ====================================================================
 
+# ====================================================================
+#              SEARCH CLIENTS (uno por índice, de vida larga)
+# ====================================================================
+
+_http_session = None
+_search_clients = {}
+search_latency = {name: LatencyTracker() for name in INDEX_NAMES}
+
+def get_search_client(index_name: str) -> SearchClient:
+    """Cliente asíncrono del índice; todos comparten una sesión aiohttp (pool de conexiones)."""
+    global _http_session
+    client = _search_clients.get(index_name)
+    if client is None:
+        if _http_session is None:
+            _http_session = aiohttp.ClientSession()
+        client = _search_clients[index_name] = SearchClient(
+            endpoint=AZURE_SEARCH_ENDPOINT,
+            index_name=index_name,
+            credential=AzureKeyCredential(AZURE_SEARCH_KEY),
+            transport=AioHttpTransport(session=_http_session, session_owner=False)
+        )
+    return client
+
+
+async def close_search_clients():
+    """Cierra los clientes y la sesión compartida (al terminar el proceso)."""
+    global _http_session
+    for client in _search_clients.values():
+        await client.close()
+    _search_clients.clear()
+    if _http_session is not None:
+        await _http_session.close()
+        _http_session = None
+
+
 async def search_index_async(index_name: str, query_text: str, top: int = 4):
     """Ejecuta una búsqueda híbrida asíncrona en un solo índice."""
-    search_client = SearchClient(
-        endpoint=AZURE_SEARCH_ENDPOINT,
-        index_name=index_name,
-        credential=AzureKeyCredential(AZURE_SEARCH_KEY)
-    )
+    search_client = get_search_client(index_name)
     
     # Parámetros para búsqueda híbrida
     results = await search_client.search(
         search_text=query_text, 
         query_type="semantic", # Asume que el índice tiene Semantic Search configurado
-        select=["content", "source"],
+        select=["id", "content", "source", "lastUpdated"],
         top=top, # Pide los top 'n' de cada índice
         include_total_count=True,
         vector_queries=[], # Si estuvieras generando el vector aquí, lo pasarías
         # Aquí puedes agregar el filtro OData si fuera necesario, pero no lo es con la segmentación por carpeta
         # filter=None 
     )
-    return [{"@search.score": r["@search.score"], "content": r["content"], "source": r["source"]} async for r in results]
+    return [{"@search.score": r["@search.score"], "id": r.get("id"), "content": r["content"],
+             "source": r["source"], "lastUpdated": r.get("lastUpdated"), "collection": index_name} async for r in results]
+
+
+async def search_index_with_deadline(index_name: str, query_text: str, top: int = 4):
+    """search_index_async con deadline y hedging; devuelve [] si el índice no respondió a tiempo."""
+    return await hedged_call(
+        lambda: search_index_async(index_name, query_text, top=top),
+        search_latency[index_name],
+        SEARCH_DEADLINES[index_name],
+        default=[]
+    )
+
+
+_bm25_index = None
+
+def get_bm25_index():
+    """Índice BM25 sobre los chunks locales (se construye una vez; None si no hay corpus)."""
+    global _bm25_index
+    if _bm25_index is None and os.path.isdir(BM25_CORPUS_PATH):
+        _bm25_index = BM25Index.from_directory(BM25_CORPUS_PATH)
+        print(f"BM25: {len(_bm25_index.docs)} chunks indexados desde {BM25_CORPUS_PATH}")
+    return _bm25_index
 
 
 async def execute_fused_search(query_text: str, top_k_total: int = 8):
@@ -238,31 +305,29 @@ async def execute_fused_search(query_text: str, top_k_total: int = 8):
     
     print(f"\n--- Ejecutando búsqueda paralela para: '{query_text}' ---")
     
-    # 1. Ejecución Asíncrona de Tareas
+    # 1. Ejecución Asíncrona de Tareas (cada índice con su deadline: uno lento no frena al otro)
     tasks = [
-        search_index_async(INDEX_NAMES[0], query_text, top=top_k_total), # Histórico
-        search_index_async(INDEX_NAMES[1], query_text, top=top_k_total)  # Actual
+        search_index_with_deadline(INDEX_NAMES[0], query_text, top=top_k_total), # Histórico
+        search_index_with_deadline(INDEX_NAMES[1], query_text, top=top_k_total)  # Actual
     ]
     
-    # results_historic y results_current se obtienen en paralelo
+    # results_historic y results_current se obtienen en paralelo ([] si su índice venció)
     results_historic, results_current = await asyncio.gather(*tasks)
 
-    # 2. Fusión y Re-ranking
-    all_results = results_historic + results_current
-    
-    # 3. Clasificación por Score (@search.score)
-    final_ranked_chunks = sorted(
-        all_results, 
-        key=lambda r: r['@search.score'], 
-        reverse=True
-    )
-    
-    # 4. Selección del Top K total
-    top_k_context = final_ranked_chunks[:top_k_total]
+    # 2. Candidatos léxicos locales (artículos, nombres de trámites) sin llamada a embeddings
+    ranked_lists = {INDEX_NAMES[0]: results_historic, INDEX_NAMES[1]: results_current}
+    bm25 = get_bm25_index()
+    if bm25 is not None:
+        ranked_lists["bm25"] = bm25.search(query_text, top=top_k_total)
+
+    # 3. Fusión por posición (RRF) con peso por colección y boost por fecha de la gaceta.
+    #    Los @search.score de índices distintos no son comparables, las posiciones sí.
+    top_k_context = reciprocal_rank_fusion(ranked_lists, weights=FUSION_WEIGHTS, top_k=top_k_total)
     
-    print(f"Resultados recuperados (Total: {len(all_results)}, Top {top_k_total} fusionados):")
+    total = sum(len(r) for r in ranked_lists.values())
+    print(f"Resultados recuperados (Total: {total}, Top {top_k_total} fusionados):")
     for i, chunk in enumerate(top_k_context):
-        print(f"  {i+1}. Score: {chunk['@search.score']:.4f} | Source: {chunk['source']}")
+        print(f"  {i+1}. RRF: {chunk['@rrf.score']:.4f} | {'+'.join(chunk['@rrf.lists'])} | Source: {chunk['source']}")
 
     return top_k_context
 
@@ -0,0 +1,204 @@
+"""
+Chunking de las gacetas (markdown) por tokens para la ingesta (app-rag.py).
+
+El texto se corta en secciones por encabezados markdown y por artículos
+("Artículo 5.", "ARTÍCULO QUINTO"). Una sección más grande que el objetivo se
+parte por párrafos, luego por oraciones y, como último recurso, por
+caracteres. Después las piezas se juntan en orden hasta ~`target_tokens`, y
+cada chunk repite al inicio las últimas piezas del anterior (hasta
+`overlap_tokens`). Un encabezado cierra el chunk si este ya va a la mitad del
+objetivo, para no mezclar secciones sin necesidad.
+
+Cada chunk es un corte exacto del archivo. Su id es el nombre del archivo más
+un hash de (archivo, offset), así que no cambia entre corridas mientras el
+texto anterior al chunk no cambie.
+
+Las funciones son de nivel de módulo y no dependen del resto de la ingesta:
+`chunk_path` corre en los procesos de un ProcessPoolExecutor.
+"""
+
+import os
+import re
+import hashlib
+from datetime import date, datetime
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # los chunks se cortan por una longitud estimada (ver count_tokens)
+    tiktoken = None
+
+# Encoding de text-embedding-ada-002 / text-embedding-3-*
+EMBEDDING_ENCODING = "cl100k_base"
+
+CHUNK_TARGET_TOKENS = 512
+CHUNK_OVERLAP_TOKENS = 64
+
+# Inicio de sección: encabezado markdown o artículo (con o sin negritas)
+SECTION_RE = re.compile(
+    r"^(?:#{1,6}\s|[ \t]*(?:\*\*|__)?(?:ART[IÍ]CULO|Art[ií]culo)\s+[\wÁÉÍÓÚáéíóú]+)",
+    re.MULTILINE
+)
+HEADING_RE = re.compile(r"#{1,6}\s")
+PARAGRAPH_RE = re.compile(r"\n[ \t]*\n")
+SENTENCE_RE = re.compile(r"(?<=[.;:!?])\s+")
+
+
+class Piece(NamedTuple):
+    start: int
+    end: int
+    tokens: int
+    heading: bool  # la pieza abre una sección con encabezado markdown
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(EMBEDDING_ENCODING)
+    except Exception as e:
+        # La ingesta no se detiene por esto: cada proceso del pool de chunking avisa
+        # una sola vez (lru_cache) y sigue cortando con la estimación
+        print(f"❌ Tokenizer {EMBEDDING_ENCODING} no disponible, se estiman los tokens: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        # Los cortes caen en otros lugares, pero el tamaño de los chunks se parece al de cl100k_base
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def classify_collection(date_gaceta: datetime) -> str:
+    """Clasifica la fecha en collection1 o collection2."""
+    start_c1 = datetime(2024, 10, 1).date()
+    end_c1 = datetime(2025, 1, 31).date()
+    date = date_gaceta.date()
+
+    if start_c1 <= date <= end_c1:
+        return "collection1"
+    elif date.year >= 2025 or date.month >= 2:
+        return "collection2"
+    else:
+        return "unknown"
+
+
+def _spans(text: str, pattern: re.Pattern, start: int, end: int) -> List[Tuple[int, int]]:
+    """ Corta text[start:end] en los separadores de `pattern` (el separador queda con la pieza anterior). """
+    spans, inicio = [], start
+    for match in pattern.finditer(text, start, end):
+        if match.end() > inicio and match.start() > inicio:
+            spans.append((inicio, match.end()))
+            inicio = match.end()
+    if inicio < end:
+        spans.append((inicio, end))
+    return spans
+
+
+def _pieces(text: str, start: int, end: int, target: int, heading: bool, nivel: int = 0) -> List[Piece]:
+    """ Piezas de a lo más `target` tokens: párrafos, luego oraciones y luego caracteres. """
+    tokens = count_tokens(text[start:end])
+    if tokens <= target:
+        return [Piece(start, end, tokens, heading)]
+
+    if nivel < 2:
+        spans = _spans(text, PARAGRAPH_RE if nivel == 0 else SENTENCE_RE, start, end)
+        if len(spans) > 1:
+            piezas = []
+            for i, (a, b) in enumerate(spans):
+                piezas.extend(_pieces(text, a, b, target, heading and i == 0, nivel + 1))
+            return piezas
+        return _pieces(text, start, end, target, heading, nivel + 1)
+
+    # Sin separadores útiles: ventanas de caracteres proporcionales a los tokens
+    paso = max(1, (end - start) * target // tokens)
+    return [Piece(a, min(a + paso, end), count_tokens(text[a:min(a + paso, end)]), heading and a == start)
+            for a in range(start, end, paso)]
+
+
+def split_pieces(text: str, target: int) -> List[Piece]:
+    """ Secciones (encabezados / artículos) partidas en piezas que caben en `target`. """
+    cortes = [m.start() for m in SECTION_RE.finditer(text)]
+    limites = [0, *[c for c in cortes if c > 0], len(text)]
+    piezas = []
+    for a, b in zip(limites, limites[1:]):
+        if text[a:b].strip():
+            piezas.extend(_pieces(text, a, b, target, bool(HEADING_RE.match(text, a))))
+    return piezas
+
+
+def pack_pieces(piezas: List[Piece], target: int, overlap: int) -> List[Tuple[int, int]]:
+    """ Junta piezas consecutivas en chunks de ~`target` tokens con `overlap` tokens repetidos. """
+    chunks = []
+    i = 0
+    while i < len(piezas):
+        j, tokens = i, 0
+        while j < len(piezas):
+            pieza = piezas[j]
+            if j > i and (tokens + pieza.tokens > target or (pieza.heading and tokens >= target // 2)):
+                break
+            tokens += pieza.tokens
+            j += 1
+        chunks.append((piezas[i].start, piezas[j - 1].end))
+        if j >= len(piezas):
+            break
+
+        # El siguiente chunk empieza con las últimas piezas de este (sin pasar de `overlap`)
+        siguiente, repetidos = j, 0
+        while siguiente - 1 > i and repetidos + piezas[siguiente - 1].tokens <= overlap:
+            siguiente -= 1
+            repetidos += piezas[siguiente].tokens
+        i = siguiente
+    return chunks
+
+
+def chunk_id(file_name: str, offset: int) -> str:
+    digest = hashlib.blake2b(f"{file_name}:{offset}".encode("utf-8"), digest_size=8).hexdigest()
+    return f"{os.path.splitext(os.path.basename(file_name))[0]}_{digest}"
+
+
+def chunk_text(file_name: str, text: str, target: int = CHUNK_TARGET_TOKENS,
+               overlap: int = CHUNK_OVERLAP_TOKENS) -> List[Tuple[str, str]]:
+    """ [(chunk_id, texto)] del documento. """
+    chunks = []
+    for start, end in pack_pieces(split_pieces(text, target), target, overlap):
+        contenido = text[start:end].strip()
+        if contenido:
+            chunks.append((chunk_id(file_name, start), contenido))
+    return chunks
+
+
+def source_name(path: str, root: Optional[str] = None) -> str:
+    """
+    Nombre con el que se guarda el archivo (source_filename y checkpoint): la ruta
+    relativa a `root` con "/", para que dos gacetas homónimas en carpetas distintas
+    no se pisen.
+    """
+    if not root:
+        return os.path.basename(path)
+    return os.path.relpath(path, root).replace(os.sep, "/")
+
+
+def chunk_path(path: str, target: int = CHUNK_TARGET_TOKENS, overlap: int = CHUNK_OVERLAP_TOKENS,
+               root: Optional[str] = None) -> Tuple[str, date, str, List[Tuple[str, str]]]:
+    """
+    Lee y parte un archivo de la gaceta: (file_name, gazette_date, collection_name, chunks),
+    con file_name = source_name(path, root).
+    ValueError si no se puede ingerir (fecha ilegible en el nombre o archivo vacío).
+    """
+    file_name = source_name(path, root)
+    try:
+        gazette_date = datetime.strptime(os.path.basename(path)[:10], '%Y-%m-%d')
+    except ValueError:
+        raise ValueError("fecha ilegible en el nombre")
+
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if not text.strip():
+        raise ValueError("archivo vacío")
+
+    return file_name, gazette_date.date(), classify_collection(gazette_date), chunk_text(file_name, text, target, overlap)
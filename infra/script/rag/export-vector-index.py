@@ -0,0 +1,205 @@
+"""
+Exporta `gazette_chunks` a un índice vectorial local (memory-mapped) para el backend.
+
+    python export-vector-index.py --out /home/data/vector-index
+    python export-vector-index.py --out /home/data/vector-index --ivf 256
+
+Crea una carpeta nueva por versión (vectores float32 normalizados + metadata)
+y al final reemplaza de forma atómica el archivo CURRENT. Los workers del
+backend (OFFICE_AGENT_LOCAL_INDEX=<out>) cambian a la versión nueva sin
+reiniciarse. Se conservan las últimas --keep versiones.
+"""
+
+import os
+import json
+import shutil
+import asyncio
+import argparse
+import numpy as np
+import asyncpg
+from datetime import datetime
+
+# ----------------------------------------------------
+# 1. CONFIGURACIÓN
+# ----------------------------------------------------
+
+DB_HOST = os.environ['AZURE_DB_HOST_PSQL']
+DB_USER = os.environ['AZURE_DB_USER_PSQL']
+DB_PASS = os.environ['AZURE_DB_PASSWORD']
+DB_NAME = os.environ['AZURE_DB_NAME_PSQL']
+POSTGRES_TABLE = "gazette_chunks"
+
+# Filas que se traen de Postgres por vuelta del cursor
+FETCH_SIZE = 1000
+# Filas del memmap que se procesan juntas al particionar (acota la memoria)
+BLOCK_SIZE = 65536
+
+# ----------------------------------------------------
+# 2. EXPORTACIÓN
+# ----------------------------------------------------
+
+async def export_rows(conn, version_dir: str):
+    """Escribe vectors.f32, meta.jsonl y meta.idx. Devuelve (count, dim)."""
+    # Snapshot consistente: el conteo y las filas salen de la misma transacción
+    async with conn.transaction(isolation='repeatable_read', readonly=True):
+        count = await conn.fetchval(f"SELECT count(*) FROM {POSTGRES_TABLE} WHERE embedding IS NOT NULL")
+        if not count:
+            return 0, 0
+
+        vectors = None
+        offsets = [0]
+        cursor = conn.cursor(
+            f"""
+            SELECT chunk_id, source_filename, chunk_text, collection_name, gazette_date, embedding::text AS embedding
+            FROM {POSTGRES_TABLE}
+            WHERE embedding IS NOT NULL
+            ORDER BY chunk_id
+            """,
+            prefetch=FETCH_SIZE
+        )
+        with open(os.path.join(version_dir, "meta.jsonl"), "wb") as meta_file:
+            row_n = 0
+            async for row in cursor:
+                vector = np.asarray(json.loads(row['embedding']), dtype=np.float32)
+                if vectors is None:
+                    vectors = np.memmap(os.path.join(version_dir, "vectors.f32"), dtype=np.float32,
+                                        mode="w+", shape=(count, vector.shape[0]))
+                norm = np.linalg.norm(vector)
+                vectors[row_n] = vector / norm if norm else vector
+
+                line = json.dumps({
+                    "id": row['chunk_id'],
+                    "content": row['chunk_text'],
+                    "metadata": {
+                        "source": row['source_filename'],
+                        "collection": row['collection_name'],
+                        "gazette_date": row['gazette_date'].isoformat() if row['gazette_date'] else None,
+                    },
+                }, ensure_ascii=False).encode("utf-8") + b"\n"
+                meta_file.write(line)
+                offsets.append(offsets[-1] + len(line))
+                row_n += 1
+
+        vectors.flush()
+        np.asarray(offsets, dtype=np.int64).tofile(os.path.join(version_dir, "meta.idx"))
+        return row_n, vectors.shape[1]
+
+
+def asignar(vectors, centroids, sumas=None):
+    """
+    Partición (centroide más cercano) de cada vector, leyendo el memmap por
+    bloques. Si se pasa `sumas` acumula ahí la suma de los vectores de cada
+    partición en la misma pasada.
+    """
+    asignacion = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), BLOCK_SIZE):
+        bloque = np.asarray(vectors[start:start + BLOCK_SIZE])
+        parte = np.argmax(bloque @ centroids.T, axis=1)
+        asignacion[start:start + len(bloque)] = parte
+        if sumas is not None:
+            np.add.at(sumas, parte, bloque)
+    return asignacion
+
+
+def build_ivf(version_dir: str, count: int, dim: int, nlist: int, iterations: int = 10, seed: int = 0):
+    """
+    Particiona el índice con k-means esférico: reordena vectores y metadata
+    para que cada partición quede contigua. Devuelve la lista de offsets.
+    """
+    vectors = np.memmap(os.path.join(version_dir, "vectors.f32"), dtype=np.float32, mode="r",
+                        shape=(count, dim))
+    nlist = max(1, min(nlist, count))
+    rng = np.random.default_rng(seed)
+    centroids = np.array(vectors[rng.choice(count, nlist, replace=False)])
+
+    for _ in range(iterations):
+        sumas = np.zeros_like(centroids)
+        asignar(vectors, centroids, sumas)
+        normas = np.linalg.norm(sumas, axis=1, keepdims=True)
+        # Las particiones vacías conservan su centroide anterior
+        centroids = np.where(normas > 0, sumas / np.maximum(normas, 1e-12), centroids).astype(np.float32)
+    asignacion = asignar(vectors, centroids)
+
+    orden = np.argsort(asignacion, kind="stable")
+    list_offsets = np.concatenate([[0], np.cumsum(np.bincount(asignacion, minlength=nlist))])
+
+    # Reescribimos vectores y metadata en el orden de las particiones
+    ordenados = np.memmap(os.path.join(version_dir, "vectors.ivf.f32"), dtype=np.float32, mode="w+",
+                          shape=(count, dim))
+    for start in range(0, count, BLOCK_SIZE):
+        ordenados[start:start + BLOCK_SIZE] = vectors[orden[start:start + BLOCK_SIZE]]
+    ordenados.flush()
+    del ordenados, vectors
+
+    offsets = np.fromfile(os.path.join(version_dir, "meta.idx"), dtype=np.int64)
+    nuevos_offsets = [0]
+    with open(os.path.join(version_dir, "meta.jsonl"), "rb") as origen, \
+            open(os.path.join(version_dir, "meta.ivf.jsonl"), "wb") as destino:
+        for row in orden:
+            origen.seek(offsets[row])
+            line = origen.read(offsets[row + 1] - offsets[row])
+            destino.write(line)
+            nuevos_offsets.append(nuevos_offsets[-1] + len(line))
+
+    os.replace(os.path.join(version_dir, "vectors.ivf.f32"), os.path.join(version_dir, "vectors.f32"))
+    os.replace(os.path.join(version_dir, "meta.ivf.jsonl"), os.path.join(version_dir, "meta.jsonl"))
+    np.asarray(nuevos_offsets, dtype=np.int64).tofile(os.path.join(version_dir, "meta.idx"))
+    centroids.tofile(os.path.join(version_dir, "centroids.f32"))
+    return nlist, list_offsets.tolist()
+
+
+def publish(out_dir: str, version: str, keep: int):
+    """Apunta CURRENT a la versión nueva (os.replace es atómico) y limpia las viejas."""
+    tmp = os.path.join(out_dir, f"CURRENT.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(out_dir, "CURRENT"))
+
+    # Los workers que aún tengan mapeada una versión borrada la siguen leyendo sin problema
+    versiones = sorted(d for d in os.listdir(out_dir) if d.startswith("v") and os.path.isdir(os.path.join(out_dir, d)))
+    for viejo in versiones[:-keep]:
+        shutil.rmtree(os.path.join(out_dir, viejo), ignore_errors=True)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Exporta los chunks de la gaceta a un índice local")
+    parser.add_argument("--out", required=True, help="Directorio del índice (OFFICE_AGENT_LOCAL_INDEX)")
+    parser.add_argument("--ivf", type=int, default=0, help="Número de particiones IVF (0 = búsqueda exacta)")
+    parser.add_argument("--keep", type=int, default=2, help="Versiones que se conservan")
+    args = parser.parse_args()
+
+    version = datetime.now().strftime("v%Y%m%d%H%M%S")
+    version_dir = os.path.join(args.out, version)
+    os.makedirs(version_dir, exist_ok=True)
+
+    conn = await asyncpg.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
+    try:
+        count, dim = await export_rows(conn, version_dir)
+    finally:
+        await conn.close()
+
+    if not count:
+        print(f"❌ {POSTGRES_TABLE} no tiene embeddings, no se publica nada")
+        shutil.rmtree(version_dir, ignore_errors=True)
+        return
+
+    manifest = {"version": version, "count": count, "dim": dim, "source_table": POSTGRES_TABLE,
+                "created_at": datetime.now().isoformat(), "ivf": None}
+    if args.ivf:
+        nlist, list_offsets = build_ivf(version_dir, count, dim, args.ivf)
+        manifest["ivf"] = {"nlist": nlist, "offsets": list_offsets}
+
+    with open(os.path.join(version_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    publish(args.out, version, args.keep)
+    ivf_info = f", {manifest['ivf']['nlist']} particiones IVF" if args.ivf else ""
+    print(f"✅ Índice {version} publicado: {count} chunks, dim {dim}{ivf_info}")
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nProceso interrumpido por el usuario.")
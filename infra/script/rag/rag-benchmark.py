@@ -0,0 +1,140 @@
+"""
+Compara la fusión actual (orden por @search.score crudo) contra RRF y RRF + BM25.
+
+    python rag-benchmark.py --queries results.json --k 8
+    python rag-benchmark.py --queries results.json --live   # consulta Azure AI Search y guarda los resultados
+
+Formato del archivo (lista de consultas):
+
+    [
+      {
+        "query": "requisitos del artículo 12 para licencia de funcionamiento",
+        "relevant": ["2025-02-10_gaceta.md"],          # source o id de los chunks correctos
+        "results": {                                    # resultados crudos por índice (opcional)
+          "rag-index-1": [{"@search.score": 12.3, "id": "...", "content": "...", "source": "..."}],
+          "rag-index-2": [...]
+        }
+      }
+    ]
+
+Con --live las consultas sin "results" se buscan en los índices y se guardan en
+el mismo archivo, así las corridas siguientes no dependen del servicio.
+"""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from retrieval import BM25Index, reciprocal_rank_fusion
+
+INDEX_NAMES = ["rag-index-1", "rag-index-2"]
+FUSION_WEIGHTS = {INDEX_NAMES[0]: 1.0, INDEX_NAMES[1]: 1.0, "bm25": 0.8}
+
+
+def merge_by_raw_score(results_by_index, k):
+    """La fusión anterior: concatenar y ordenar por @search.score."""
+    todos = [r for results in results_by_index.values() for r in results]
+    return sorted(todos, key=lambda r: r["@search.score"], reverse=True)[:k]
+
+
+def es_relevante(result, relevant):
+    return result.get("source") in relevant or result.get("id") in relevant
+
+
+def metricas(ranking, relevant):
+    if not relevant:
+        return None
+    posiciones = [i for i, r in enumerate(ranking, 1) if es_relevante(r, relevant)]
+    encontrados = {r.get("source") for r in ranking if es_relevante(r, relevant)} | \
+                  {r.get("id") for r in ranking if es_relevante(r, relevant)}
+    return {
+        "hit": 1.0 if posiciones else 0.0,
+        "mrr": 1.0 / posiciones[0] if posiciones else 0.0,
+        "recall": len(encontrados & set(relevant)) / len(relevant),
+    }
+
+
+async def fetch_live(queries, k):
+    # Importación diferida: app.py crea el cliente de Azure al cargarse
+    from app import search_index_async, close_search_clients
+    try:
+        for q in queries:
+            if q.get("results"):
+                continue
+            listas = await asyncio.gather(*(search_index_async(name, q["query"], top=k) for name in INDEX_NAMES))
+            q["results"] = dict(zip(INDEX_NAMES, listas))
+    finally:
+        await close_search_clients()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de fusión de resultados del RAG")
+    parser.add_argument("--queries", default="results.json")
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--corpus", default=os.getenv("BM25_CORPUS_PATH", "cdmx_gacetas/"),
+                        help="Chunks .md para el índice BM25")
+    parser.add_argument("--live", action="store_true", help="Busca en Azure las consultas sin resultados")
+    args = parser.parse_args()
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+
+    if args.live:
+        asyncio.run(fetch_live(queries, args.k))
+        with open(args.queries, "w", encoding="utf-8") as f:
+            json.dump(queries, f, ensure_ascii=False, indent=2)
+
+    queries = [q for q in queries if q.get("results")]
+    if not queries:
+        print("❌ No hay consultas con resultados (usa --live para buscarlas)")
+        return
+
+    bm25 = None
+    if os.path.isdir(args.corpus):
+        inicio = time.perf_counter()
+        bm25 = BM25Index.from_directory(args.corpus)
+        print(f"BM25: {len(bm25.docs)} chunks indexados en {time.perf_counter() - inicio:.2f}s")
+
+    estrategias = {
+        "raw-score": lambda q: merge_by_raw_score(q["results"], args.k),
+        "rrf": lambda q: reciprocal_rank_fusion(q["results"], weights=FUSION_WEIGHTS, top_k=args.k),
+    }
+    if bm25 is not None:
+        estrategias["rrf+bm25"] = lambda q: reciprocal_rank_fusion(
+            {**q["results"], "bm25": bm25.search(q["query"], top=args.k)}, weights=FUSION_WEIGHTS, top_k=args.k
+        )
+
+    print(f"Consultas: {len(queries)} | k = {args.k}")
+    print("-" * 78)
+    print(f"{'estrategia':<12}{'hit@k':>8}{'MRR@k':>8}{'recall@k':>10}{'% actual':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for nombre, estrategia in estrategias.items():
+        medidas, mezcla, latencias = [], [], []
+        for q in queries:
+            inicio = time.perf_counter()
+            ranking = estrategia(q)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            current_keys = {(r.get("id"), r.get("source")) for r in q["results"].get(INDEX_NAMES[1], [])}
+            mezcla.append(sum((r.get("id"), r.get("source")) in current_keys for r in ranking) / max(len(ranking), 1))
+            m = metricas(ranking, q.get("relevant") or [])
+            if m:
+                medidas.append(m)
+
+        latencias.sort()
+        p95 = latencias[min(int(len(latencias) * 0.95), len(latencias) - 1)]
+        if medidas:
+            hit = statistics.mean(m["hit"] for m in medidas)
+            mrr = statistics.mean(m["mrr"] for m in medidas)
+            recall = statistics.mean(m["recall"] for m in medidas)
+            calidad = f"{hit:>8.3f}{mrr:>8.3f}{recall:>10.3f}"
+        else:
+            calidad = f"{'-':>8}{'-':>8}{'-':>10}"
+        print(f"{nombre:<12}{calidad}{statistics.mean(mezcla):>10.1%}"
+              f"{statistics.median(latencias):>10.3f}{p95:>10.3f}")
+    print("-" * 78)
+    print("% actual = fracción del top-k que viene del índice actual (rag-index-2)")
+
+
+if __name__ == "__main__":
+    main()
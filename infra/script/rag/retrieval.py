@@ -0,0 +1,278 @@
+"""
+Fusión de resultados y búsqueda léxica local para el RAG de gacetas.
+
+- reciprocal_rank_fusion: combina listas rankeadas (índice histórico, índice
+  actual, BM25) usando solo la posición de cada resultado, con peso por
+  colección y un boost por fecha de la gaceta. Los @search.score de índices
+  distintos no son comparables entre sí; las posiciones sí.
+- BM25Index: índice invertido en memoria sobre los chunks de las gacetas (los
+  mismos cortes que hace chunker.py para la ingesta). Encuentra números de
+  artículo y nombres de trámites exactos sin llamar a embeddings.
+- hedged_call: una búsqueda con deadline que manda un duplicado (hedge) cuando
+  tarda más que su p95 reciente.
+"""
+
+import os
+import re
+import glob
+import time
+import heapq
+import math
+import asyncio
+import hashlib
+import unicodedata
+from collections import Counter, defaultdict, deque
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from chunker import chunk_text, source_name
+
+# Constante de RRF: amortigua la diferencia entre los primeros lugares
+RRF_K = 60
+# Vida media del boost por recencia (días) y su peso máximo
+RECENCY_HALF_LIFE_DAYS = 180
+RECENCY_WEIGHT = 0.2
+
+# ====================================================================
+#              FUSIÓN
+# ====================================================================
+
+_DATE_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+
+
+def gazette_date(result: Dict) -> Optional[date]:
+    """Fecha de la gaceta: el nombre del archivo empieza con AAAA-MM-DD."""
+    for field in ("gazette_date", "source", "lastUpdated"):
+        value = result.get(field)
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        if isinstance(value, str):
+            match = _DATE_RE.search(value)
+            if match:
+                try:
+                    return date(*map(int, match.groups()))
+                except ValueError:
+                    continue
+    return None
+
+
+def recency_factor(result: Dict, today: Optional[date] = None,
+                   half_life_days: float = RECENCY_HALF_LIFE_DAYS, weight: float = RECENCY_WEIGHT) -> float:
+    """1 + weight para una gaceta de hoy, tendiendo a 1 conforme envejece."""
+    fecha = gazette_date(result)
+    if fecha is None or weight <= 0:
+        return 1.0
+    age = max(((today or date.today()) - fecha).days, 0)
+    return 1.0 + weight * 0.5 ** (age / half_life_days)
+
+
+def result_key(result: Dict) -> str:
+    """
+    Identidad de un resultado para juntarlo entre listas: el archivo de la gaceta.
+    Los ids y los cortes no sirven porque cada sistema parte los documentos a su
+    manera (el SplitSkill de Azure por páginas de caracteres, BM25 con chunker.py).
+    Sin `source`, el id o un hash del texto.
+    """
+    if result.get("source"):
+        return str(result["source"])
+    content = result.get("content")
+    if not content:
+        return str(result.get("id"))
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(ranked_lists: Dict[str, List[Dict]], weights: Optional[Dict[str, float]] = None,
+                           top_k: int = 8, k: int = RRF_K, recency_weight: float = RECENCY_WEIGHT,
+                           today: Optional[date] = None) -> List[Dict]:
+    """
+    score(d) = recencia(d) * Σ peso(lista) / (k + posición de d en la lista)
+
+    ranked_lists: {"nombre de la lista": [resultados en orden]}.
+    d es un archivo (ver result_key): en cada lista cuenta su mejor posición y
+    se devuelve el chunk mejor posicionado entre todas las listas.
+    Cada resultado devuelto trae `@rrf.score` y `@rrf.lists` (de qué listas vino).
+    """
+    weights = weights or {}
+    fused = {}
+    for name, results in ranked_lists.items():
+        weight = weights.get(name, 1.0)
+        vistos = set()
+        for rank, result in enumerate(results, 1):
+            key = result_key(result)
+            if key in vistos:
+                continue
+            vistos.add(key)
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {"result": result, "rank": rank, "score": 0.0, "lists": []}
+            elif rank < entry["rank"]:
+                entry["result"], entry["rank"] = result, rank
+            entry["score"] += weight / (k + rank)
+            entry["lists"].append(name)
+
+    ranked = []
+    for entry in fused.values():
+        score = entry["score"] * recency_factor(entry["result"], today, weight=recency_weight)
+        ranked.append({**entry["result"], "@rrf.score": score, "@rrf.lists": entry["lists"]})
+    ranked.sort(key=lambda r: r["@rrf.score"], reverse=True)
+    return ranked[:top_k]
+
+# ====================================================================
+#              DEADLINES Y HEDGING
+# ====================================================================
+
+class LatencyTracker:
+    """Latencias recientes (ventana fija) de un índice."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        """p95 en segundos, o None si todavía no hay muestras suficientes."""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordenadas = sorted(self.samples)
+        return ordenadas[min(int(len(ordenadas) * 0.95), len(ordenadas) - 1)]
+
+    def stats(self) -> Dict:
+        p95 = self.p95()
+        return {
+            "samples": len(self.samples),
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+async def hedged_call(factory, tracker: LatencyTracker, deadline: float, default=None):
+    """
+    Ejecuta factory() con un límite de `deadline` segundos.
+
+    Si la llamada sigue pendiente al pasar el p95 del tracker, se lanza una
+    segunda idéntica y gana la primera que responda. Al vencer el deadline se
+    cancela todo y se devuelve `default` (la fusión sigue con lo que haya).
+    """
+    inicio = time.perf_counter()
+    tareas = [asyncio.create_task(factory())]
+    try:
+        hedge_after = tracker.p95()
+        if hedge_after is not None and hedge_after < deadline:
+            terminadas, _ = await asyncio.wait(tareas, timeout=hedge_after)
+            if not terminadas:
+                tracker.hedges += 1
+                tareas.append(asyncio.create_task(factory()))
+
+        pendientes = set(tareas)
+        while pendientes:
+            restante = deadline - (time.perf_counter() - inicio)
+            if restante <= 0:
+                break
+            terminadas, pendientes = await asyncio.wait(pendientes, timeout=restante,
+                                                        return_when=asyncio.FIRST_COMPLETED)
+            for tarea in terminadas:
+                if tarea.exception() is None:
+                    tracker.record(time.perf_counter() - inicio)
+                    if tarea is not tareas[0]:
+                        tracker.hedge_wins += 1
+                    return tarea.result()
+                print(f"Búsqueda fallida: {tarea.exception()}")
+
+        if not pendientes:
+            # Todas fallaron antes del deadline
+            return default
+        tracker.timeouts += 1
+        tracker.record(deadline)
+        return default
+    finally:
+        for tarea in tareas:
+            if not tarea.done():
+                tarea.cancel()
+
+# ====================================================================
+#              BM25
+# ====================================================================
+
+# Palabras vacías frecuentes en las gacetas (no aportan al ranking)
+STOPWORDS = {
+    "a", "al", "ante", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los", "o", "para",
+    "por", "que", "se", "su", "sus", "un", "una", "y", "e", "como", "mas", "este", "esta", "sobre",
+}
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sin acentos; los números (artículos, fracciones, folios) se conservan."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [t for t in _TOKEN_RE.findall(text) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Índice invertido BM25 (Okapi) en memoria."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: List[Dict] = []
+        self.doc_len: List[int] = []
+        self.postings: Dict[str, List[tuple]] = defaultdict(list)  # término -> [(doc, tf)]
+        self.idf: Dict[str, float] = {}
+        self.avg_len = 0.0
+
+    def add(self, doc: Dict):
+        """doc: {"id", "content", "source", ...}. Llamar a finalize() al terminar."""
+        n = len(self.docs)
+        tokens = tokenize(doc.get("content") or "")
+        self.docs.append(doc)
+        self.doc_len.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            self.postings[term].append((n, tf))
+
+    def finalize(self):
+        self.avg_len = sum(self.doc_len) / len(self.doc_len) if self.doc_len else 0.0
+        n = len(self.docs)
+        self.idf = {
+            term: math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in self.postings.items()
+        }
+        return self
+
+    @classmethod
+    def from_directory(cls, root: str, pattern: str = "**/*.md") -> "BM25Index":
+        """
+        Un documento por chunk de cada gaceta del directorio, con el mismo corte
+        y los mismos nombres (ruta relativa a `root`) que la ingesta, para que
+        RRF junte los hits léxicos con los vectoriales del mismo chunk.
+        """
+        index = cls()
+        for path in sorted(glob.glob(os.path.join(root, pattern), recursive=True)):
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+            name = source_name(path, root)
+            for chunk_id, chunk in chunk_text(name, content):
+                index.add({"id": chunk_id, "content": chunk, "source": name})
+        return index.finalize()
+
+    def search(self, query: str, top: int = 8) -> List[Dict]:
+        """Candidatos léxicos en orden, con `@bm25.score`."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc, tf in self.postings.get(term, ()):
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc] / self.avg_len)
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        best = heapq.nlargest(top, scores.items(), key=lambda item: item[1])
+        return [{**self.docs[doc], "@bm25.score": score} for doc, score in best]
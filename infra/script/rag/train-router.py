@@ -0,0 +1,190 @@
+"""
+Entrena y evalúa el router que decide si un mensaje del chat necesita búsqueda
+de documentos (backend/chat/retrieval_router.py).
+
+    python train-router.py --data router-seed.jsonl --out router.npz
+    python train-router.py --data router-seed.jsonl --data etiquetados.jsonl --out router.npz --beta 2
+
+Formato de los datos (una línea por mensaje):
+
+    {"text": "¿Qué requisitos piden para la licencia?", "lang": "es", "retrieval": 1}
+
+Se separa un conjunto de evaluación estratificado por idioma y etiqueta, se
+elige el umbral que maximiza F-beta en ese conjunto (beta > 1 pesa más no
+perder búsquedas necesarias) y el modelo final se entrena con todos los datos.
+El backend lo usa con OFFICE_AGENT_ROUTER_MODEL=<out>.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from collections import defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "backend", "chat"))
+from retrieval_router import RetrievalRouter, featurize, N_FEATURES
+
+
+def load_examples(paths):
+    examples = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    examples.append({"text": row["text"], "lang": row.get("lang", "?"),
+                                     "retrieval": int(row["retrieval"])})
+    return examples
+
+
+def split(examples, eval_fraction, seed):
+    """Evaluación estratificada por (idioma, etiqueta)."""
+    rng = np.random.default_rng(seed)
+    grupos = defaultdict(list)
+    for ex in examples:
+        grupos[(ex["lang"], ex["retrieval"])].append(ex)
+    train, evaluacion = [], []
+    for grupo in grupos.values():
+        orden = rng.permutation(len(grupo))
+        n_eval = int(round(len(grupo) * eval_fraction))
+        evaluacion.extend(grupo[i] for i in orden[:n_eval])
+        train.extend(grupo[i] for i in orden[n_eval:])
+    return train, evaluacion
+
+
+def to_sparse(texts):
+    """Matriz dispersa en formato CSR: (indices, values, indptr)."""
+    indices, values, indptr = [], [], [0]
+    for text in texts:
+        idx, val = featurize(text)
+        indices.append(idx)
+        values.append(val)
+        indptr.append(indptr[-1] + len(idx))
+    return np.concatenate(indices), np.concatenate(values), np.asarray(indptr)
+
+
+def logits(weights, bias, indices, values, indptr):
+    fila = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    return np.bincount(fila, weights=weights[indices] * values, minlength=len(indptr) - 1) + bias
+
+
+def train(texts, labels, epochs=300, lr=0.1, l2=1e-4):
+    """Regresión logística con Adam (batch completo) sobre las features hasheadas."""
+    indices, values, indptr = to_sparse(texts)
+    y = np.asarray(labels, dtype=np.float64)
+    n = len(y)
+    fila = np.repeat(np.arange(n), np.diff(indptr))
+
+    weights = np.zeros(N_FEATURES, dtype=np.float64)
+    bias = 0.0
+    m_w, v_w = np.zeros_like(weights), np.zeros_like(weights)
+    m_b = v_b = 0.0
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    for t in range(1, epochs + 1):
+        p = 1.0 / (1.0 + np.exp(-logits(weights, bias, indices, values, indptr)))
+        error = (p - y) / n
+        grad_w = np.bincount(indices, weights=values * error[fila], minlength=N_FEATURES) + l2 * weights
+        grad_b = error.sum()
+
+        m_w = beta1 * m_w + (1 - beta1) * grad_w
+        v_w = beta2 * v_w + (1 - beta2) * grad_w ** 2
+        weights -= lr * (m_w / (1 - beta1 ** t)) / (np.sqrt(v_w / (1 - beta2 ** t)) + eps)
+        m_b = beta1 * m_b + (1 - beta1) * grad_b
+        v_b = beta2 * v_b + (1 - beta2) * grad_b ** 2
+        bias -= lr * (m_b / (1 - beta1 ** t)) / (np.sqrt(v_b / (1 - beta2 ** t)) + eps)
+    return weights.astype(np.float32), float(bias)
+
+
+def metricas(probs, labels, threshold):
+    pred = probs >= threshold
+    y = np.asarray(labels, dtype=bool)
+    tp, fp, fn = int((pred & y).sum()), int((pred & ~y).sum()), int((~pred & y).sum())
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        "accuracy": float((pred == y).mean()) if len(y) else 0.0,
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "retrieval_rate": float(pred.mean()) if len(y) else 0.0,
+    }
+
+
+def f_beta(m, beta):
+    p, r = m["precision"], m["recall"]
+    return (1 + beta ** 2) * p * r / (beta ** 2 * p + r) if p + r else 0.0
+
+
+def elegir_umbral(probs, labels, beta):
+    """Umbral con mejor F-beta; en empate, el más alto (menos búsquedas)."""
+    mejor = (-1.0, 0.5)
+    for threshold in np.round(np.arange(0.05, 0.96, 0.01), 2):
+        score = f_beta(metricas(probs, labels, threshold), beta)
+        if score >= mejor[0]:
+            mejor = (score, float(threshold))
+    return mejor[1]
+
+
+def imprimir(titulo, m):
+    print(f"{titulo:<10}{m['accuracy']:>10.3f}{m['precision']:>11.3f}{m['recall']:>9.3f}"
+          f"{m['f1']:>8.3f}{m['retrieval_rate']:>11.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrena el router de búsqueda del Office Agent")
+    parser.add_argument("--data", action="append", required=True, help="JSONL etiquetado (se puede repetir)")
+    parser.add_argument("--out", default="router.npz")
+    parser.add_argument("--eval-fraction", type=float, default=0.25)
+    parser.add_argument("--beta", type=float, default=2.0, help="Peso del recall al elegir el umbral")
+    parser.add_argument("--threshold", type=float, help="Umbral fijo (no se busca en evaluación)")
+    parser.add_argument("--epochs", type=int, default=300)
+    parser.add_argument("--l2", type=float, default=1e-4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    examples = load_examples(args.data)
+    train_set, eval_set = split(examples, args.eval_fraction, args.seed)
+    print(f"Ejemplos: {len(examples)} | entrenamiento {len(train_set)} | evaluación {len(eval_set)}")
+
+    weights, bias = train([e["text"] for e in train_set], [e["retrieval"] for e in train_set],
+                          epochs=args.epochs, l2=args.l2)
+    router = RetrievalRouter(weights, bias, 0.5, {})
+    probs = np.asarray([router.predict_proba(e["text"]) for e in eval_set])
+    labels = [e["retrieval"] for e in eval_set]
+    threshold = args.threshold if args.threshold is not None else elegir_umbral(probs, labels, args.beta)
+
+    print(f"Umbral: {threshold:.2f}" + ("" if args.threshold is not None else f" (mejor F{args.beta:g} en evaluación)"))
+    print("-" * 59)
+    print(f"{'idioma':<10}{'accuracy':>10}{'precision':>11}{'recall':>9}{'F1':>8}{'% busca':>11}")
+    resultado = metricas(probs, labels, threshold)
+    for lang in sorted({e["lang"] for e in eval_set}):
+        sel = [i for i, e in enumerate(eval_set) if e["lang"] == lang]
+        imprimir(lang, metricas(probs[sel], [labels[i] for i in sel], threshold))
+    imprimir("total", resultado)
+    print("-" * 59)
+
+    # Modelo final con todos los datos y el umbral elegido
+    weights, bias = train([e["text"] for e in examples], [e["retrieval"] for e in examples],
+                          epochs=args.epochs, l2=args.l2)
+    final = RetrievalRouter(weights, bias, threshold, {
+        "trained_at": datetime.now().isoformat(timespec="seconds"),
+        "examples": len(examples),
+        "languages": sorted({e["lang"] for e in examples}),
+        "eval": {k: round(v, 4) for k, v in resultado.items()},
+    })
+
+    inicio = time.perf_counter()
+    for e in examples:
+        final.predict_proba(e["text"])
+    latencia_us = (time.perf_counter() - inicio) / len(examples) * 1e6
+
+    final.save(args.out)
+    print(f"✅ Modelo guardado en {args.out} ({os.path.getsize(args.out) / 1024:.0f} KB, "
+          f"{latencia_us:.0f} µs por mensaje)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Índice vectorial (pgvector) para la búsqueda del Office Agent.
+
+    python vector-index.py migrate --method hnsw --m 16 --ef-construction 64
+    python vector-index.py migrate --method ivfflat --lists 100
+    python vector-index.py benchmark --k 3 --ef-search 20,40,80,160
+
+`migrate` crea el índice sobre la columna `embedding` (distancia coseno, la
+misma que usa `<=>` en el backend). `benchmark` toma embeddings de la propia
+tabla como consultas y compara la búsqueda con índice contra la búsqueda
+exacta (sin índice): recall@k y latencia p50/p95 por cada valor de ef_search
+(o probes, para IVFFlat).
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import statistics
+import asyncpg
+
+# ----------------------------------------------------
+# 1. CONFIGURACIÓN
+# ----------------------------------------------------
+
+DB_HOST = os.environ['AZURE_DB_HOST_PSQL']
+DB_USER = os.environ['AZURE_DB_USER_PSQL']
+DB_PASS = os.environ['AZURE_DB_PASSWORD']
+DB_NAME = os.environ['AZURE_DB_NAME_PSQL']
+
+DEFAULT_TABLE = "documents"
+
+# ----------------------------------------------------
+# 2. MIGRACIÓN
+# ----------------------------------------------------
+
+def index_name(table: str, method: str) -> str:
+    return f"{table}_embedding_{method}_idx"
+
+
+async def migrate(conn, args):
+    """Crea el índice ANN (y la extensión vector si falta)."""
+    await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+
+    if args.method == "hnsw":
+        with_clause = f"m = {int(args.m)}, ef_construction = {int(args.ef_construction)}"
+    else:
+        with_clause = f"lists = {int(args.lists)}"
+
+    name = index_name(args.table, args.method)
+    if args.replace:
+        await conn.execute(f"DROP INDEX {'CONCURRENTLY ' if args.concurrently else ''}IF EXISTS {name}")
+
+    # Memoria para construir el grafo/listas en RAM (mucho más rápido que en disco)
+    await conn.execute(f"SET maintenance_work_mem = '{args.maintenance_work_mem}'")
+    await conn.execute(f"SET max_parallel_maintenance_workers = {int(args.parallel_workers)}")
+
+    sql = (
+        f"CREATE INDEX {'CONCURRENTLY ' if args.concurrently else ''}IF NOT EXISTS {name} "
+        f"ON {args.table} USING {args.method} (embedding vector_cosine_ops) WITH ({with_clause})"
+    )
+    print(f"⏳ {sql}")
+    inicio = time.perf_counter()
+    await conn.execute(sql)
+    await conn.execute(f"ANALYZE {args.table}")
+    print(f"✅ Índice {name} listo en {time.perf_counter() - inicio:.1f}s")
+
+    if args.method == "ivfflat":
+        print("ℹ️  IVFFlat se entrena con los datos actuales: reconstrúyelo tras ingestas grandes (--replace)")
+
+# ----------------------------------------------------
+# 3. BENCHMARK
+# ----------------------------------------------------
+
+async def search(conn, table: str, embedding: str, k: int, exact: bool, setting: str = None, value: int = None):
+    """Top-k ids con la misma consulta que el backend. Devuelve (ids, ms)."""
+    async with conn.transaction():
+        if exact:
+            # Sin índice: recorrido secuencial y orden exacto
+            await conn.execute("SET LOCAL enable_indexscan = off")
+            await conn.execute("SET LOCAL enable_bitmapscan = off")
+        else:
+            await conn.execute(f"SET LOCAL {setting} = {int(value)}")
+        inicio = time.perf_counter()
+        rows = await conn.fetch(
+            f"SELECT id, embedding <=> $1::text::vector AS distance FROM {table} ORDER BY distance LIMIT $2",
+            embedding, k
+        )
+        return [row['id'] for row in rows], (time.perf_counter() - inicio) * 1000
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+async def benchmark(conn, args):
+    setting = "hnsw.ef_search" if args.method == "hnsw" else "ivfflat.probes"
+    values = [int(v) for v in args.ef_search.split(",")]
+
+    queries = [row['embedding'] for row in await conn.fetch(
+        f"SELECT embedding::text AS embedding FROM {args.table} ORDER BY random() LIMIT $1", args.queries
+    )]
+    if not queries:
+        print(f"❌ La tabla {args.table} no tiene embeddings")
+        return
+    print(f"Consultas: {len(queries)} | k = {args.k} | parámetro: {setting}")
+
+    exactos, lat_exacta = [], []
+    for embedding in queries:
+        ids, ms = await search(conn, args.table, embedding, args.k, exact=True)
+        exactos.append(set(ids))
+        lat_exacta.append(ms)
+
+    print("-" * 70)
+    print(f"{'búsqueda':<22}{'recall@k':>10}{'p50 ms':>12}{'p95 ms':>12}")
+    print(f"{'exacta':<22}{1.0:>10.3f}{statistics.median(lat_exacta):>12.2f}{percentile(lat_exacta, 0.95):>12.2f}")
+
+    for value in values:
+        recalls, latencias = [], []
+        for embedding, exacto in zip(queries, exactos):
+            ids, ms = await search(conn, args.table, embedding, args.k, exact=False, setting=setting, value=value)
+            recalls.append(len(exacto & set(ids)) / len(exacto) if exacto else 1.0)
+            latencias.append(ms)
+        label = f"{args.method} {setting.split('.')[1]}={value}"
+        print(f"{label:<22}{statistics.mean(recalls):>10.3f}"
+              f"{statistics.median(latencias):>12.2f}{percentile(latencias, 0.95):>12.2f}")
+    print("-" * 70)
+
+# ----------------------------------------------------
+# 4. PUNTO DE ENTRADA
+# ----------------------------------------------------
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Índice vectorial de los documentos de la gaceta")
+    parser.add_argument("command", choices=["migrate", "benchmark"])
+    parser.add_argument("--table", default=DEFAULT_TABLE)
+    parser.add_argument("--method", choices=["hnsw", "ivfflat"], default="hnsw")
+    # migrate
+    parser.add_argument("--m", type=int, default=16, help="HNSW: vecinos por nodo")
+    parser.add_argument("--ef-construction", type=int, default=64, help="HNSW: candidatos al construir")
+    parser.add_argument("--lists", type=int, default=100, help="IVFFlat: listas (≈ filas/1000)")
+    parser.add_argument("--maintenance-work-mem", default="1GB")
+    parser.add_argument("--parallel-workers", type=int, default=2)
+    parser.add_argument("--concurrently", action="store_true", help="No bloquea escrituras mientras construye")
+    parser.add_argument("--replace", action="store_true", help="Borra el índice existente y lo reconstruye")
+    # benchmark
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--ef-search", default="20,40,80,160",
+                        help="Valores a probar de hnsw.ef_search (o ivfflat.probes con --method ivfflat)")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    conn = await asyncpg.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
+    try:
+        if args.command == "migrate":
+            await migrate(conn, args)
+        else:
+            await benchmark(conn, args)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nProceso interrumpido por el usuario.")
@@ -0,0 +1,49 @@
+"""
+Las rutas del chat crean el cliente de Azure OpenAI al importarse: con estos
+valores de relleno se pueden importar sin credenciales (los tests reemplazan
+el cliente por tests/fake_openai.py).
+"""
+
+import os
+
+import pytest
+
+for nombre, valor in {
+    "AZURE_OPENAI_ENDPOINT": "https://pruebas.openai.azure.com",
+    "AZURE_OPENAI_KEY": "pruebas",
+    "AZURE_OPENAI_API_VERSION": "2024-02-01",
+    "AZURE_DEPLOYMENT_NAME": "gpt-4o",
+}.items():
+    os.environ.setdefault(nombre, valor)
+
+
+@pytest.fixture
+def chat_routes(monkeypatch):
+    """
+    Rutas del chat con el cliente de OpenAI en memoria, sin Cosmos y con
+    caches y estadísticas por modo vacíos (el agente de la gaceta no corre).
+    Devuelve (app, routes, fake); `fake` se puede configurar antes del request.
+    """
+    from quart import Quart
+
+    from backend.chat import routes
+    from backend.chat.semantic_cache import SemanticCache
+    from backend.chat.stats import ModeStats
+    from backend.chat.verdict_cache import VerdictCache
+    from tests.fake_openai import FakeOpenAI
+
+    fake = FakeOpenAI()
+    monkeypatch.setattr(routes, "client", fake)
+    monkeypatch.setattr(routes, "verdict_cache", VerdictCache())
+    monkeypatch.setattr(routes, "semantic_cache", SemanticCache())
+    monkeypatch.setattr(routes, "mode_stats", ModeStats())
+
+    async def sin_container():
+        return None
+
+    monkeypatch.setattr(routes, "get_container", sin_container)
+
+    app = Quart(__name__)
+    app.secret_key = "pruebas"
+    app.register_blueprint(routes.chat_bp)
+    return app, routes, fake
@@ -0,0 +1,150 @@
+"""
+Contenedor de Cosmos DB en memoria con lo que usan chat_store, write_behind y
+bulk_delete (batches transaccionales, patch con filtro, consultas por usuario/chat).
+"""
+
+import copy
+
+from azure.cosmos.exceptions import (
+    CosmosAccessConditionFailedError, CosmosBatchOperationError, CosmosResourceNotFoundError
+)
+
+
+class _Page:
+    def __init__(self, items):
+        self.items = items
+
+    async def __aiter__(self):
+        for item in self.items:
+            yield item
+
+
+class _Pages:
+    def __init__(self, items, size, token):
+        self.items = items
+        self.size = size or len(items) or 1
+        self.start = int(token or 0)
+        self.continuation_token = None
+
+    async def __aiter__(self):
+        pos = self.start
+        while True:
+            page = self.items[pos:pos + self.size]
+            pos += self.size
+            self.continuation_token = str(pos) if pos < len(self.items) else None
+            yield _Page(page)
+            if pos >= len(self.items):
+                return
+
+
+class _Query:
+    def __init__(self, items, size):
+        self.items = items
+        self.size = size
+
+    async def __aiter__(self):
+        for item in self.items:
+            yield item
+
+    def by_page(self, token=None):
+        return _Pages(self.items, self.size, token)
+
+
+def _batch_error(index, status, total):
+    return CosmosBatchOperationError(error_index=index, headers={}, status_code=status, message=str(status),
+                                     operation_responses=[{"statusCode": status}] * total)
+
+
+class FakeContainer:
+    def __init__(self):
+        self.docs = {}
+        self.batches = 0
+        # Batches que se guardan pero cuyo resultado "se pierde" (timeout del lado del cliente)
+        self.lose_responses = 0
+
+    # ---- consultas ----
+    def query_items(self, query, parameters=(), partition_key=None, max_item_count=None, **kwargs):
+        params = {p["name"]: p["value"] for p in parameters}
+        items = [copy.deepcopy(d) for d in self.docs.values() if self._matches(d, query, params)]
+        if "ORDER BY c.sortKey DESC" in query:
+            items.sort(key=lambda d: d["sortKey"], reverse=True)
+        elif "ORDER BY c.sortKey" in query:
+            items.sort(key=lambda d: d["sortKey"])
+        elif "ORDER BY c.updatedAt DESC" in query:
+            items.sort(key=lambda d: d.get("updatedAt", ""), reverse=True)
+        return _Query(items, max_item_count)
+
+    @staticmethod
+    def _matches(doc, query, params):
+        if "@userId" in params and doc.get("userId") != params["@userId"]:
+            return False
+        for tipo in ("chat_message", "chat"):
+            if f"c.type = '{tipo}'" in query and doc.get("type") != tipo:
+                return False
+        if "c.chatId = @chatId" in query and doc.get("chatId") != params["@chatId"]:
+            return False
+        if "c.id = @chatId" in query and doc.get("id") != params["@chatId"]:
+            return False
+        return True
+
+    async def read_item(self, item, partition_key):
+        if item not in self.docs:
+            raise CosmosResourceNotFoundError(message="not found")
+        return copy.deepcopy(self.docs[item])
+
+    # ---- escrituras ----
+    async def upsert_item(self, body):
+        self.docs[body["id"]] = copy.deepcopy(body)
+
+    async def delete_item(self, item, partition_key):
+        if item not in self.docs:
+            raise CosmosResourceNotFoundError(message="not found")
+        del self.docs[item]
+
+    async def patch_item(self, item, partition_key, patch_operations, filter_predicate=None):
+        if item not in self.docs:
+            raise CosmosResourceNotFoundError(message="not found")
+        doc = self.docs[item]
+        if filter_predicate and not self.predicate(doc, filter_predicate):
+            raise CosmosAccessConditionFailedError(message="precondition failed")
+        self._apply_patch(doc, patch_operations)
+
+    # Predicados que usa chat_store (se reemplaza en las pruebas que lo necesiten)
+    @staticmethod
+    def predicate(doc, filter_predicate):
+        raise NotImplementedError(filter_predicate)
+
+    @staticmethod
+    def _apply_patch(doc, operations):
+        for op in operations:
+            key = op["path"][1:]
+            if op["op"] == "set":
+                doc[key] = op["value"]
+            elif op["op"] == "incr":
+                doc[key] = doc.get(key, 0) + op["value"]
+
+    async def execute_item_batch(self, batch_operations, partition_key):
+        self.batches += 1
+        nuevos = copy.deepcopy(self.docs)
+        for i, (kind, args) in enumerate(batch_operations):
+            if kind == "create":
+                if args[0]["id"] in nuevos:
+                    raise _batch_error(i, 409, len(batch_operations))
+                nuevos[args[0]["id"]] = copy.deepcopy(args[0])
+            elif kind == "upsert":
+                nuevos[args[0]["id"]] = copy.deepcopy(args[0])
+            elif kind == "patch":
+                if args[0] not in nuevos:
+                    raise _batch_error(i, 404, len(batch_operations))
+                self._apply_patch(nuevos[args[0]], args[1])
+            elif kind == "delete":
+                if args[0] not in nuevos:
+                    raise _batch_error(i, 404, len(batch_operations))
+                del nuevos[args[0]]
+        self.docs = nuevos
+        if self.lose_responses:
+            self.lose_responses -= 1
+            raise TimeoutError("respuesta perdida")
+
+    def of_type(self, tipo):
+        return [d for d in self.docs.values() if d.get("type") == tipo]
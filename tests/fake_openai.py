@@ -0,0 +1,77 @@
+"""
+Cliente de Azure OpenAI en memoria con lo que usan las rutas del chat: el juez
+(temperature=0), la respuesta normal, la salida fusionada (JSON) y el stream
+con el uso en el último chunk.
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace as NS
+
+
+def _usage(prompt, completion, cached=0):
+    return NS(prompt_tokens=prompt, completion_tokens=completion,
+              prompt_tokens_details=NS(cached_tokens=cached))
+
+
+class FakeStream:
+    def __init__(self, parts, include_usage):
+        self.parts = parts
+        self.include_usage = include_usage
+        self.closed = False
+
+    async def __aiter__(self):
+        # Azure abre con un chunk sin choices (prompt_filter_results)
+        yield NS(choices=[], usage=None)
+        for part in self.parts:
+            yield NS(choices=[NS(delta=NS(content=part))], usage=None)
+        if self.include_usage:
+            yield NS(choices=[], usage=_usage(50, len(self.parts), cached=32))
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeOpenAI:
+    """
+    `verdict` es lo que contesta el juez; `judge_delay` y `answer_delay`
+    simulan la latencia de cada llamada. `events` guarda el orden en que
+    empiezan y terminan (para ver qué se solapa).
+    """
+
+    def __init__(self, answer="respuesta", verdict="SAFE", parts=("Hola", " mundo"),
+                 judge_delay=0.0, answer_delay=0.0):
+        self.answer = answer
+        self.verdict = verdict
+        self.parts = list(parts)
+        self.judge_delay = judge_delay
+        self.answer_delay = answer_delay
+        self.calls = []
+        self.events = []
+        self.streams = []
+        self.chat = NS(completions=NS(create=self._create))
+
+    async def _create(self, **kwargs):
+        self.calls.append(kwargs)
+        kind = "judge" if kwargs.get("temperature") == 0 else "answer"
+        self.events.append(f"{kind}:start")
+        try:
+            await asyncio.sleep(self.judge_delay if kind == "judge" else self.answer_delay)
+        except asyncio.CancelledError:
+            self.events.append(f"{kind}:cancelled")
+            raise
+        self.events.append(f"{kind}:end")
+
+        if kwargs.get("stream"):
+            include_usage = bool((kwargs.get("stream_options") or {}).get("include_usage"))
+            stream = FakeStream(self.parts, include_usage)
+            self.streams.append(stream)
+            return stream
+
+        if kind == "judge":
+            content = self.verdict
+        elif kwargs.get("response_format"):
+            content = json.dumps({"verdict": self.verdict, "answer": self.answer})
+        else:
+            content = self.answer
+        return NS(choices=[NS(message=NS(content=content))], usage=_usage(10, 1))
@@ -0,0 +1,49 @@
+import asyncio
+import os
+
+from backend.chat import moderation
+from backend.chat.blocklist import BlocklistEngine, normalize_for_blocklist
+
+
+def _engine(tmp_path, contenido):
+    (tmp_path / "es.txt").write_text(contenido, encoding="utf-8")
+    return BlocklistEngine(str(tmp_path), reload_interval=0)
+
+
+def test_normalizacion():
+    assert normalize_for_blocklist("  ÓDIÖ   Tot@l ") == "odio total"
+    assert normalize_for_blocklist("m4l0") == "malo"
+
+
+def test_palabra_completa_y_prefijo(tmp_path):
+    engine = _engine(tmp_path, "# version: 3\nmalo\nodi*\n")
+
+    assert engine.versions == {"es": "3"} and engine.term_count == 2
+    assert engine.match("Eso es MAL0") == "malo"
+    assert engine.match("malos") is None
+    assert engine.match("los odiadores") == "odi"
+    assert engine.match("una pregunta normal") is None
+
+
+def test_recarga_al_modificar_el_archivo(tmp_path):
+    engine = _engine(tmp_path, "malo\n")
+    assert engine.match("feo") is None
+
+    path = tmp_path / "es.txt"
+    path.write_text("malo\nfeo\n", encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+    assert engine.match("feo") == "feo"
+
+
+def test_blocklist_sin_content_safety(monkeypatch, tmp_path):
+    monkeypatch.setattr(moderation, "blocklist", _engine(tmp_path, "malo\n"))
+    monkeypatch.setattr(moderation, "_safety_client", None)
+    monkeypatch.delenv("AZURE_CONTENT_SAFETY_ENDPOINT", raising=False)
+
+    assert moderation.check_blocklist("algo malo")["flagged"]
+    assert moderation.check_blocklist("algo bueno") is None
+    assert asyncio.run(moderation.check_text_safety("algo malo"))["flagged"]
+    # Quien ya revisó la blocklist la puede saltar
+    assert not asyncio.run(moderation.check_text_safety("algo malo", include_blocklist=False))["flagged"]
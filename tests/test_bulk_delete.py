@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from backend.database import bulk_delete
+from tests.fake_cosmos import FakeContainer
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _container():
+    container = FakeContainer()
+    for i in range(30):
+        container.docs[f"m{i}"] = {"id": f"m{i}", "userId": "u1", "type": "chat_message"}
+    container.docs["otro"] = {"id": "otro", "userId": "u2", "type": "chat"}
+    return container
+
+
+def test_delete_partition_solo_borra_al_usuario():
+    container = _container()
+    job = run(bulk_delete.delete_partition(container, "u1", {"deleted": 0, "failed": 0}))
+    assert job == {"deleted": 30, "failed": 0}
+    assert list(container.docs) == ["otro"]
+
+
+def test_estado_del_trabajo_visible_desde_otro_worker():
+    container = _container()
+    worker_a, worker_b = bulk_delete.DeleteJobs(), bulk_delete.DeleteJobs()
+
+    async def escenario():
+        job_id = worker_a.start("account", "u1", lambda job: bulk_delete.delete_partition(container, "u1", job),
+                                container)
+        await worker_a.wait()
+        return job_id, await worker_b.get(job_id, container), await worker_b.get("no-existe", container)
+
+    job_id, job, missing = run(escenario())
+    assert missing is None
+    assert job["id"] == job_id and job["status"] == "done" and job["deleted"] == 30
+    # El item de estado no expone al usuario
+    assert "u1" not in str(container.docs[job_id])
+
+
+def test_estado_vencido_se_borra_al_consultarlo():
+    container = FakeContainer()
+    container.docs["viejo"] = {"id": "viejo", "userId": "delete-job:viejo", "type": "delete_job", "status": "done",
+                               "finishedAt": time.time() - bulk_delete.JOB_RETENTION - 1}
+
+    assert run(bulk_delete.DeleteJobs().get("viejo", container)) is None
+    assert "viejo" not in container.docs
@@ -0,0 +1,75 @@
+import asyncio
+
+from backend.database import chat_store
+from tests.fake_cosmos import FakeContainer
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _chats(n):
+    container = FakeContainer()
+    for i in range(n):
+        run(chat_store.append_turns(container, "u1", f"c{i}", [(f"p{i}", f"r{i}", f"2026-01-0{i + 1}T00:00:00+00:00")]))
+    return container
+
+
+def test_chats_por_pagina_del_mas_reciente_al_mas_viejo():
+    container = _chats(5)
+
+    pagina, token = run(chat_store.list_chat_headers(container, "u1", page_size=2))
+    assert [c["id"] for c in pagina] == ["c4", "c3"] and token
+
+    vistos = [c["id"] for c in pagina]
+    while token:
+        pagina, token = run(chat_store.list_chat_headers(container, "u1", page_size=2, continuation=token))
+        vistos += [c["id"] for c in pagina]
+    assert vistos == ["c4", "c3", "c2", "c1", "c0"]
+
+
+def test_mensajes_embebidos_solo_en_la_primera_pagina():
+    container = FakeContainer()
+    container.docs["c1"] = {"id": "c1", "userId": "u1", "type": "chat", "messages": [
+        {"role": "user", "text": "vieja", "timestamp": "2025-01-01T00:00:00"}]}
+    turns = [(f"p{i}", f"r{i}", f"2026-01-01T00:0{i}:00+00:00") for i in range(2)]
+    run(chat_store.append_turns(container, "u1", "c1", turns))
+
+    primera, token = run(chat_store.get_chat_messages(container, "u1", "c1", page_size=3))
+    segunda, fin = run(chat_store.get_chat_messages(container, "u1", "c1", page_size=3, continuation=token))
+
+    assert [m["text"] for m in primera] == ["vieja", "p0", "r0", "p1"]
+    assert [m["text"] for m in segunda] == ["r1"] and fin is None
+
+
+def test_api_de_chats_pagina_y_limita(chat_routes, monkeypatch):
+    app, routes, _ = chat_routes
+    container = _chats(3)
+    tamaños = []
+
+    async def get_container():
+        return container
+
+    async def list_chat_headers(container, user_id, page_size=20, continuation=None):
+        tamaños.append(page_size)
+        return await chat_store.list_chat_headers(container, user_id, page_size, continuation)
+
+    monkeypatch.setattr(routes, "get_container", get_container)
+    monkeypatch.setattr(routes, "list_chat_headers", list_chat_headers)
+
+    async def escenario():
+        async with app.test_app() as test_app:
+            client = test_app.test_client()
+            anonimo = await (await client.get("/api/chats")).get_json()
+            async with client.session_transaction() as sesion:
+                sesion["user"] = {"oid": "u1"}
+            primera = await (await client.get("/api/chats?limit=2")).get_json()
+            resto = await (await client.get(f"/api/chats?limit=500&continuation={primera['continuation']}")).get_json()
+            return anonimo, primera, resto
+
+    anonimo, primera, resto = run(escenario())
+
+    assert anonimo == {"chats": [], "continuation": None}
+    assert [c["id"] for c in primera["chats"]] == ["c2", "c1"]
+    assert [c["id"] for c in resto["chats"]] == ["c0"] and resto["continuation"] is None
+    assert tamaños == [2, 100]
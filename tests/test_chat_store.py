@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+from backend.database import chat_store
+from tests.fake_cosmos import FakeContainer
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_primer_turno_crea_cabecera_y_mensajes():
+    container = FakeContainer()
+    run(chat_store.append_turn(container, "u1", "c1", "¿Cómo saco mi licencia?", "Así."))
+
+    header = container.docs["c1"]
+    assert header["type"] == "chat" and header["messageCount"] == 2
+    assert [m["role"] for m in sorted(container.of_type("chat_message"), key=lambda m: m["sortKey"])] == ["user", "ai"]
+
+
+def test_reintento_de_un_batch_ya_guardado_no_duplica():
+    container = FakeContainer()
+    turns = [("pregunta", "respuesta", "2026-01-01T00:00:00+00:00")]
+    run(chat_store.append_turns(container, "u1", "c1", turns))
+
+    # El segundo intento se guarda, pero el cliente no ve la respuesta y reintenta
+    turns = [("otra", "más", "2026-01-01T00:01:00+00:00")]
+    container.lose_responses = 1
+    with pytest.raises(TimeoutError):
+        run(chat_store.append_turns(container, "u1", "c1", turns))
+    run(chat_store.append_turns(container, "u1", "c1", turns))
+
+    assert len(container.of_type("chat_message")) == 4
+    assert container.docs["c1"]["messageCount"] == 4
+
+
+def test_ids_deterministas_por_chat_y_sortkey():
+    assert chat_store.message_id("c1", "t_0") == chat_store.message_id("c1", "t_0")
+    assert chat_store.message_id("c1", "t_0") != chat_store.message_id("c1", "t_1")
+    assert chat_store.message_id("c1", "t_0") != chat_store.message_id("c2", "t_0")
+
+
+def test_recent_history_devuelve_los_ultimos_en_orden():
+    container = FakeContainer()
+    turns = [(f"p{i}", f"r{i}", f"2026-01-01T00:0{i}:00+00:00") for i in range(4)]
+    run(chat_store.append_turns(container, "u1", "c1", turns))
+
+    mensajes, resumen, hasta = run(chat_store.recent_history(container, "u1", "c1", limit=3))
+
+    assert [m["content"] for m in mensajes] == ["r2", "p3", "r3"]
+    assert [m["role"] for m in mensajes] == ["assistant", "user", "assistant"]
+    assert resumen is None and hasta is None
+
+
+class SummaryContainer(FakeContainer):
+    @staticmethod
+    def predicate(doc, filter_predicate):
+        up_to = filter_predicate.rsplit("'", 2)[1]
+        return "summaryUpTo" not in doc or doc["summaryUpTo"] < up_to
+
+
+def test_save_summary_no_pisa_un_resumen_mas_nuevo():
+    container = SummaryContainer()
+    run(chat_store.append_turns(container, "u1", "c1", [("p", "r", "2026-01-01T00:00:00+00:00")]))
+
+    run(chat_store.save_summary(container, "u1", "c1", "nuevo", "2026-01-01T00:05:00+00:00_1"))
+    run(chat_store.save_summary(container, "u1", "c1", "viejo", "2026-01-01T00:01:00+00:00_1"))
+    assert container.docs["c1"]["summary"] == "nuevo"
+
+
+@pytest.mark.parametrize("up_to", ["x' OR 1=1 --", "", "2026-01-01T00:00:00+00:00_1' OR '1'='1"])
+def test_save_summary_rechaza_sort_keys_invalidos(up_to):
+    container = SummaryContainer()
+    with pytest.raises(ValueError):
+        run(chat_store.save_summary(container, "u1", "c1", "resumen", up_to))
+
+
+class RecordingContainer(FakeContainer):
+    """ Anota el tamaño de cada batch; con `rival` otro worker crea la cabecera justo antes del create. """
+
+    def __init__(self, rival=None):
+        super().__init__()
+        self.sizes = []
+        self.rival = rival
+
+    async def execute_item_batch(self, batch_operations, partition_key):
+        self.sizes.append(len(batch_operations))
+        if self.rival and batch_operations[-1][0] == "create":
+            self.docs[self.rival["id"]], self.rival = self.rival, None
+        await super().execute_item_batch(batch_operations, partition_key)
+
+
+def test_muchos_turnos_respetan_el_limite_del_batch():
+    container = RecordingContainer()
+    turns = [(f"p{i}", f"r{i}", f"2026-01-01T00:00:{i:02d}+00:00") for i in range(60)]
+    run(chat_store.append_turns(container, "u1", "c1", turns))
+
+    assert max(container.sizes) <= chat_store.MAX_BATCH_OPERATIONS
+    assert len(container.of_type("chat_message")) == 120
+    assert container.docs["c1"]["messageCount"] == 120
+
+
+def test_primer_turno_simultaneo_vuelve_al_patch():
+    rival = {"id": "c1", "userId": "u1", "type": "chat", "title": "otro", "messageCount": 2, "updatedAt": "x"}
+    container = RecordingContainer(rival=rival)
+
+    run(chat_store.append_turn(container, "u1", "c1", "pregunta", "respuesta"))
+
+    # patch (404), create (409 en la cabecera) y patch otra vez
+    assert len(container.sizes) == 3
+    assert container.docs["c1"]["title"] == "otro" and container.docs["c1"]["messageCount"] == 4
+
+
+def test_historial_incluye_mensajes_embebidos_antiguos():
+    container = FakeContainer()
+    container.docs["c1"] = {"id": "c1", "userId": "u1", "type": "chat", "messages": [
+        {"role": "user", "text": "vieja", "timestamp": "2025-01-01T00:00:00"}]}
+    run(chat_store.append_turns(container, "u1", "c1", [("nueva", "ok", "2026-01-01T00:00:00+00:00")]))
+
+    mensajes, _, _ = run(chat_store.recent_history(container, "u1", "c1", limit=10))
+
+    assert [m["content"] for m in mensajes] == ["vieja", "nueva", "ok"]
+
+
+def test_borrar_un_chat_no_toca_los_demas():
+    container = FakeContainer()
+    for chat_id in ("c1", "c2"):
+        run(chat_store.append_turn(container, "u1", chat_id, "p", "r"))
+
+    run(chat_store.delete_chat_items(container, "u1", "c1"))
+
+    assert "c1" not in container.docs and "c2" in container.docs
+    assert {m["chatId"] for m in container.of_type("chat_message")} == {"c2"}
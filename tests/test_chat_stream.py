@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def frames(body: str):
+    """ [(evento, data)] de un cuerpo Server-Sent Events. """
+    eventos = []
+    for bloque in body.strip().split("\n\n"):
+        evento, data = bloque.split("\n", 1)
+        eventos.append((evento.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return eventos
+
+
+async def _stream(app, mensaje):
+    async with app.test_app() as test_app:
+        response = await test_app.test_client().post("/chat/stream", json={"message": mensaje})
+        assert response.mimetype == "text/event-stream"
+        return frames((await response.get_data()).decode())
+
+
+def test_stream_manda_moderacion_deltas_y_respuesta_final(chat_routes):
+    app, routes, fake = chat_routes
+
+    eventos = run(_stream(app, "¿Qué requisitos pide el trámite?"))
+
+    assert eventos == [
+        ("moderation", {"flagged": False}),
+        ("delta", {"text": "Hola"}),
+        ("delta", {"text": " mundo"}),
+        ("done", {"response": "Hola mundo"}),
+    ]
+    respuesta = fake.calls[-1]
+    assert respuesta["stream"] and respuesta["stream_options"] == {"include_usage": True}
+    # Juez + respuesta, con los tokens del último chunk del stream
+    judge = routes.mode_stats.snapshot()["judge"]
+    assert judge["requests"] == 1 and judge["llm_calls"] == 2 and judge["cached_tokens"] == 32
+
+
+def test_stream_bloqueado_no_llama_a_la_respuesta(chat_routes):
+    app, routes, fake = chat_routes
+    fake.verdict = "UNSAFE"
+
+    eventos = run(_stream(app, "mensaje que el juez bloquea"))
+
+    assert [evento for evento, _ in eventos] == ["moderation", "done"]
+    assert eventos[0][1]["flagged"] and eventos[0][1]["moderation_flagged"]
+    assert eventos[1][1]["response"] == eventos[0][1]["ai_response"]
+    assert not fake.streams
+
+
+def test_mensaje_vacio(chat_routes):
+    app, _, fake = chat_routes
+
+    async def escenario():
+        async with app.test_app() as test_app:
+            return await test_app.test_client().post("/chat/stream", json={"message": "  "})
+
+    assert run(escenario()).status_code == 400
+    assert not fake.calls
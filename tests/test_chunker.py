@@ -0,0 +1,132 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import chunker
+
+
+@pytest.fixture(autouse=True)
+def sin_tiktoken(monkeypatch):
+    # Conteo estimado (~4 caracteres por token): sin red tiktoken no puede bajar su BPE
+    monkeypatch.setattr(chunker, "tiktoken", None)
+    chunker._encoding.cache_clear()
+    yield
+    chunker._encoding.cache_clear()
+
+
+def test_source_name_relativo_a_la_raiz(tmp_path):
+    for carpeta in ("cdmx", "edomex"):
+        (tmp_path / carpeta).mkdir()
+        (tmp_path / carpeta / "2025-02-03_1.md").write_text("# Aviso\n\nTexto de la gaceta.", encoding="utf-8")
+
+    nombres = [chunker.chunk_path(str(tmp_path / c / "2025-02-03_1.md"), root=str(tmp_path))
+               for c in ("cdmx", "edomex")]
+
+    assert [n[0] for n in nombres] == ["cdmx/2025-02-03_1.md", "edomex/2025-02-03_1.md"]
+    # Homónimos en carpetas distintas no comparten ids de chunk
+    assert nombres[0][3][0][0] != nombres[1][3][0][0]
+    assert nombres[0][3][0][0].startswith("2025-02-03_1_")
+    assert str(nombres[0][1]) == "2025-02-03" and nombres[0][2] == "collection2"
+
+
+def test_source_name_sin_raiz_es_el_nombre():
+    assert chunker.source_name("/datos/cdmx/2025-02-03_1.md") == "2025-02-03_1.md"
+
+
+def _pieza(start, tokens, heading=False):
+    return chunker.Piece(start, start + tokens, tokens, heading)
+
+
+def test_pack_pieces_respeta_objetivo_y_traslape():
+    piezas = [_pieza(i * 10, 10) for i in range(10)]
+    chunks = chunker.pack_pieces(piezas, target=30, overlap=10)
+
+    assert chunks[0] == (0, 30)
+    # Cada chunk repite la última pieza del anterior
+    assert all(b[0] == a[1] - 10 for a, b in zip(chunks, chunks[1:]))
+    assert chunks[-1][1] == 100
+
+
+def test_encabezado_cierra_el_chunk_a_la_mitad():
+    piezas = [_pieza(0, 20), _pieza(20, 10, heading=True), _pieza(30, 10)]
+    assert chunker.pack_pieces(piezas, target=30, overlap=0) == [(0, 20), (20, 40)]
+    # Si el chunk va a menos de la mitad, el encabezado se queda con él
+    assert chunker.pack_pieces(piezas, target=100, overlap=0) == [(0, 40)]
+
+
+def test_articulos_separan_secciones():
+    texto = "Preámbulo.\n\nArtículo 1. Primero.\n\nARTÍCULO SEGUNDO. Segundo.\n"
+    piezas = chunker.split_pieces(texto, target=100)
+    assert [texto[p.start:p.end].strip()[:9] for p in piezas] == ["Preámbulo", "Artículo ", "ARTÍCULO "]
+
+
+def test_seccion_grande_se_parte_y_cada_chunk_es_un_corte_del_texto():
+    texto = "# Título\n\n" + "\n\n".join(f"Párrafo {i}. " + "palabra " * 60 for i in range(20))
+    chunks = chunker.chunk_text("2025-02-03_1.md", texto, target=200, overlap=40)
+
+    assert len(chunks) > 1
+    assert all(contenido in texto for _, contenido in chunks)
+    assert all(chunker.count_tokens(contenido) <= 200 for _, contenido in chunks)
+    # Ids estables entre corridas
+    assert chunks == chunker.chunk_text("2025-02-03_1.md", texto, target=200, overlap=40)
+    assert len({chunk_id for chunk_id, _ in chunks}) == len(chunks)
+
+
+def test_archivos_invalidos(tmp_path):
+    vacio = tmp_path / "2025-02-03_vacio.md"
+    vacio.write_text("  \n", encoding="utf-8")
+    sin_fecha = tmp_path / "aviso.md"
+    sin_fecha.write_text("texto", encoding="utf-8")
+
+    for path, motivo in ((vacio, "vacío"), (sin_fecha, "fecha")):
+        with pytest.raises(ValueError, match=motivo):
+            chunker.chunk_path(str(path))
+
+
+def test_sin_red_se_estiman_los_tokens(monkeypatch):
+    class SinRed:
+        @staticmethod
+        def get_encoding(name):
+            raise ConnectionError("sin red")
+
+    monkeypatch.setattr(chunker, "tiktoken", SinRed)
+    chunker._encoding.cache_clear()
+    assert chunker.count_tokens("12345678") == 2
+
+
+def test_chunk_path_fecha_coleccion_y_chunks(tmp_path):
+    (tmp_path / "2024").mkdir()
+    path = tmp_path / "2024" / "2024-11-05_2.md"
+    path.write_text("# Aviso\n\nArtículo 1. Convocatoria abierta.", encoding="utf-8")
+
+    file_name, gazette_date, collection, chunks = chunker.chunk_path(str(path), root=str(tmp_path))
+
+    assert (file_name, gazette_date.isoformat(), collection) == ("2024/2024-11-05_2.md", "2024-11-05", "collection1")
+    assert [contenido for _, contenido in chunks] == ["# Aviso\n\nArtículo 1. Convocatoria abierta."]
+
+
+def test_ids_distintos_para_gacetas_homonimas():
+    # Mismo nombre y offset en carpetas distintas: el id no se repite
+    assert chunker.chunk_id("2024/2024-11-05_2.md", 0) != chunker.chunk_id("2025/2024-11-05_2.md", 0)
+    assert chunker.chunk_id("2024/2024-11-05_2.md", 0).startswith("2024-11-05_2_")
+
+
+def test_parrafo_sin_separadores_se_corta_por_caracteres():
+    texto = "x" * 4000
+    piezas = chunker.split_pieces(texto, target=100)
+
+    assert len(piezas) == 10 and all(p.tokens <= 100 for p in piezas)
+    assert (piezas[0].start, piezas[-1].end) == (0, 4000)
+
+
+def test_chunking_en_un_pool_de_procesos(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"2025-03-0{i + 1}_1.md"
+        path.write_text(f"# Aviso {i}\n\n" + "Texto de la gaceta. " * 200, encoding="utf-8")
+        paths.append(str(path))
+
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        resultados = list(pool.map(chunker.chunk_path, paths))
+
+    assert resultados == [chunker.chunk_path(path) for path in paths]
@@ -0,0 +1,91 @@
+import types
+
+import pytest
+
+from backend.chat import context
+from backend.chat.context import pack, CHAT_CONTEXT_REPLY_TOKENS, TOKENS_PER_MESSAGE, TOKENS_PER_PROMPT
+
+
+@pytest.fixture(autouse=True)
+def estimado(monkeypatch):
+    """ Conteo determinista: ~4 caracteres por token (sin tiktoken). """
+    monkeypatch.setattr(context, "tiktoken", None)
+    context._encoding.cache_clear()
+    context.count_tokens.cache_clear()
+    yield
+    context._encoding.cache_clear()
+    context.count_tokens.cache_clear()
+
+
+def msg(role, content, key=None):
+    return {"role": role, "content": content, "key": key}
+
+
+def tail(question):
+    return {"session": {"role": "system", "content": "fecha"}, "documents": None,
+            "question": {"role": "user", "content": question}}
+
+
+def test_tokenizer_sin_red_usa_la_estimacion(monkeypatch):
+    def sin_red(*args):
+        raise ConnectionError("sin egress")
+    monkeypatch.setattr(context, "tiktoken", types.SimpleNamespace(encoding_for_model=sin_red, get_encoding=sin_red))
+
+    assert context.count_tokens("abcdefgh", "gpt-4o") == 2
+    assert context.count_tokens("abcdefghijkl", "gpt-4o") == 3
+    # El fallo queda en cache: no se reintenta la descarga en cada mensaje
+    assert context._encoding.cache_info().misses == 1
+
+
+def test_orden_prefijo_resumen_historial_tail():
+    history = [msg("user", "hola", "a"), msg("assistant", "qué tal", "b")]
+    messages, overflow, stats = pack("gpt-4o", [{"role": "system", "content": "prefijo"}], history,
+                                     tail("pregunta"), summary="resumen", budget=10_000)
+
+    assert [m["content"] for m in messages] == [
+        "prefijo", context.summary_message("resumen")["content"], "hola", "qué tal", "fecha", "pregunta"]
+    assert overflow == []
+    assert "key" not in messages[2]
+    assert stats["history_messages"] == 2 and stats["summary"]
+    assert "documents" not in stats["sections"]
+
+
+def test_el_historial_entra_del_mas_nuevo_al_mas_viejo():
+    history = [msg("user", "x" * 400, str(i)) for i in range(10)]  # 100 tokens + 4 cada uno
+    fijo = TOKENS_PER_PROMPT + CHAT_CONTEXT_REPLY_TOKENS + 2 * (TOKENS_PER_MESSAGE + 2)
+    budget = fijo + 3 * (100 + TOKENS_PER_MESSAGE)
+
+    messages, overflow, stats = pack("gpt-4o", [{"role": "system", "content": "prefijo!"}], history,
+                                     {"question": {"role": "user", "content": "pregunta"}}, budget=budget)
+
+    assert stats["history_messages"] == 3
+    assert stats["dropped_messages"] == 7
+    assert [m["key"] for m in overflow] == [str(i) for i in range(7)]
+    assert stats["prompt_tokens"] + CHAT_CONTEXT_REPLY_TOKENS <= budget
+    assert stats["sections"]["history"] == 3 * (100 + TOKENS_PER_MESSAGE)
+
+
+def test_overflow_excluye_lo_que_ya_esta_en_el_resumen():
+    history = [msg("user", "x" * 4000, f"k{i}") for i in range(4)]
+    _, overflow, _ = pack("gpt-4o", [], history, {"question": {"role": "user", "content": "p"}},
+                          summary="r", summarized_up_to="k1", budget=CHAT_CONTEXT_REPLY_TOKENS + 1100)
+
+    assert [m["key"] for m in overflow] == ["k2"]
+
+
+def test_un_resumen_que_no_cabe_se_omite():
+    messages, _, stats = pack("gpt-4o", [], [], {"question": {"role": "user", "content": "p"}},
+                              summary="r" * 4000, budget=CHAT_CONTEXT_REPLY_TOKENS + 50)
+
+    assert not stats["summary"]
+    assert stats["sections"]["summary"] == 0
+    assert [m["content"] for m in messages] == ["p"]
+
+
+def test_maximo_de_mensajes(monkeypatch):
+    monkeypatch.setattr(context, "CHAT_CONTEXT_MAX_MESSAGES", 2)
+    history = [msg("user", "a", str(i)) for i in range(5)]
+
+    _, _, stats = pack("gpt-4o", [], history, {"question": {"role": "user", "content": "p"}}, budget=10_000)
+
+    assert stats["history_messages"] == 2
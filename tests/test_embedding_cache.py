@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from backend.chat.embedding_cache import EmbeddingCache, embedding_key
+
+
+def test_llave_solo_unifica_espacios_y_unicode():
+    assert embedding_key("ada", "hola   mundo") == embedding_key("ada", " hola mundo ")
+    assert embedding_key("ada", "café") == embedding_key("ada", "café")
+    assert embedding_key("ada", "Hola") != embedding_key("ada", "hola")
+    assert embedding_key("ada", "hola") != embedding_key("3-small", "hola")
+
+
+def test_lru_en_memoria():
+    cache = EmbeddingCache(max_size=2)
+    cache.set("ada", "a", [1.0, 0.0])
+    cache.set("ada", "b", [0.0, 1.0])
+    cache.get("ada", "a")
+    cache.set("ada", "c", [1.0, 1.0])
+
+    assert cache.get("ada", "b") is None
+    assert cache.get("ada", "a") == [1.0, 0.0]
+    assert cache.stats()["size"] == 2
+
+
+def test_sqlite_sobrevive_al_proceso(tmp_path):
+    db = str(tmp_path / "emb.db")
+    EmbeddingCache(db_path=db).set("ada", "pregunta", [0.25, 0.5, 0.75])
+
+    cache = EmbeddingCache(db_path=db)
+    assert cache.get("ada", "pregunta") == pytest.approx([0.25, 0.5, 0.75])
+    assert cache.disk_hits == 1
+
+
+def test_embed_llama_a_azure_solo_en_miss():
+    llamadas = []
+
+    async def create(model, input):
+        llamadas.append(input)
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[0.1, 0.2])])
+
+    client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+    cache = EmbeddingCache()
+
+    async def escenario():
+        return [await cache.embed(client, "ada", "hola") for _ in range(3)]
+
+    # Del cache sale como float32
+    assert all(e == pytest.approx([0.1, 0.2]) for e in asyncio.run(escenario()))
+    assert llamadas == ["hola"]
+    assert cache.hits == 2 and cache.misses == 1
@@ -0,0 +1,22 @@
+import pytest
+
+from backend.chat.stats import ModeStats
+
+
+def test_acumula_por_modo_con_promedios():
+    stats = ModeStats()
+    stats.registrar("judge", 300.0, {"llm_calls": 2, "prompt_tokens": 100, "completion_tokens": 20})
+    stats.registrar("judge", 100.0, {"llm_calls": 1, "prompt_tokens": 50, "completion_tokens": 10,
+                                     "cached_tokens": 32}, flagged=True)
+    stats.registrar("fused", 150.0, {"llm_calls": 1}, fallback=True)
+
+    snapshot = stats.snapshot()
+    judge = snapshot["judge"]
+    assert judge["requests"] == 2 and judge["flagged"] == 1 and judge["cached_tokens"] == 32
+    assert judge["latency_ms_avg"] == pytest.approx(200.0)
+    assert judge["llm_calls_avg"] == 1.5 and judge["tokens_avg"] == 90.0
+    assert snapshot["fused"]["fallbacks"] == 1 and snapshot["fused"]["prompt_tokens"] == 0
+
+
+def test_sin_peticiones_no_hay_modos():
+    assert ModeStats().snapshot() == {}
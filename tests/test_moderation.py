@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace as NS
+
+import pytest
+
+from backend.chat import moderation
+
+
+class FakeSafetyClient:
+    def __init__(self, severities=None, delay=0.0, error=None):
+        self.severities = severities or {}
+        self.delay = delay
+        self.error = error
+        self.requests = []
+
+    async def analyze_text(self, request):
+        self.requests.append(request)
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return NS(categories_analysis=[NS(category=c, severity=s) for c, s in self.severities.items()])
+
+
+@pytest.fixture
+def safety(monkeypatch):
+    """ Instala un cliente de Content Safety en memoria; devuelve una función para configurarlo. """
+    def instalar(fail_mode="open", timeout=0.05, **kwargs):
+        client = FakeSafetyClient(**kwargs)
+        monkeypatch.setattr(moderation, "_safety_client", client)
+        monkeypatch.setattr(moderation, "CONTENT_SAFETY_FAIL_MODE", fail_mode)
+        monkeypatch.setattr(moderation, "CONTENT_SAFETY_TIMEOUT", timeout)
+        return client
+    return instalar
+
+
+def check(texto):
+    return asyncio.run(moderation.check_text_safety(texto, include_blocklist=False))
+
+
+def test_severidad_mas_alta_de_las_categorias(safety):
+    client = safety(severities={"Hate": 0, "Violence": 4})
+
+    resultado = check("un texto")
+
+    assert resultado["flagged"] and resultado["severity"] == 4
+    assert client.requests[0]["text"] == "un texto"
+
+
+def test_texto_limpio_pasa(safety):
+    safety(severities={"Hate": 0, "SelfHarm": 0})
+    assert check("hola") == {"flagged": False, "severity": 0,
+                             "reason": [{"category": "Hate", "severity": 0},
+                                        {"category": "SelfHarm", "severity": 0}]}
+
+
+@pytest.mark.parametrize("fail_mode, flagged", [("open", False), ("closed", True)])
+def test_timeout_segun_la_politica(safety, fail_mode, flagged):
+    safety(fail_mode=fail_mode, delay=1)
+
+    resultado = check("Azure tarda")
+
+    assert resultado["reason"] == "TIMEOUT" and resultado["flagged"] is flagged
+
+
+@pytest.mark.parametrize("fail_mode, flagged", [("open", False), ("closed", True)])
+def test_error_de_la_api_segun_la_politica(safety, fail_mode, flagged):
+    safety(fail_mode=fail_mode, error=ConnectionError("sin red"))
+
+    resultado = check("Azure falla")
+
+    assert resultado["reason"] == "API_ERROR" and resultado["flagged"] is flagged
+
+
+@pytest.mark.parametrize("fail_mode", ["open", "closed"])
+def test_veredicto_por_falla_no_se_guarda_en_cache(chat_routes, safety, fail_mode):
+    _, routes, _ = chat_routes
+    safety(fail_mode=fail_mode, delay=1)
+
+    flagged = asyncio.run(routes._moderar_mensaje("Azure tarda", "es"))
+
+    assert bool(flagged) is (fail_mode == "closed")
+    assert routes.verdict_cache.get("Azure tarda") is None
+
+
+def test_veredicto_confiable_se_guarda_en_cache(chat_routes, safety):
+    _, routes, _ = chat_routes
+    safety(severities={"Hate": 0})
+
+    assert asyncio.run(routes._moderar_mensaje("pregunta normal", "es")) is None
+    assert routes.verdict_cache.get("pregunta normal") == {"flagged": False, "severity": 0}
@@ -0,0 +1,126 @@
+import asyncio
+import json
+from types import SimpleNamespace as NS
+
+import pytest
+
+from backend.chat import office_agent as oa
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class FakePool:
+    def __init__(self, rows=(), error=None):
+        self.rows = list(rows)
+        self.error = error
+        self.fetches = []
+        self.closed = False
+
+    async def fetch(self, query, *args):
+        self.fetches.append((query, args))
+        return self.rows
+
+    async def fetchval(self, query, timeout=None):
+        if self.error:
+            raise self.error
+        return 1
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeOpenAIClient:
+    def __init__(self, **kwargs):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def agente(monkeypatch):
+    """ OfficeAgent sin índice local y con asyncpg/OpenAI en memoria; anota cada pool creado. """
+    pools = []
+
+    async def create_pool(dsn, **kwargs):
+        pool = FakePool()
+        pools.append((pool, kwargs))
+        return pool
+
+    monkeypatch.setattr(oa, "local_index", NS(available=False))
+    monkeypatch.setattr(oa.asyncpg, "create_pool", create_pool)
+    monkeypatch.setattr(oa, "AsyncAzureOpenAI", FakeOpenAIClient)
+    return oa.OfficeAgent(min_size=2, max_size=5), pools
+
+
+def test_un_pool_por_proceso_con_los_parametros_del_indice(agente):
+    agent, pools = agente
+
+    async def escenario():
+        await agent.initialize()
+        await agent.initialize()
+        return await agent.health()
+
+    assert run(escenario()) is True
+    assert len(pools) == 1
+    kwargs = pools[0][1]
+    assert kwargs["min_size"] == 2 and kwargs["max_size"] == 5
+    assert kwargs["command_timeout"] == oa.OFFICE_AGENT_QUERY_TIMEOUT
+    assert set(kwargs["server_settings"]) == {"hnsw.ef_search", "ivfflat.probes"}
+
+
+def test_health_falso_si_postgres_no_responde(agente):
+    agent, _ = agente
+    agent.openai_client = FakeOpenAIClient()
+    agent.pool = FakePool(error=ConnectionError("sin red"))
+
+    assert run(agent.health()) is False
+
+
+def test_close_libera_pool_y_cliente(agente):
+    agent, pools = agente
+
+    async def escenario():
+        await agent.initialize()
+        cliente = agent.openai_client
+        await agent.close()
+        return cliente
+
+    cliente = run(escenario())
+
+    assert pools[0][0].closed and cliente.closed
+    assert not agent.running and agent.pool is None
+
+
+def test_contexto_con_los_documentos_encontrados(agente, monkeypatch):
+    agent, _ = agente
+    agent.openai_client = FakeOpenAIClient()
+    agent.pool = FakePool(rows=[
+        # asyncpg entrega jsonb como texto
+        {"id": "d1", "content": "Requisitos de la licencia", "metadata": json.dumps({"source": "Gaceta 5"}),
+         "similarity": 0.91},
+    ])
+
+    async def embedding(texto):
+        return [0.1, 0.2]
+
+    monkeypatch.setattr(agent, "_generar_embedding", embedding)
+    monkeypatch.setattr(agent, "_necesita_busqueda_vectorial", lambda mensaje: True)
+
+    contexto = run(agent.contexto_documentos("¿Requisitos de la licencia?"))
+
+    assert "(Fuente: Gaceta 5) [Relevancia: 91.00%]" in contexto
+    assert "Requisitos de la licencia" in contexto
+    assert agent.metrics.get_documentos_mas_accedidos(1)[0][0] == "d1"
+
+
+def test_sin_busqueda_no_consulta_postgres(agente, monkeypatch):
+    agent, _ = agente
+    agent.openai_client = FakeOpenAIClient()
+    agent.pool = FakePool()
+    monkeypatch.setattr(agent, "_necesita_busqueda_vectorial", lambda mensaje: False)
+
+    assert run(agent.contexto_documentos("hola")) == ""
+    assert agent.pool.fetches == []
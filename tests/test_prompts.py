@@ -0,0 +1,69 @@
+import asyncio
+from datetime import datetime, timezone
+
+from backend.chat.prompts import FUSED_INSTRUCTION, PromptTemplates
+
+
+def test_prefijo_estable_por_idioma_y_modo():
+    templates = PromptTemplates(modes={"fused": FUSED_INSTRUCTION})
+
+    es = templates.prefix("es")
+    assert es is templates.prefix("es") and "**es**" in es
+    assert templates.prefix("en") != es
+    # El modo fusionado comparte el inicio y agrega la salida JSON al final
+    fused = templates.prefix("es", "fused")
+    assert fused.startswith(es) and '"verdict"' in fused
+
+
+def test_idioma_fuera_de_la_lista_se_arma_sin_guardarse():
+    templates = PromptTemplates()
+
+    assert "**pt**" in templates.prefix("pt")
+    assert ("pt", "judge") not in templates._prefixes
+
+
+def test_sesion_con_perfil_invitado_y_fecha():
+    now = datetime(2026, 3, 1, 9, 30, tzinfo=timezone.utc)
+    user = {"dbProfile": {"name": "Ana", "state": "Jalisco", "country": "México"}}
+
+    assert "CURRENT DATE UTC: 2026-03-01 09:30 UTC" in PromptTemplates.session(user, now=now)
+    assert "Usuario: Ana, Jalisco, México" in PromptTemplates.session(user, now=now)
+    assert "Usuario Invitado." in PromptTemplates.session(None, now=now)
+
+
+def test_tail_en_orden_y_sin_documentos_vacios():
+    tail = PromptTemplates().tail(None, "", "¿Pregunta?")
+
+    assert list(tail) == ["session", "documents", "question"]
+    assert tail["documents"] is None
+    assert tail["question"] == {"role": "user", "content": "¿Pregunta?"}
+
+
+def test_proporcion_cacheable_por_seccion():
+    templates = PromptTemplates()
+    templates.record({"prefix": 300, "history": 100, "session": 50, "question": 50})
+    templates.record({"prefix": 300, "session": 50, "question": 150})
+
+    stats = templates.stats()
+
+    assert stats["requests"] == 2
+    assert stats["avg_tokens_by_section"]["prefix"] == 300.0
+    assert stats["cacheable_ratio"] == round(700 / 1000, 4)
+
+
+def test_el_prompt_de_respuesta_empieza_igual_en_cada_request(chat_routes):
+    app, routes, _ = chat_routes
+    user = {"dbProfile": {"name": "Ana", "state": "Jalisco", "country": "México"}}
+
+    async def escenario():
+        async with app.app_context():
+            primero, _ = await routes._answer_messages("es", user, "¿Primera pregunta?")
+            segundo, _ = await routes._answer_messages("es", None, "¿Otra pregunta distinta?")
+            return primero, segundo
+
+    primero, segundo = asyncio.run(escenario())
+
+    assert primero[0] == segundo[0]
+    assert primero[0]["content"] == routes.prompt_templates.prefix("es")
+    # Lo que cambia (perfil, fecha, pregunta) va al final
+    assert primero[-1]["content"] == "¿Primera pregunta?" and "Ana" in primero[-2]["content"]
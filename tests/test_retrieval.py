@@ -0,0 +1,130 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+import chunker
+import retrieval
+
+
+@pytest.fixture(autouse=True)
+def sin_tiktoken(monkeypatch):
+    monkeypatch.setattr(chunker, "tiktoken", None)
+    chunker._encoding.cache_clear()
+    yield
+    chunker._encoding.cache_clear()
+
+
+def _r(source, content="texto", **extra):
+    return {"id": f"{source}-{content}", "source": source, "content": content, **extra}
+
+
+def test_rrf_junta_el_mismo_archivo_entre_sistemas():
+    listas = {
+        "rag-index-2": [_r("2025-03-01_1.md", "chunk azure"), _r("2025-03-02_1.md")],
+        "bm25": [_r("2025-03-02_1.md", "chunk bm25"), _r("2025-03-01_1.md", "otro corte")],
+    }
+    fused = retrieval.reciprocal_rank_fusion(listas, recency_weight=0)
+
+    assert len(fused) == 2
+    assert all(sorted(r["@rrf.lists"]) == ["bm25", "rag-index-2"] for r in fused)
+    # Se devuelve el chunk mejor posicionado
+    assert {r["content"] for r in fused} == {"chunk azure", "chunk bm25"}
+
+
+def test_rrf_cuenta_una_vez_por_lista_y_aplica_pesos():
+    listas = {
+        "a": [_r("x.md", "1"), _r("x.md", "2"), _r("y.md")],
+        "b": [_r("y.md")],
+    }
+    fused = retrieval.reciprocal_rank_fusion(listas, weights={"b": 3.0}, recency_weight=0, k=60)
+    por_source = {r["source"]: r for r in fused}
+
+    assert por_source["x.md"]["@rrf.lists"] == ["a"]
+    assert por_source["x.md"]["@rrf.score"] == pytest.approx(1 / 61)
+    assert por_source["y.md"]["@rrf.score"] == pytest.approx(1 / 63 + 3 / 61)
+    assert fused[0]["source"] == "y.md"
+
+
+def test_recencia_desempata():
+    listas = {"a": [_r("2020-01-01_1.md")], "b": [_r("2025-06-01_1.md")]}
+    fused = retrieval.reciprocal_rank_fusion(listas, today=date(2025, 6, 1))
+    assert fused[0]["source"] == "2025-06-01_1.md"
+
+
+def test_bm25_indexa_chunks_y_encuentra_terminos_exactos(tmp_path):
+    (tmp_path / "2025-02-03_1.md").write_text(
+        "# Aviso\n\nArtículo 5. Licencia de conducir tipo A.\n\nArtículo 6. Otro tema.", encoding="utf-8")
+    (tmp_path / "2025-02-04_1.md").write_text("Programa de becas para estudiantes.", encoding="utf-8")
+
+    index = retrieval.BM25Index.from_directory(str(tmp_path))
+    assert all(doc["source"].endswith(".md") for doc in index.docs)
+
+    resultados = index.search("licencia de conducir", top=3)
+    assert resultados[0]["source"] == "2025-02-03_1.md"
+    assert "Licencia" in resultados[0]["content"]
+    assert index.search("becas")[0]["source"] == "2025-02-04_1.md"
+    assert index.search("inexistente") == []
+
+
+def test_bm25_usa_los_nombres_de_la_ingesta(tmp_path):
+    (tmp_path / "2024").mkdir()
+    path = tmp_path / "2024" / "2024-05-06_1.md"
+    path.write_text("Convocatoria de becas.", encoding="utf-8")
+
+    index = retrieval.BM25Index.from_directory(str(tmp_path))
+    _, _, _, chunks = chunker.chunk_path(str(path), root=str(tmp_path))
+    assert [(d["source"], d["id"]) for d in index.docs] == [("2024/2024-05-06_1.md", chunks[0][0])]
+
+
+def test_tokenize_sin_acentos_ni_palabras_vacias():
+    assert retrieval.tokenize("El Artículo 27, fracción III") == ["articulo", "27", "fraccion", "iii"]
+
+
+def test_hedged_call_devuelve_default_al_vencer():
+    tracker = retrieval.LatencyTracker()
+
+    async def lenta():
+        await asyncio.sleep(1)
+        return ["tarde"]
+
+    assert asyncio.run(retrieval.hedged_call(lenta, tracker, deadline=0.01, default=[])) == []
+    assert tracker.timeouts == 1
+
+
+def test_p95_solo_con_muestras_suficientes():
+    tracker = retrieval.LatencyTracker(window=100, min_samples=20)
+    for ms in range(19):
+        tracker.record(ms / 1000)
+    assert tracker.p95() is None
+
+    for ms in range(19, 100):
+        tracker.record(ms / 1000)
+    assert tracker.p95() == 0.095 and tracker.stats()["p95_ms"] == 95.0
+
+
+def test_hedged_call_lanza_una_segunda_llamada_pasado_el_p95():
+    tracker = retrieval.LatencyTracker(min_samples=1)
+    tracker.record(0.01)
+    llamadas = []
+
+    async def busqueda():
+        llamadas.append(len(llamadas))
+        # La primera se queda colgada; la copia responde de inmediato
+        await asyncio.sleep(1 if len(llamadas) == 1 else 0)
+        return [f"llamada {len(llamadas)}"]
+
+    resultado = asyncio.run(retrieval.hedged_call(busqueda, tracker, deadline=0.5, default=[]))
+
+    assert resultado == ["llamada 2"]
+    assert tracker.hedges == 1 and tracker.hedge_wins == 1 and tracker.timeouts == 0
+
+
+def test_hedged_call_con_error_devuelve_default_sin_contar_timeout():
+    tracker = retrieval.LatencyTracker()
+
+    async def falla():
+        raise ConnectionError("índice caído")
+
+    assert asyncio.run(retrieval.hedged_call(falla, tracker, deadline=0.5, default=[])) == []
+    assert tracker.timeouts == 0 and tracker.stats()["samples"] == 0
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from backend.chat import retrieval_router as rr
+
+
+def test_featurize_normalizado_e_insensible_a_acentos():
+    indices, values = rr.featurize("Qué dice el  Artículo 5")
+    assert np.linalg.norm(values) == pytest.approx(1.0)
+    assert indices.dtype == np.int64 and (indices < rr.N_FEATURES).all()
+
+    otro = rr.featurize("que DICE el articulo 5")
+    assert dict(zip(*otro)) == pytest.approx(dict(zip(indices, values)))
+
+    vacio = rr.featurize("   ")
+    assert len(vacio[0]) == 0 and len(vacio[1]) == 0
+
+
+def _router(texto_positivo, n_features=2 ** 12):
+    weights = np.zeros(n_features, dtype=np.float32)
+    indices, _ = rr.featurize(texto_positivo, n_features)
+    weights[indices] = 5.0
+    return rr.RetrievalRouter(weights, bias=-2.0, threshold=0.5, meta={"n_features": n_features})
+
+
+def test_prediccion_y_umbral():
+    router = _router("requisitos licencia")
+    assert router.needs_retrieval("¿Cuáles son los requisitos de la licencia?")
+    assert not router.needs_retrieval("hola")
+    assert router.stats()["retrieval_rate"] == 0.5
+
+
+def test_guardar_y_cargar(tmp_path):
+    router = _router("predial")
+    path = str(tmp_path / "router.npz")
+    router.save(path)
+
+    cargado = rr.RetrievalRouter.load(path, threshold=0.9)
+    assert cargado.threshold == 0.9 and cargado.n_features == router.n_features
+    assert cargado.predict_proba("pago del predial") == pytest.approx(router.predict_proba("pago del predial"))
+
+
+def test_sin_modelo_se_usan_palabras_clave(monkeypatch, tmp_path):
+    monkeypatch.delenv("OFFICE_AGENT_ROUTER_MODEL", raising=False)
+    assert rr.load_router() is None
+
+    monkeypatch.setenv("OFFICE_AGENT_ROUTER_MODEL", str(tmp_path / "no-existe.npz"))
+    assert rr.load_router() is None
@@ -0,0 +1,71 @@
+from backend.chat.prompts import PromptTemplates
+from backend.chat.semantic_cache import SemanticCache
+
+
+def test_pregunta_equivalente_reutiliza_la_respuesta():
+    cache = SemanticCache(threshold=0.95)
+    cache.store("es", [1.0, 0.0, 0.0], "respuesta")
+
+    assert cache.lookup("es", [0.99, 0.05, 0.0]) == "respuesta"
+    assert cache.lookup("es", [0.0, 1.0, 0.0]) is None
+    assert cache.hits == 1 and cache.misses == 1
+
+
+def test_ambitos_separados():
+    cache = SemanticCache(threshold=0.9)
+    cache.store("es|Jalisco|México", [1.0, 0.0], "respuesta para Jalisco")
+
+    assert cache.lookup("es|Jalisco|México", [1.0, 0.0]) == "respuesta para Jalisco"
+    assert cache.lookup("es|Sonora|México", [1.0, 0.0]) is None
+    assert cache.lookup("en", [1.0, 0.0]) is None
+
+
+def test_respuestas_vencidas_no_se_sirven():
+    cache = SemanticCache(threshold=0.9, ttl=-1)
+    cache.store("es", [1.0, 0.0], "vieja")
+    assert cache.lookup("es", [1.0, 0.0]) is None
+
+
+def test_cambio_de_corpus_invalida(tmp_path):
+    marker = tmp_path / "corpus.txt"
+    marker.write_text("v1")
+    cache = SemanticCache(threshold=0.9, corpus_marker=str(marker), marker_check_interval=0)
+    cache.store("es", [1.0, 0.0], "respuesta")
+
+    marker.write_text("v2")
+    assert cache.lookup("es", [1.0, 0.0]) is None
+    assert cache.invalidations == 1
+
+
+def test_prompt_compartido_sin_nombre_del_usuario():
+    user = {"dbProfile": {"name": "Ana Pérez", "state": "Jalisco", "country": "México"}}
+    compartido = PromptTemplates.session(user, shared=True)
+    assert "Ana" not in compartido and "Jalisco" in compartido
+    assert "Ana Pérez" in PromptTemplates.session(user)
+
+
+def test_tope_global_descarta_el_ambito_menos_usado():
+    cache = SemanticCache(threshold=0.9, max_entries=3)
+    cache.store("es|Jalisco|México", [1.0, 0.0], "jalisco")
+    cache.store("es|Sonora|México", [1.0, 0.0], "sonora")
+    cache.store("es|Sonora|México", [0.0, 1.0], "sonora 2")
+    # Jalisco se usó más recientemente que Sonora
+    assert cache.lookup("es|Jalisco|México", [1.0, 0.0]) == "jalisco"
+
+    cache.store("en", [1.0, 0.0], "english")
+
+    assert sum(cache.stats()["entries"].values()) == 3
+    assert cache.lookup("es|Sonora|México", [1.0, 0.0]) is None
+    assert cache.lookup("es|Sonora|México", [0.0, 1.0]) == "sonora 2"
+    assert cache.lookup("es|Jalisco|México", [1.0, 0.0]) == "jalisco"
+
+
+def test_la_matriz_crece_con_las_entradas():
+    cache = SemanticCache(threshold=0.9, max_entries=100)
+    for i in range(40):
+        cache.store("es", [1.0, float(i)], f"r{i}")
+
+    index = cache._indexes["es"]
+    assert index.size == 40 and index.matrix.shape[0] == 64
+    assert cache.lookup("es", [1.0, 39.0]) == "r39"
+    assert cache.lookup("es", [1.0, 0.0]) == "r0"
@@ -0,0 +1,51 @@
+from datetime import date, timedelta
+
+from backend.chat.sketches import DayBuckets, HyperLogLog, SpaceSaving
+
+
+def test_space_saving_conserva_los_frecuentes():
+    sketch = SpaceSaving(capacity=3)
+    for key, veces in (("licencia", 50), ("predial", 30), ("becas", 20)):
+        for _ in range(veces):
+            sketch.add(key)
+    for i in range(10):
+        sketch.add(f"raro{i}")
+
+    top = dict(sketch.top(2))
+    assert list(top) == ["licencia", "predial"]
+    assert len(sketch) == 3
+    # El error está acotado: nunca subestima y sobreestima a lo más el mínimo reemplazado
+    assert top["licencia"] == 50 and top["predial"] == 30
+
+
+def test_hyperloglog_aproxima_distintos():
+    hll = HyperLogLog(precision=10)
+    for i in range(20000):
+        hll.add(f"usuario-{i % 5000}")
+
+    estimado = HyperLogLog.estimate(hll.registers)
+    assert abs(estimado - 5000) / 5000 < 0.1
+
+
+def test_hyperloglog_pocos_elementos_casi_exacto():
+    hll = HyperLogLog()
+    for key in ("a", "b", "c", "a"):
+        hll.add(key)
+    assert HyperLogLog.estimate(hll.registers) == 3
+
+
+def test_ventanas_por_dia():
+    buckets = DayBuckets(days=7)
+    hoy = date(2026, 3, 10)
+    for dia in range(10):
+        fecha = hoy - timedelta(days=dia)
+        buckets.add(f"u{dia}", 0.5, today=fecha)
+        buckets.add("u-comun", 1.0, today=fecha)
+
+    semana = buckets.window(7, today=hoy)
+    # Los días fuera del anillo se sobrescribieron o quedaron fuera
+    assert semana["count"] == 14
+    assert semana["distinct"] == 8
+    assert semana["similarity_sum"] == 7 * 1.5
+    assert buckets.window(1, today=hoy)["count"] == 2
+    assert buckets.window(30, today=hoy)["count"] == 14
@@ -0,0 +1,58 @@
+import asyncio
+
+from tests.test_chat_stream import frames
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _responder(routes, paralelo, mensaje="¿Dónde tramito mi licencia?"):
+    async def escenario():
+        async def prompt():
+            return [{"role": "system", "content": "prefijo"}, {"role": "user", "content": mensaje}], False
+        return await routes._responder_con_juez(mensaje, "es", asyncio.create_task(prompt()), paralelo=paralelo, uso={})
+    return run(escenario())
+
+
+def test_la_respuesta_arranca_antes_de_terminar_la_moderacion(chat_routes):
+    _, routes, fake = chat_routes
+    fake.judge_delay = 0.05
+
+    assert _responder(routes, paralelo=True) == (None, "respuesta")
+    assert fake.events.index("answer:start") < fake.events.index("judge:end")
+
+
+def test_sin_modo_especulativo_la_respuesta_espera_al_juez(chat_routes):
+    _, routes, fake = chat_routes
+    fake.judge_delay = 0.05
+
+    assert _responder(routes, paralelo=False) == (None, "respuesta")
+    assert fake.events == ["judge:start", "judge:end", "answer:start", "answer:end"]
+
+
+def test_mensaje_bloqueado_cancela_la_respuesta_especulativa(chat_routes):
+    _, routes, fake = chat_routes
+    fake.verdict = "UNSAFE"
+    fake.answer_delay = 1
+
+    flagged, respuesta = _responder(routes, paralelo=True)
+
+    assert flagged["moderation_flagged"] and respuesta is None
+    assert "answer:cancelled" in fake.events and "answer:end" not in fake.events
+
+
+def test_stream_especulativo_bloqueado_cierra_la_conexion(chat_routes):
+    app, _, fake = chat_routes
+    app.config["CHAT_SPECULATIVE_GENERATION"] = True
+    fake.verdict = "UNSAFE"
+    fake.judge_delay = 0.05
+
+    async def escenario():
+        async with app.test_app() as test_app:
+            response = await test_app.test_client().post("/chat/stream", json={"message": "algo que se bloquea"})
+            return frames((await response.get_data()).decode())
+
+    assert [evento for evento, _ in run(escenario())] == ["moderation", "done"]
+    # El stream ya estaba abierto cuando llegó el veredicto: se cerró sin leerlo
+    assert len(fake.streams) == 1 and fake.streams[0].closed
@@ -0,0 +1,81 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backend.chat import speech
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _service(status=200, delay=0.0):
+    """ Servicio con un STS en memoria que emite "token-1", "token-2", ... """
+    emitidos = []
+
+    async def sts(request):
+        await asyncio.sleep(delay)
+        emitidos.append(request.url.host)
+        return httpx.Response(status, text=f"token-{len(emitidos)}")
+
+    service = speech.SpeechTokenService(refresh_after=480)
+    service._client = httpx.AsyncClient(transport=httpx.MockTransport(sts))
+    return service, emitidos
+
+
+def _envejecer(service, region, segundos):
+    token, emitido = service._tokens[region]
+    service._tokens[region] = (token, emitido - segundos)
+
+
+def test_pedidos_simultaneos_comparten_una_llamada():
+    service, emitidos = _service(delay=0.02)
+
+    async def escenario():
+        return await asyncio.gather(*(service.get_token("eastus", "k") for _ in range(10)))
+
+    tokens = run(escenario())
+
+    assert {token for token, _ in tokens} == {"token-1"}
+    assert emitidos == ["eastus.api.cognitive.microsoft.com"] and service.sts_calls == 1
+
+
+def test_token_viejo_se_sirve_y_se_renueva_en_segundo_plano():
+    service, emitidos = _service()
+
+    async def escenario():
+        await service.get_token("eastus", "k")
+        _envejecer(service, "eastus", 500)
+        servido = await service.get_token("eastus", "k")
+        await service._inflight["eastus"]
+        return servido, await service.get_token("eastus", "k")
+
+    servido, siguiente = run(escenario())
+
+    assert servido[0] == "token-1" and servido[1] <= speech.TOKEN_TTL - 500
+    assert siguiente[0] == "token-2" and service.sts_calls == 2
+
+
+def test_token_por_vencer_espera_la_renovacion():
+    service, _ = _service()
+
+    async def escenario():
+        await service.get_token("eastus", "k")
+        _envejecer(service, "eastus", speech.TOKEN_TTL - speech.EXPIRY_MARGIN)
+        return await service.get_token("eastus", "k")
+
+    assert run(escenario())[0] == "token-2"
+
+
+def test_error_del_sts_se_reintenta_en_el_siguiente_pedido():
+    service, _ = _service(status=500)
+
+    async def escenario():
+        with pytest.raises(httpx.HTTPStatusError):
+            await service.get_token("eastus", "k")
+        with pytest.raises(httpx.HTTPStatusError):
+            await service.get_token("eastus", "k")
+
+    run(escenario())
+    assert service.errors == 2 and service.stats()["regions"] == []
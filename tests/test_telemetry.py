@@ -0,0 +1,85 @@
+import asyncio
+import contextvars
+from types import SimpleNamespace as NS
+
+from quart import Quart
+
+from backend import telemetry
+from backend.database.connection import _cosmos_operation
+from backend.main import routes as main_routes
+
+
+def test_contador_con_labels_escapados():
+    registry = telemetry.Registry()
+    llamadas = registry.counter("pruebas_total", "Llamadas.", ("mode",))
+    llamadas.inc(mode="judge")
+    llamadas.inc(2, mode='fu"sed')
+
+    assert registry.render().splitlines() == [
+        "# HELP pruebas_total Llamadas.",
+        "# TYPE pruebas_total counter",
+        'pruebas_total{mode="fu\\"sed"} 2',
+        'pruebas_total{mode="judge"} 1',
+    ]
+
+
+def test_histograma_acumulativo():
+    histograma = telemetry.Histogram("pruebas_seconds", "Duración.", ("stage",), buckets=(0.1, 1.0))
+    for segundos in (0.05, 0.1, 0.5, 3.0):
+        histograma.observe(segundos, stage="judge")
+
+    lines = histograma.render()[2:]
+
+    assert lines == [
+        'pruebas_seconds_bucket{stage="judge",le="0.1"} 2',
+        'pruebas_seconds_bucket{stage="judge",le="1"} 3',
+        'pruebas_seconds_bucket{stage="judge",le="+Inf"} 4',
+        'pruebas_seconds_sum{stage="judge"} 3.650000',
+        'pruebas_seconds_count{stage="judge"} 4',
+    ]
+
+
+def test_server_timing_suma_las_etapas_del_request(monkeypatch):
+    monkeypatch.setattr(telemetry, "METRICS_ENABLED", True)
+
+    def request():
+        telemetry.start_request()
+        telemetry.record_stage("judge", 0.010)
+        telemetry.record_stage("cosmos_batch", 0.002)
+        telemetry.record_stage("judge", 0.005)
+        return telemetry.server_timing_header()
+
+    # Cada request corre en su propio contexto
+    assert contextvars.copy_context().run(request) == "judge;dur=15.0, cosmos_batch;dur=2.0"
+    assert contextvars.copy_context().run(telemetry.server_timing_header) is None
+
+
+def test_endpoint_metrics_con_token(monkeypatch):
+    monkeypatch.setattr(main_routes, "METRICS_ENABLED", True)
+    monkeypatch.setattr(main_routes, "METRICS_TOKEN", "secreto")
+    app = Quart(__name__)
+    app.register_blueprint(main_routes.main_bp)
+
+    async def escenario():
+        async with app.test_app() as test_app:
+            client = test_app.test_client()
+            sin_token = await client.get("/metrics")
+            con_token = await client.get("/metrics", headers={"Authorization": "Bearer secreto"})
+            return sin_token.status_code, con_token.status_code, con_token.content_type, await con_token.get_data()
+
+    sin_token, status, content_type, body = asyncio.run(escenario())
+
+    assert sin_token == 401 and status == 200
+    assert content_type.startswith("text/plain; version=0.0.4")
+    assert b"# TYPE civicknit_stage_seconds histogram" in body
+
+
+def test_operacion_de_cosmos_por_request():
+    def req(method, **headers):
+        return NS(method=method, headers=headers)
+
+    assert _cosmos_operation(req("POST", **{"x-ms-documentdb-isquery": "True"})) == "query"
+    assert _cosmos_operation(req("POST", **{"x-ms-cosmos-is-batch-request": "True"})) == "batch"
+    assert _cosmos_operation(req("POST", **{"x-ms-documentdb-is-upsert": "True"})) == "upsert"
+    assert _cosmos_operation(req("PATCH")) == "patch"
+    assert _cosmos_operation(req("HEAD")) == "head"
@@ -0,0 +1,50 @@
+import json
+import os
+
+import numpy as np
+
+from backend.chat.vector_index import LocalVectorIndex
+
+
+def _version(directory, name, vectors, textos):
+    path = directory / name
+    path.mkdir()
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors.tofile(path / "vectors.f32")
+    offsets = [0]
+    with open(path / "meta.jsonl", "wb") as f:
+        for i, texto in enumerate(textos):
+            line = (json.dumps({"id": f"{name}-{i}", "content": texto}) + "\n").encode("utf-8")
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.asarray(offsets, dtype=np.int64).tofile(path / "meta.idx")
+    (path / "manifest.json").write_text(json.dumps({"count": len(textos), "dim": vectors.shape[1]}))
+    (directory / "CURRENT").write_text(name)
+
+
+def test_busqueda_exacta_con_metadata(tmp_path):
+    _version(tmp_path, "v1", [[1, 0], [0, 1], [1, 1]], ["licencias", "becas", "ambos"])
+    index = LocalVectorIndex(str(tmp_path), reload_interval=0)
+
+    docs = index.buscar_documentos([1, 0.1], limit=2, threshold=0.5)
+    assert [d["content"] for d in docs] == ["licencias", "ambos"]
+    assert docs[0]["similarity"] > docs[1]["similarity"]
+
+
+def test_cambio_de_version_cierra_la_anterior(tmp_path):
+    _version(tmp_path, "v1", [[1, 0]], ["viejo"])
+    index = LocalVectorIndex(str(tmp_path), reload_interval=0, retire_grace=0)
+    assert index.available
+    vieja = index._version
+    fd = vieja._meta_file.fileno()
+
+    _version(tmp_path, "v2", [[1, 0]], ["nuevo"])
+    assert index.buscar_documentos([1, 0], threshold=0)[0]["content"] == "nuevo"
+    assert index.stats()["retired_open"] == 1
+
+    # En la siguiente revisión (pasado el margen) se cierra
+    index.search([[1, 0]])
+    assert index.stats()["retired_open"] == 0
+    assert vieja._meta_file is None and vieja.vectors is None
+    assert not os.path.exists(f"/proc/self/fd/{fd}") or os.readlink(f"/proc/self/fd/{fd}").find("v1") < 0
@@ -0,0 +1,83 @@
+import asyncio
+import importlib
+from types import SimpleNamespace as NS
+
+import pytest
+
+from backend.chat import office_agent as oa
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class FakeConn:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.sql = []
+
+    async def execute(self, sql, *args):
+        self.sql.append(sql)
+
+    async def fetch(self, sql, *args):
+        self.sql.append((sql, args))
+        return self.rows
+
+
+@pytest.fixture
+def vector_index(monkeypatch):
+    """ infra/script/rag/vector-index.py (lee la conexión de variables de entorno al importarse). """
+    for nombre in ("AZURE_DB_HOST_PSQL", "AZURE_DB_USER_PSQL", "AZURE_DB_PASSWORD", "AZURE_DB_NAME_PSQL"):
+        monkeypatch.setenv(nombre, "pruebas")
+    return importlib.import_module("vector-index")
+
+
+def test_busqueda_ordena_por_distancia_y_aplica_el_umbral_despues(monkeypatch):
+    monkeypatch.setattr(oa, "local_index", NS(available=False))
+    agent = oa.OfficeAgent()
+    agent.pool = FakeConn(rows=[{"id": "d1", "content": "texto", "metadata": None, "similarity": 0.8}])
+
+    async def embedding(texto):
+        return [0.5, 0.25]
+
+    monkeypatch.setattr(agent, "_generar_embedding", embedding)
+
+    documentos = run(agent._buscar_documentos_relevantes("consulta", limit=3, threshold=0.7))
+
+    sql, args = agent.pool.sql[0]
+    consulta = " ".join(sql.split())
+    # La forma que usa el índice HNSW/IVFFlat: ORDER BY distancia LIMIT k sin WHERE en el subquery
+    assert "FROM documents ORDER BY distance LIMIT $3" in consulta
+    assert "WHERE distance < 1 - $2::float8" in consulta
+    assert args == ("[0.5,0.25]", 0.7, 3)
+    assert documentos == [{"id": "d1", "content": "texto", "metadata": {}, "similarity": 0.8}]
+
+
+def test_migracion_hnsw(vector_index):
+    conn = FakeConn()
+    args = NS(method="hnsw", m=16, ef_construction=64, lists=100, table="documents", replace=True,
+              concurrently=True, maintenance_work_mem="1GB", parallel_workers=2)
+
+    run(vector_index.migrate(conn, args))
+
+    assert "DROP INDEX CONCURRENTLY IF EXISTS documents_embedding_hnsw_idx" in conn.sql
+    assert ("CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_embedding_hnsw_idx ON documents "
+            "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)") in conn.sql
+    assert conn.sql[-1] == "ANALYZE documents"
+
+
+def test_migracion_ivfflat_sin_concurrently(vector_index):
+    conn = FakeConn()
+    args = NS(method="ivfflat", m=16, ef_construction=64, lists=250, table="documents", replace=False,
+              concurrently=False, maintenance_work_mem="512MB", parallel_workers=0)
+
+    run(vector_index.migrate(conn, args))
+
+    assert not any(sql.startswith("DROP INDEX") for sql in conn.sql)
+    assert ("CREATE INDEX IF NOT EXISTS documents_embedding_ivfflat_idx ON documents "
+            "USING ivfflat (embedding vector_cosine_ops) WITH (lists = 250)") in conn.sql
+
+
+def test_percentil(vector_index):
+    assert vector_index.percentile([5, 1, 3, 2, 4], 0.5) == 3
+    assert vector_index.percentile([5, 1, 3, 2, 4], 0.95) == 5
@@ -0,0 +1,39 @@
+import time
+
+from backend.chat import verdict_cache as vc
+
+
+def test_texto_normalizado_comparte_veredicto():
+    cache = vc.VerdictCache(ttl=60)
+    cache.set("¿Cómo  SACO mi licencia?", {"flagged": False, "severity": 0})
+
+    assert cache.get("¿como saco mi licencia?") == {"flagged": False, "severity": 0}
+    assert cache.get("otra pregunta") is None
+    assert cache.hits == 1 and cache.misses == 1
+
+
+def test_lru_descarta_el_menos_usado():
+    cache = vc.VerdictCache(max_size=2, ttl=60)
+    cache.set("a", {"flagged": False, "severity": 0})
+    cache.set("b", {"flagged": False, "severity": 0})
+    cache.get("a")
+    cache.set("c", {"flagged": True, "severity": 4})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_veredicto_de_disco_conserva_su_vencimiento(tmp_path, monkeypatch):
+    db = str(tmp_path / "verdicts.db")
+    reloj = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: reloj[0])
+
+    vc.VerdictCache(ttl=100, db_path=db).set("hola", {"flagged": False, "severity": 0})
+
+    # Otro proceso lo lee de disco cerca del vencimiento
+    cache = vc.VerdictCache(ttl=100, db_path=db)
+    reloj[0] = 1090.0
+    assert cache.get("hola") is not None and cache.disk_hits == 1
+
+    reloj[0] = 1101.0
+    assert cache.get("hola") is None
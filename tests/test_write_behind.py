@@ -0,0 +1,149 @@
+import asyncio
+
+from backend.database import write_behind as wb
+from tests.fake_cosmos import FakeContainer
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class FlakyContainer(FakeContainer):
+    """ Falla los primeros `failures` batches. """
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    async def execute_item_batch(self, batch_operations, partition_key):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Cosmos no responde")
+        await super().execute_item_batch(batch_operations, partition_key)
+
+
+def queue_with(monkeypatch, container, gate=None, **kwargs):
+    async def get_container():
+        if gate is not None:
+            await gate.wait()
+        return container
+    monkeypatch.setattr(wb, "get_container", get_container)
+    monkeypatch.setattr(asyncio, "sleep", _no_sleep)
+    return wb.WriteBehindQueue(**kwargs)
+
+
+_sleep = asyncio.sleep
+
+
+async def _no_sleep(delay, *args):
+    await _sleep(0)
+
+
+def test_reintenta_hasta_escribir_sin_duplicar(monkeypatch):
+    container = FlakyContainer(failures=2)
+    queue = queue_with(monkeypatch, container)
+
+    async def escenario():
+        queue.start()
+        assert await queue.enqueue("u1", "c1", "pregunta", "respuesta")
+        await queue.stop()
+
+    run(escenario())
+    assert queue.retries == 2 and queue.written == 1 and queue.failed == 0
+    assert container.docs["c1"]["messageCount"] == 2
+    assert queue.pending_turns("u1", "c1") == []
+
+
+def test_discard_descarta_los_turnos_encolados(monkeypatch):
+    container = FakeContainer()
+
+    async def escenario():
+        # El worker toma el batch pero no llega a Cosmos hasta después del descarte
+        gate = asyncio.Event()
+        queue = queue_with(monkeypatch, container, gate, flush_timeout=0.05)
+        queue.start()
+        await queue.enqueue("u1", "c1", "uno", "1")
+        await queue.enqueue("u1", "c2", "dos", "2")
+        await queue.enqueue("u2", "c3", "tres", "3")
+        await queue.discard("u1", "c1")
+        assert queue.pending_turns("u1", "c1") == []
+        assert queue.pending_turns("u1", "c2")
+        gate.set()
+        await queue.stop()
+        return queue
+
+    queue = run(escenario())
+    assert "c1" not in container.docs
+    assert {"c2", "c3"} <= set(container.docs)
+    assert queue.dropped == 1
+
+
+def test_discard_de_la_cuenta_corta_los_reintentos(monkeypatch):
+    container = FlakyContainer(failures=1000)
+    queue = queue_with(monkeypatch, container, max_retries=1000)
+
+    async def escenario():
+        queue.start()
+        await queue.enqueue("u1", "c1", "pregunta", "respuesta")
+        while not queue.retries:
+            await _sleep(0)
+        await queue.discard("u1")
+        await queue.stop()
+
+    run(escenario())
+    assert queue.failed == 0 and queue.written == 0
+    assert not container.docs
+
+
+def test_turno_posterior_al_borrado_se_escribe(monkeypatch):
+    container = FakeContainer()
+    queue = queue_with(monkeypatch, container)
+
+    async def escenario():
+        queue.start()
+        await queue.discard("u1")
+        await queue.enqueue("u1", "c1", "nuevo chat", "ok")
+        await queue.stop()
+
+    run(escenario())
+    assert container.docs["c1"]["messageCount"] == 2
+
+
+def test_turnos_del_mismo_chat_van_juntos_y_en_orden(monkeypatch):
+    container = FakeContainer()
+
+    async def escenario():
+        gate = asyncio.Event()
+        queue = queue_with(monkeypatch, container, gate)
+        queue.start()
+        for i in range(5):
+            await queue.enqueue("u1", "c1", f"p{i}", f"r{i}")
+        # Mientras no se escriben, el historial del chat los sigue viendo
+        assert [t[0] for t in queue.pending_turns("u1", "c1")] == [f"p{i}" for i in range(5)]
+        gate.set()
+        await queue.stop()
+        return queue
+
+    queue = run(escenario())
+    # El worker tomó el primero en cuanto llegó (patch 404 y create de la cabecera);
+    # los otros cuatro se juntaron mientras tanto y van en un solo batch
+    assert container.batches == 3 and queue.written == 5
+    mensajes = sorted(container.of_type("chat_message"), key=lambda m: m["sortKey"])
+    assert [m["text"] for m in mensajes][::2] == [f"p{i}" for i in range(5)]
+
+
+def test_cola_llena_pide_escribir_en_linea(monkeypatch):
+    async def escenario():
+        gate = asyncio.Event()
+        queue = queue_with(monkeypatch, FakeContainer(), gate, max_size=1, put_timeout=0.01)
+        assert not await queue.enqueue("u1", "c1", "sin worker", "x")
+        queue.start()
+        encolados = [await queue.enqueue("u1", "c1", f"p{i}", "r") for i in range(3)]
+        gate.set()
+        await queue.stop()
+        return queue, encolados
+
+    queue, encolados = run(escenario())
+    # El worker tomó el primero, el segundo ocupa el único lugar y el tercero no entra
+    assert encolados == [True, True, False]
+    assert queue.inline_writes == 1 and queue.written == 2